@@ -1,11 +1,41 @@
 import os
+import copy
 import json
+import time
 import uuid
-from datetime import datetime, timezone
+import threading
+from datetime import timedelta
 from pathlib import Path
 
+import numpy as np
 import streamlit as st
 
+import scoring
+from scoring import COLS
+from knowledge_index import build_index
+from question_bank import build_bank, BankError
+from prompting import PrefixGuard, add_usage
+from prefetch import Prefetcher
+from session_store import SessionStore
+from session_journal import SessionJournal
+from openai_pool import make_openai_client
+from response_cache import ResponseCache
+from scheduler import Scheduler, SchedulerBusy
+from resilience import ResilientCaller, ModelUnavailable, InvalidAnswer
+import metrics
+from metrics import METRICS, span, observe
+from history import compact
+import budget
+import analytics
+import session_codec
+from interview import (
+    utcnow_iso, new_state, snapshot, current_step, make_deps,
+    call_ai_next_question, stream_ai_next_question, call_ai_master_report,
+    use_bank, can_fallback, bank_question, apply_analysis_update, record_answer, confident_enough, build_final_payload,
+)
+
+RUN_T0 = time.perf_counter()  # начало rerun: модули уже импортированы, кроме первого запуска
+
 # =========================
 # PAGE CONFIG (FIRST!)
 # =========================
@@ -18,20 +48,39 @@ st.set_page_config(
 # =========================
 # CONFIG LOAD
 # =========================
-def load_config():
-    cfg_path = Path("config.json")
-    if not cfg_path.exists():
-        return {}
-    return json.loads(cfg_path.read_text(encoding="utf-8"))
+CONFIG_PATH = Path("config.json")
 
-CFG = load_config()
+def file_mtime(path: Path) -> float:
+    # ключ кэша: правка файла на диске — новый ключ, объект собирается заново
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_config(mtime: float):
+    # один разбор на процесс и версию файла; rerun берёт готовый dict (не менять!)
+    with span("config.load"):
+        if not CONFIG_PATH.exists():
+            return {}
+        return json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
+
+CFG = load_config(file_mtime(CONFIG_PATH))
+
+def cfg_key(*sections) -> str:
+    # ключ cache_resource: правка этих секций config.json — новый объект на следующем
+    # rerun, без рестарта (старый вытесняется, max_entries=1)
+    return json.dumps([CFG.get(s) for s in sections], sort_keys=True, ensure_ascii=False)
 APP_TITLE = CFG.get("app", {}).get("title", "💠 NEO — Диагностика по позициям (AI-only)")
 APP_VERSION = CFG.get("app", {}).get("version", "positions-ai-1.0")
 
-DATA_DIR = Path(CFG.get("storage", {}).get("data_dir", "data/sessions"))
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+DATA_DIR = Path(CFG.get("storage", {}).get("data_dir", "data/sessions"))  # создаёт SessionStore
+JOURNAL_DIR = Path(CFG.get("storage", {}).get("journal_dir", str(DATA_DIR / "journal")))
+EXPORT_DIR = Path(CFG.get("storage", {}).get("export_dir", "data/exports"))
+SESSION_ENCODING = CFG.get("storage", {}).get("encoding", "compact")  # "compact" (.neo) | "json"
 
 DEFAULT_MODEL = CFG.get("openai", {}).get("model", "gpt-4.1-mini")
+STREAM_QUESTIONS = bool(CFG.get("openai", {}).get("stream", True))
 
 MASTER_PASSWORD_ENV = CFG.get("master", {}).get("password_env", "MASTER_PASSWORD")
 MASTER_PASSWORD = st.secrets.get("MASTER_PASSWORD", os.getenv(MASTER_PASSWORD_ENV, ""))
@@ -41,31 +90,234 @@ OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", ""
 MAX_Q_TOTAL = int(CFG.get("flow", {}).get("max_questions_total", 24))
 MAX_FOLLOWUPS_PER_STEP = int(CFG.get("flow", {}).get("max_followups_per_step", 1))
 CONF_STOP = float(CFG.get("flow", {}).get("confidence_stop", 0.78))
+PREFETCH_ENABLED = bool(CFG.get("flow", {}).get("prefetch", True))
+PREFETCH_MAX_CANDIDATES = int(CFG.get("flow", {}).get("prefetch_max_candidates", 4))
+PREFETCH_WORKERS = int(CFG.get("flow", {}).get("prefetch_workers", 8))
+# сколько UI ждёт недоделанного кандидата, прежде чем идти обычным путём (стрим/вызов)
+PREFETCH_WAIT_SEC = float(CFG.get("flow", {}).get("prefetch_wait_sec", 1.0))
+# пропуск дожимающих шагов / уточнения по разрыву баллов (adaptive.py); None — все шаги подряд
+ADAPTIVE_CFG = CFG.get("flow", {}).get("adaptive", {})
+ADAPTIVE = ADAPTIVE_CFG if ADAPTIVE_CFG.get("enabled", True) else None
+
+KNOWLEDGE_PATH = Path(CFG.get("knowledge", {}).get("path", "knowledge/positions.md"))
+KNOWLEDGE_INDEX_CACHE = Path(CFG.get("knowledge", {}).get("index_cache", "data/knowledge_index.json"))
+KNOWLEDGE_BUDGET_TOKENS = int(CFG.get("knowledge", {}).get("budget_tokens", 3500))
+KNOWLEDGE_TOP_K = int(CFG.get("knowledge", {}).get("top_k", 8))
+
+CACHE_CFG = CFG.get("cache", {})
+CACHE_ENABLED = bool(CACHE_CFG.get("enabled", True))
+
+SCHED_CFG = CFG.get("scheduler", {})
+SCHED_ENABLED = bool(SCHED_CFG.get("enabled", True))
+
+RESILIENCE_CFG = CFG.get("resilience", {})
+RESILIENCE_ENABLED = bool(RESILIENCE_CFG.get("enabled", True))
+
+BANK_CFG = CFG.get("question_bank", {})
+BANK_ENABLED = bool(BANK_CFG.get("enabled", True))
+BANK_PATH = Path(BANK_CFG.get("path", "data/question_bank.json"))
+
+# хвост истории в промпте + дайджест старших ответов (history.py)
+HISTORY_CFG = CFG.get("history", {})
+
+# лимиты размера промпта на вызов модели (budget.py); None — без ограничения
+BUDGET = budget.configure(CFG.get("budget"))
+
+# фоновая очередь мастер-отчётов (report_jobs.py)
+REPORTS_CFG = CFG.get("reports", {})
+
+METRICS_CFG = CFG.get("metrics", {})
+METRICS_ENABLED = bool(METRICS_CFG.get("enabled", True))
+METRICS.configure(METRICS_CFG.get("pricing"))
 
 # =========================
 # KNOWLEDGE LOAD
 # =========================
-def load_positions_knowledge() -> str:
-    p = Path("knowledge/positions.md")
-    if not p.exists():
-        return ""
-    txt = p.read_text(encoding="utf-8")
-    # лёгкий safety-trim (чтобы не улетать в огромные токены)
-    return txt[:22000]
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _knowledge_index(mtime: float):
+    # один раз на процесс и версию базы: секции по столбцам/камням + BM25
+    with span("knowledge.load"):
+        return build_index(KNOWLEDGE_PATH, KNOWLEDGE_INDEX_CACHE)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _question_bank(mtime: float):
+    with span("bank.load"):
+        try:
+            return build_bank(KNOWLEDGE_PATH, BANK_PATH)
+        except BankError:
+            # в базе оборванные фразы — варианты не показываем, вопросы задаёт модель
+            return None
+
+def load_knowledge_index():
+    # правка knowledge/positions.md подхватывается без рестарта (по mtime)
+    return _knowledge_index(file_mtime(KNOWLEDGE_PATH))
+
+def load_question_bank():
+    # офлайн-банк вопросов из той же базы; None — банк выключен или базы нет
+    if not BANK_ENABLED:
+        return None
+    return _question_bank(file_mtime(KNOWLEDGE_PATH))
 
-POSITIONS_KNOWLEDGE = load_positions_knowledge()
+# =========================
+# METRICS EXPORT
+# =========================
+@st.cache_resource
+def start_metrics_export():
+    # один раз на процесс: GET /metrics (Prometheus) и/или периодический JSONL-дамп;
+    # port/host/dump_* не перечитываются — порт и поток дампа живут до рестарта
+    if not METRICS_ENABLED:
+        return None
+    out = {}
+    port = int(METRICS_CFG.get("port", 0) or 0)
+    if port:
+        try:
+            out["http"] = metrics.serve(METRICS, METRICS_CFG.get("host", "127.0.0.1"), port)
+        except OSError:
+            out["http"] = None  # порт занят другой репликой — остаётся дамп
+    if METRICS_CFG.get("dump_path"):
+        out["dump"] = metrics.start_dumper(METRICS, Path(METRICS_CFG["dump_path"]),
+                                           float(METRICS_CFG.get("dump_interval_sec", 60)),
+                                           int(float(METRICS_CFG.get("dump_max_mb", 32)) * 2**20),
+                                           int(METRICS_CFG.get("dump_backups", 3)))
+    return out
 
 # =========================
 # OPENAI
 # =========================
+@st.cache_resource(max_entries=1)
+def openai_pool(api_key: str, key: str):
+    # один клиент (и один httpx-пул) на процесс, ключ API и настройки пула (openai_key);
+    # с resilience повторы делает он, а не SDK
+    http_cfg = dict(CFG.get("openai", {}).get("http") or {})
+    if RESILIENCE_ENABLED:
+        http_cfg["max_retries"] = 0
+    return make_openai_client(
+        api_key,
+        http_cfg,
+        CFG.get("openai", {}).get("base_url"),
+    )
+
+def openai_key() -> str:
+    ocfg = CFG.get("openai", {})
+    return json.dumps([ocfg.get("http"), ocfg.get("base_url"), RESILIENCE_ENABLED], sort_keys=True)
+
 def get_openai_client():
     if not OPENAI_API_KEY:
         return None
-    try:
-        from openai import OpenAI
-        return OpenAI(api_key=OPENAI_API_KEY)
-    except Exception:
+    return openai_pool(OPENAI_API_KEY, openai_key())[0]
+
+def openai_pool_stats() -> dict:
+    if not OPENAI_API_KEY:
+        return {}
+    _, http_client, stats = openai_pool(OPENAI_API_KEY, openai_key())
+    return stats.snapshot(http_client)
+
+@st.cache_resource(max_entries=1)
+def _prefix_guard(key: str):
+    # закреплённые отпечатки префиксов можно задать в config.json → openai.prefix_fingerprints
+    return PrefixGuard(CFG.get("openai", {}).get("prefix_fingerprints"))
+
+def get_prefix_guard():
+    return _prefix_guard(json.dumps(CFG.get("openai", {}).get("prefix_fingerprints"), sort_keys=True))
+
+@st.cache_resource(max_entries=1)
+def _response_cache(key: str):
+    # ответы модели по хэшу промпта: общий на процесс (и на воркеры — через диск)
+    if not CACHE_ENABLED:
         return None
+    return ResponseCache(
+        max_items=int(CACHE_CFG.get("max_items", 2048)),
+        ttl_sec=float(CACHE_CFG.get("ttl_sec", 86400)),
+        disk_dir=CACHE_CFG.get("disk_dir") or None,
+        disk_max_bytes=int(float(CACHE_CFG.get("disk_max_mb", 256)) * 2**20),
+        disk_max_files=int(CACHE_CFG.get("disk_max_files", 50000)),
+    )
+
+def get_response_cache():
+    return _response_cache(cfg_key("cache"))
+
+@st.cache_resource(max_entries=1)
+def _scheduler(key: str):
+    # одна очередь вызовов модели на процесс: лимиты, приоритеты, справедливость
+    if not SCHED_ENABLED:
+        return None
+    return Scheduler(
+        max_concurrency=int(SCHED_CFG.get("max_concurrency", 16)),
+        rpm=float(SCHED_CFG.get("requests_per_minute", 0)),
+        tpm=float(SCHED_CFG.get("tokens_per_minute", 0)),
+        max_wait=SCHED_CFG.get("max_wait_sec"),
+        max_queue=int(SCHED_CFG.get("max_queue", 200)),
+    )
+
+def get_scheduler():
+    return _scheduler(cfg_key("scheduler"))
+
+@st.cache_resource(max_entries=1)
+def _resilience(key: str):
+    # бюджет шага, повторы, хедж, breaker — общие на процесс
+    if not RESILIENCE_ENABLED:
+        return None
+    return ResilientCaller({k: v for k, v in RESILIENCE_CFG.items() if k != "enabled"})
+
+def get_resilience():
+    return _resilience(cfg_key("resilience"))
+
+def prefetch_unused(key, res):
+    # из потока префетча: брошенный кандидат всё равно стоил токенов
+    usage = (res[1] if isinstance(res, tuple) else {}).get("usage") or {}
+    METRICS.inc("prefetch.unused", 1, kind="prefetch")
+    for k in ("input_tokens", "output_tokens"):
+        if usage.get(k):
+            METRICS.inc(f"prefetch.unused_{k}", usage[k], kind="prefetch")
+    if usage.get("cost_usd"):
+        METRICS.inc("prefetch.unused_cost_usd", usage["cost_usd"], kind="prefetch")
+
+@st.cache_resource(max_entries=1)
+def _prefetcher(workers: int):
+    return Prefetcher(max_workers=workers, on_unused=prefetch_unused)
+
+def get_prefetcher():
+    return _prefetcher(PREFETCH_WORKERS)
+
+# =========================
+# WARMUP
+# =========================
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    # один раз на процесс, в фоне: первая страница рисуется сразу, а импорт
+    # openai/httpx, пул соединений, база, банк и индекс сессий готовятся
+    # к первому вопросу. Повторный вызов из скрипта просто подождёт свой ресурс
+    state = {"done": False, "client": False, "sec": None, "error": ""}
+
+    def run():
+        t0 = time.perf_counter()
+        try:
+            with span("warmup"):
+                get_openai_client()
+                state["client"] = True
+                load_knowledge_index()
+                load_question_bank()
+                get_session_store()
+                get_journal()
+        except Exception as e:
+            state["error"] = f"{type(e).__name__}: {e}"[:200]
+        state["sec"] = round(time.perf_counter() - t0, 3)
+        state["done"] = True
+
+    threading.Thread(target=run, daemon=True, name="neo-warmup").start()
+    return state
+
+@st.cache_resource(show_spinner=False)
+def startup_timing():
+    return {"first_paint_sec": None}
+
+def rerun_done():
+    # длительность каждого rerun; первый rerun процесса — время до первой отрисовки
+    observe("app.rerun", time.perf_counter() - RUN_T0)
+    boot = startup_timing()
+    if boot["first_paint_sec"] is None:
+        boot["first_paint_sec"] = round(time.time() - METRICS.started, 3)
+        observe("app.first_paint", boot["first_paint_sec"])
 
 def safe_model_name(model: str) -> str:
     m = (model or "").strip()
@@ -79,255 +331,311 @@ def safe_model_name(model: str) -> str:
 # =========================
 # STORAGE
 # =========================
-def utcnow_iso():
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+@st.cache_resource(max_entries=1)
+def _session_store(key: str):
+    # индекс сверяется с каталогом один раз на процесс, дальше обновляется при save
+    store = SessionStore(DATA_DIR, encoding=SESSION_ENCODING)
+    store.sync()
+    return store
+
+def get_session_store():
+    return _session_store(cfg_key("storage"))
+
+@st.cache_resource(max_entries=1)
+def _analytics(key: str, _store):
+    # столбцы сводки по всем сессиям в памяти процесса; refresh дочитывает новое
+    return analytics.Analytics(_store)
+
+def get_analytics():
+    return _analytics(cfg_key("storage"), get_session_store())
 
-def session_path(session_id: str) -> Path:
-    return DATA_DIR / f"{session_id}.json"
+@st.cache_resource(max_entries=1)
+def _journal(journal_dir: str):
+    return SessionJournal(Path(journal_dir))
+
+def get_journal():
+    return _journal(str(JOURNAL_DIR))
 
 def save_session(payload: dict):
-    session_path(payload["meta"]["session_id"]).write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2),
-        encoding="utf-8"
+    with span("session.save"):
+        get_session_store().save(payload)
+
+def journal_start():
+    # запись "start" (клиент, модель): с первым показанным вопросом — ссылка с ?sid=
+    # работает ещё до первого ответа; поменялись поля анкеты — ещё одна "start",
+    # при восстановлении побеждает последняя
+    ss = st.session_state
+    sid = ss["session_id"]
+    j = get_journal()
+    sig = intake_signature()
+    if ss.get("journal_started") and ss.get("journal_client") == sig:
+        return j
+    if not ss.get("journal_started"):
+        j.discard(sid)  # повторный старт в той же вкладке начинает журнал заново
+    j.append(sid, {
+        "type": "start",
+        "session_id": sid,
+        "client": {
+            "name": ss.get("client_name",""),
+            "contact": ss.get("client_contact",""),
+            "request": ss.get("client_request",""),
+        },
+        "model": ss.get("model_used", DEFAULT_MODEL),
+        "app_version": APP_VERSION,
+        "ts": utcnow_iso(),
+    })
+    ss["journal_started"] = True
+    ss["journal_client"] = sig
+    return j
+
+def journal_step(q: dict, update: dict, step_index: int):
+    # дописывает в журнал последний ответ
+    ss = st.session_state
+    j = journal_start()
+    last = ss["answers"][-1]
+    with span("journal.append"):
+        j.append(ss["session_id"], {
+            "type": "step",
+            "step_index": step_index,
+            **last,
+            "analysis_update": update if isinstance(update, dict) else {},
+            # решение адаптивного плана: куда идти дальше после этого ответа
+            "next_step_index": ss["step_index"],
+            "skipped": ss.get("skipped", []),
+            "extra_steps": ss.get("extra_steps", []),
+        })
+
+def journal_question(q: dict, info: dict):
+    # показанный вопрос тоже в журнал: после реконнекта он восстановится как есть
+    ss = st.session_state
+    journal_start().append(ss["session_id"], {
+        "type": "question",
+        "step_index": ss["step_index"],
+        "q": q,
+        "usage": info.get("usage") or {},
+        "call": ss["calls"][-1] if ss.get("calls") else None,
+        "ts": utcnow_iso(),
+    })
+
+def call_record(step_id: str, info: dict) -> dict:
+    # один показанный вопрос: откуда он, этапы вызова (мс), токены и стоимость;
+    # prompt_tokens / trimmed — оценка размера промпта и что из него вырезано (budget.py)
+    source = info.get("source") or ("cache" if info.get("cached") else "model")
+    rec = {"step_id": step_id, "source": source, **(info.get("timing") or {}), **(info.get("usage") or {})}
+    if info.get("budget"):
+        rec["prompt_tokens"] = info["budget"]["total"]
+        if info["budget"]["trimmed"]:
+            rec["trimmed"] = info["budget"]["trimmed"]
+    return rec
+
+@st.cache_resource(max_entries=1)
+def _report_queue(key: str):
+    # одна очередь на процесс (и каталог сессий); задания, оставшиеся от прошлого процесса, продолжаются
+    from report_jobs import ReportQueue
+    queue = ReportQueue(
+        get_session_store(),
+        generate_report,
+        workers=int(REPORTS_CFG.get("workers", 2)),
+        max_attempts=int(REPORTS_CFG.get("max_attempts", 2)),
+        stale_sec=float(REPORTS_CFG.get("stale_sec", 600)),
     )
+    queue.kick()
+    return queue
+
+def apply_reports_cfg(queue):
+    # у воркеров нет своего состояния: настройки reports применяются к живой очереди
+    queue.workers = max(int(REPORTS_CFG.get("workers", 2)), 1)
+    queue.max_attempts = max(int(REPORTS_CFG.get("max_attempts", 2)), 1)
+    queue.stale_sec = float(REPORTS_CFG.get("stale_sec", 600))
+
+def get_report_queue():
+    queue = _report_queue(cfg_key("storage"))
+    apply_reports_cfg(queue)
+    return queue
+
+def generate_report(payload: dict, model: str, force: bool = False):
+    # вызывается из воркера очереди: всё процессное — из cache_resource;
+    # force (перегенерация готового отчёта) — мимо кэша ответов
+    client = get_openai_client()
+    if not client:
+        raise ModelUnavailable("нет OPENAI_API_KEY")
+    return call_ai_master_report(
+        client, safe_model_name(model), payload, get_prefix_guard(), get_response_cache(), get_scheduler(),
+        get_resilience(), HISTORY_CFG, BUDGET, force,
+    )
+
+def finalize_session():
+    # итоговый payload пишется один раз за интервью, а не на каждом rerun
+    ss = st.session_state
+    if ss.get("final_payload") is None:
+        sid = ss["session_id"]
+        # журнал удаляется только после записи payload: упадёт запись — журнал останется
+        ss["final_payload"] = get_journal().compact(sid, save_session, build_payload_final)
+    return ss["final_payload"]
 
 def load_session(session_id: str):
-    p = session_path(session_id)
-    if not p.exists():
-        return None
-    return json.loads(p.read_text(encoding="utf-8"))
+    return get_session_store().load(session_id)
 
-def list_sessions():
-    items = []
-    for p in sorted(DATA_DIR.glob("*.json"), key=lambda x: x.stat().st_mtime, reverse=True):
-        try:
-            items.append(json.loads(p.read_text(encoding="utf-8")))
-        except Exception:
-            continue
-    return items
+@st.cache_data(max_entries=16, show_spinner=False)
+def session_json(session_id: str, mtime: float) -> bytes:
+    # JSON для скачивания — один раз на версию файла, а не на каждый rerun
+    return session_codec.dumps(load_session(session_id), "json")
 
-# =========================
-# STATE MACHINE (AI-ONLY)
-# =========================
-POTS = ["Сапфир","Гелиодор","Аметист","Изумруд","Гранат","Рубин","Янтарь","Шунгит","Цитрин"]
-
-STEPS = [
-    # позиция 1: 2 вопроса сфера + 2 вопроса уточнение потенциала
-    {"id":"p1_scope_1","title":"Позиция 1 — сфера (1/2)","goal":"определить сферу/тип восприятия позиции 1"},
-    {"id":"p1_scope_2","title":"Позиция 1 — сфера (2/2)","goal":"дожать сферу позиции 1"},
-    {"id":"p1_pot_1","title":"Позиция 1 — потенциал (1/2)","goal":"сузить до конкретного потенциала позиции 1"},
-    {"id":"p1_pot_2","title":"Позиция 1 — потенциал (2/2)","goal":"зафиксировать потенциал позиции 1"},
-
-    # позиция 2
-    {"id":"p2_scope_1","title":"Позиция 2 — сфера (1/2)","goal":"определить сферу позиции 2"},
-    {"id":"p2_scope_2","title":"Позиция 2 — сфера (2/2)","goal":"дожать сферу позиции 2"},
-    {"id":"p2_pot_1","title":"Позиция 2 — потенциал (1/2)","goal":"сузить до конкретного потенциала позиции 2"},
-    {"id":"p2_pot_2","title":"Позиция 2 — потенциал (2/2)","goal":"зафиксировать потенциал позиции 2"},
-
-    # позиция 3
-    {"id":"p3_scope_1","title":"Позиция 3 — сфера (1/2)","goal":"определить сферу позиции 3"},
-    {"id":"p3_scope_2","title":"Позиция 3 — сфера (2/2)","goal":"дожать сферу позиции 3"},
-    {"id":"p3_pot_1","title":"Позиция 3 — потенциал (1/2)","goal":"сузить до конкретного потенциала позиции 3"},
-    {"id":"p3_pot_2","title":"Позиция 3 — потенциал (2/2)","goal":"зафиксировать потенциал позиции 3"},
-]
+def query_sessions(**filters):
+    # страница метаданных из индекса (без чтения файлов сессий) + общее число
+    return get_session_store().query(**filters)
 
 # =========================
 # SESSION STATE
 # =========================
 def init_state():
-    st.session_state.setdefault("session_id", str(uuid.uuid4()))
-    st.session_state.setdefault("client_name", "")
-    st.session_state.setdefault("client_contact", "")
-    st.session_state.setdefault("client_request", "")
-
-    st.session_state.setdefault("step_index", 0)
-    st.session_state.setdefault("q_count", 0)
+    # новая websocket-сессия (реконнект, другой под/реплика) — пробуем
+    # поднять интервью из хранилища по ?sid=...
+    if "session_id" not in st.session_state:
+        sid = st.query_params.get("sid")
+        if sid:
+            restore_session(sid)
 
-    # диалог: список {role, content}
-    st.session_state.setdefault("messages", [])
-    # ответы: список {step_id, question, answer}
-    st.session_state.setdefault("answers", [])
+    # состояние интервью (клиент, шаги, ответы, скоринг) — см. interview.new_state
+    for k, v in new_state().items():
+        st.session_state.setdefault(k, v)
 
     # текущий вопрос (AI)
     st.session_state.setdefault("current_q", None)  # dict
     st.session_state.setdefault("current_answer", "")  # text
 
-    # результаты
-    st.session_state.setdefault("positions", {"p1":None,"p2":None,"p3":None})
-    st.session_state.setdefault("confidence", {"p1":0.0,"p2":0.0,"p3":0.0})
-    st.session_state.setdefault("scores", {p:0.0 for p in POTS})
-    st.session_state.setdefault("col_scores", {
-        "perception": {p:0.0 for p in POTS},
-        "motivation": {p:0.0 for p in POTS},
-        "tool": {p:0.0 for p in POTS},
-        "result": {p:0.0 for p in POTS},
-    })
-
     st.session_state.setdefault("done", False)
 
+    # журнал/сохранение: итоговый payload пишется один раз
+    st.session_state.setdefault("journal_started", False)
+    st.session_state.setdefault("final_payload", None)
+
+    # токены: input/cached/uncached/output (и cost_usd) по всем вызовам сессии
+    st.session_state.setdefault("usage", {})
+    # по вопросу: источник, очередь/первый байт/всего (мс), токены — уходит в meta.calls
+    st.session_state.setdefault("calls", [])
+    # токены кандидатов префетча, которые не пригодились (meta.prefetch_usage)
+    st.session_state.setdefault("prefetch_usage", {})
+
     # master auth
     st.session_state.setdefault("master_authed", False)
 
+    # session_id в URL: с ним интервью переживает потерю соединения и смену реплики
+    if st.query_params.get("sid") != st.session_state["session_id"]:
+        st.query_params["sid"] = st.session_state["session_id"]
+
+def restore_session(sid: str) -> bool:
+    # состояние собирается заново из журнала (идёт интервью)
+    # или из итогового payload (интервью уже завершено)
+    try:
+        uuid.UUID(str(sid))
+    except ValueError:
+        return False
+    ss = st.session_state
+    records = get_journal().read(sid)
+    if records:
+        ss["session_id"] = sid
+        ss["journal_started"] = True
+        init_state()
+        for rec in records:
+            t = rec.get("type")
+            if t == "start":
+                client = rec.get("client", {}) or {}
+                ss["client_name"] = client.get("name","")
+                ss["client_contact"] = client.get("contact","")
+                ss["client_request"] = client.get("request","")
+                ss["model_used"] = rec.get("model", DEFAULT_MODEL)
+                ss["journal_client"] = intake_signature()
+            elif t == "step":
+                ss["answers"].append({k: rec.get(k) for k in ["step_id","question","answer","timestamp"]})
+                apply_analysis_update(rec.get("analysis_update", {}), ss)
+                ss["score_steps"].append(ss["score_matrix"].copy())
+                ss["q_count"] += 1
+                ss["step_index"] = int(rec.get("next_step_index", int(rec.get("step_index", ss["step_index"])) + 1))
+                ss["skipped"] = list(rec.get("skipped") or ss["skipped"])
+                ss["extra_steps"] = list(rec.get("extra_steps") or ss["extra_steps"])
+                ss["current_q"] = None
+            elif t == "question":
+                # последний показанный вопрос — чтобы не генерировать его заново
+                if int(rec.get("step_index", -1)) == ss["step_index"]:
+                    ss["current_q"] = rec.get("q")
+                add_usage(ss["usage"], rec.get("usage"))
+                if rec.get("call"):
+                    ss["calls"].append(rec["call"])
+        compact(ss, HISTORY_CFG)  # дайджест не журналируется — собирается из ответов
+        return True
+
+    payload = load_session(sid)
+    if payload:
+        meta = payload.get("meta", {})
+        ss["session_id"] = sid
+        init_state()
+        ss["client_name"] = meta.get("name","")
+        ss["client_contact"] = meta.get("contact","")
+        ss["client_request"] = meta.get("request","")
+        ss["q_count"] = int(meta.get("q_count", 0) or 0)
+        ss["step_index"] = len(payload.get("answers", []))
+        ss["model_used"] = meta.get("model", DEFAULT_MODEL)
+        ss["usage"] = meta.get("usage", {}) or {}
+        ss["prefetch_usage"] = meta.get("prefetch_usage", {}) or {}
+        ss["calls"] = list(meta.get("calls") or [])
+        for k in ["answers","positions","confidence"]:
+            key = {"positions": "positions_guess"}.get(k, k)
+            if payload.get(key) is not None:
+                ss[k] = payload[key]
+        ss["score_matrix"] = scoring.from_payload(payload)
+        ss["score_steps"] = [np.asarray(x, dtype=np.float64) for x in payload.get("scores_by_step") or []]
+        ss["digest"] = payload.get("digest") or compact(ss, HISTORY_CFG)
+        ss["done"] = True
+        ss["final_payload"] = payload
+        return True
+    return False
+
 def reset_all():
+    if "session_id" in st.session_state:
+        get_prefetcher().discard(st.session_state["session_id"])
     for k in list(st.session_state.keys()):
         del st.session_state[k]
+    # иначе init_state поднимет старую сессию из ?sid=
+    st.query_params.clear()
     init_state()
 
-# =========================
-# AI CONTRACT
-# =========================
-def build_system_prompt():
-    return f"""
-Ты — интервьюер по авторской методике "Потенциалы". У тебя есть база знаний ниже.
-Твоя задача: вести интервью СТРОГО по шагам и выдавать вопрос + варианты (если подходят).
-
-ЖЁСТКИЕ ПРАВИЛА:
-1) Не задавай больше 1 уточняющего вопроса на шаг.
-2) Не "мусоль" эмоции. Один уточняющий максимум.
-3) Каждый вопрос должен быть бытовым, понятным, с конкретной ситуацией.
-4) Если возможно, давай 4 варианта ответа (короткие). Всегда добавляй вариант "Другое (своими словами)".
-5) Ты НЕ раскрываешь названия потенциалов клиенту (камни) в клиентском режиме.
-6) Ты всегда возвращаешь строго JSON по схеме.
-
-БАЗА ЗНАНИЙ (сокращение, используй как источник):
----BEGIN KNOWLEDGE---
-{POSITIONS_KNOWLEDGE}
----END KNOWLEDGE---
-""".strip()
-
-def build_user_payload(step_id: str, step_goal: str):
-    return {
-        "mode": "client_interview",
-        "step_id": step_id,
-        "step_goal": step_goal,
-        "client": {
-            "name": st.session_state.get("client_name",""),
-            "contact": st.session_state.get("client_contact",""),
-            "request": st.session_state.get("client_request",""),
-        },
-        "state": {
-            "step_index": st.session_state["step_index"],
-            "q_count": st.session_state["q_count"],
-            "positions": st.session_state["positions"],
-            "confidence": st.session_state["confidence"],
-            "scores": st.session_state["scores"],
-            "col_scores": st.session_state["col_scores"],
-        },
-        "history_tail": st.session_state["answers"][-6:],  # последние ответы
-        "limits": {
-            "max_questions_total": MAX_Q_TOTAL,
-            "confidence_stop": CONF_STOP
-        }
-    }
-
-def response_schema_note():
-    return {
-        "type": "json_object"
-    }
-
-# ожидаемый JSON от модели:
-# {
-#  "question": "...",
-#  "type": "single"|"text",
-#  "options": ["..."] (если single),
-#  "analysis_update": {
-#    "scores_delta": {"Аметист":0.2, ...},
-#    "col_scores_delta": {"perception":{"...":0.1}, "motivation":{...}, "tool":{...}, "result":{...}},
-#    "positions_guess": {"p1":"...", "p2":"...", "p3":"..."} (может быть null),
-#    "confidence": {"p1":0.0-1.0, ...},
-#    "notes_for_master": "..."
-#  }
-# }
-
-def call_ai_next_question(client, model: str, step_id: str, step_goal: str):
-    sys = build_system_prompt()
-    payload = build_user_payload(step_id, step_goal)
-
-    guide = """
-Верни JSON:
-- question (строка)
-- type: "single" или "text"
-- options: если type="single", дай 4-5 вариантов, последний обязательно "Другое (своими словами)"
-- analysis_update: объект, где:
-    - scores_delta: словарь по камням (можно частично)
-    - col_scores_delta: словарь по колонкам (perception/motivation/tool/result) → частично
-    - positions_guess: p1/p2/p3 (можно null)
-    - confidence: p1/p2/p3 (0..1)
-    - notes_for_master: коротко
-""".strip()
-
-    r = client.responses.create(
-        model=model,
-        input=[
-            {"role":"system","content":sys},
-            {"role":"user","content": json.dumps(payload, ensure_ascii=False)},
-            {"role":"user","content": guide},
-        ],
-        text={"format": {"type": "json_object"}},
+def state_snapshot():
+    # независимая копия того, что нужно для вызова модели:
+    # её можно отдать в фоновый поток, не трогая st.session_state
+    return snapshot(st.session_state)
+
+def prompt_deps():
+    # всё "процессное" для сборки промпта берём в потоке скрипта
+    return make_deps(
+        load_knowledge_index(),
+        get_prefix_guard(),
+        MAX_Q_TOTAL,
+        CONF_STOP,
+        KNOWLEDGE_BUDGET_TOKENS,
+        KNOWLEDGE_TOP_K,
+        get_response_cache(),
+        get_scheduler(),
+        get_resilience(),
+        load_question_bank(),
+        {k: v for k, v in BANK_CFG.items() if k in ("serve_scope", "pot_margin", "fallback")},
+        HISTORY_CFG,
+        BUDGET,
     )
 
-    text = getattr(r, "output_text", "") or ""
-    if not text.strip():
-        # fallback на случай неожиданной структуры
-        try:
-            text = r.output[0].content[0].text
-        except Exception:
-            text = '{"question":"Ошибка чтения ответа модели","type":"text","options":[],"analysis_update":{}}'
-
-    return json.loads(text)
-
-def apply_analysis_update(update: dict):
-    if not isinstance(update, dict):
-        return
-
-    # scores
-    d = update.get("scores_delta", {})
-    if isinstance(d, dict):
-        for k, v in d.items():
-            if k in st.session_state["scores"]:
-                st.session_state["scores"][k] = float(st.session_state["scores"][k]) + float(v)
-
-    # col scores
-    cd = update.get("col_scores_delta", {})
-    if isinstance(cd, dict):
-        for col in ["perception","motivation","tool","result"]:
-            sub = cd.get(col, {})
-            if isinstance(sub, dict):
-                for k, v in sub.items():
-                    if k in st.session_state["col_scores"][col]:
-                        st.session_state["col_scores"][col][k] = float(st.session_state["col_scores"][col][k]) + float(v)
-
-    # guesses
-    g = update.get("positions_guess", {})
-    if isinstance(g, dict):
-        for p in ["p1","p2","p3"]:
-            if p in g and g[p]:
-                st.session_state["positions"][p] = g[p]
-
-    # confidence
-    c = update.get("confidence", {})
-    if isinstance(c, dict):
-        for p in ["p1","p2","p3"]:
-            if p in c and c[p] is not None:
-                st.session_state["confidence"][p] = float(c[p])
-
-def topn(d: dict, n=3):
-    return sorted(d.items(), key=lambda x: float(x[1]), reverse=True)[:n]
-
 # =========================
 # REPORTS
 # =========================
 def build_client_report_text():
     # без названий камней
     vecs = []
-    # просто по топам в колонках (без камней)
-    for col, label in [
+    # по колонкам (без камней)
+    for _, label in [
         ("perception","Как вы воспринимаете мир"),
         ("motivation","Что вас реально мотивирует"),
         ("tool","Какой инструмент включается"),
         ("result","Какой результат вы обычно даёте"),
     ]:
-        top = topn(st.session_state["col_scores"][col], 2)
         # мы не показываем названия, только описания “вектора”
         # пока делаем мягко: "есть выраженные сигналы X/Y"
         vecs.append(f"- **{label}**: есть выраженные сигналы по 2 направлениям (уточняется на встрече).")
@@ -356,51 +664,18 @@ def build_client_report_text():
     ]
     return "\n".join(lines)
 
-def call_ai_master_report(client, model: str, payload: dict):
-    sys = (
-        "Ты мастер-диагност. Дай МАСТЕР-ОТЧЁТ строго структурно:\n"
-        "1) Таблица позиций: P1/P2/P3 (потенциал + краткий маркер)\n"
-        "2) Колонки: perception/motivation/tool/result: топ-2 потенциала и почему\n"
-        "3) Конфликты/смещения\n"
-        "4) 6 уточняющих вопросов (короткие)\n"
-        "5) Рекомендации по реализации/монетизации под запрос\n"
-        "Пиши по-русски, конкретно."
-    )
-
-    r = client.responses.create(
-        model=model,
-        input=[
-            {"role":"system","content":sys},
-            {"role":"user","content": json.dumps(payload, ensure_ascii=False)}
-        ],
-    )
-    try:
-        return r.output_text
-    except Exception:
-        return "Не удалось прочитать ответ модели."
-
 def build_payload_final():
-    ranked = sorted(st.session_state["scores"].items(), key=lambda x: float(x[1]), reverse=True)
-    payload = {
-        "meta": {
-            "schema": "ai-neo.positions.ai_only.v1",
-            "app_version": APP_VERSION,
-            "timestamp": utcnow_iso(),
-            "session_id": st.session_state["session_id"],
-            "name": st.session_state.get("client_name",""),
-            "contact": st.session_state.get("client_contact",""),
-            "request": st.session_state.get("client_request",""),
-            "q_count": st.session_state.get("q_count", 0),
-            "model": st.session_state.get("model_used", DEFAULT_MODEL),
+    return build_final_payload(
+        st.session_state,
+        APP_VERSION,
+        st.session_state.get("model_used", DEFAULT_MODEL),
+        {
+            "prompt_prefix": st.session_state.get("prompt_prefix"),
+            "usage": st.session_state.get("usage", {}),
+            "prefetch_usage": st.session_state.get("prefetch_usage", {}),
+            "calls": st.session_state.get("calls", []),
         },
-        "answers": st.session_state["answers"],
-        "positions_guess": st.session_state["positions"],
-        "confidence": st.session_state["confidence"],
-        "scores": st.session_state["scores"],
-        "col_scores": st.session_state["col_scores"],
-        "top6": [{"pot":p,"score":float(s)} for p,s in ranked[:6]],
-    }
-    return payload
+    )
 
 # =========================
 # UI: CLIENT FLOW
@@ -416,13 +691,14 @@ def client_intake():
     c1, c2 = st.columns([1,1])
     with c1:
         if st.button("🚀 Начать диагностику", use_container_width=True):
-            st.session_state["messages"] = []
             st.session_state["answers"] = []
             st.session_state["step_index"] = 0
             st.session_state["q_count"] = 0
             st.session_state["done"] = False
             st.session_state["current_q"] = None
             st.session_state["current_answer"] = ""
+            st.session_state["journal_started"] = False
+            st.session_state["final_payload"] = None
             st.rerun()
     with c2:
         if st.button("🔄 Полный сброс", use_container_width=True):
@@ -437,41 +713,154 @@ def ensure_current_question():
         st.session_state["done"] = True
         return
 
-    # стоп по уверенностям (если все 3 позиции уже уверенно)
-    c = st.session_state["confidence"]
-    if c.get("p1",0) >= CONF_STOP and c.get("p2",0) >= CONF_STOP and c.get("p3",0) >= CONF_STOP:
+    if confident_enough(st.session_state, CONF_STOP):
         st.session_state["done"] = True
         return
 
     if st.session_state["current_q"] is not None:
         return
 
-    # получить следующий шаг
-    idx = st.session_state["step_index"]
-    if idx >= len(STEPS):
+    # получить следующий шаг (основной план + уточнения)
+    step = current_step(st.session_state)
+    if step is None:
         st.session_state["done"] = True
         return
 
-    client = get_openai_client()
-    if not client:
+    deps = prompt_deps()
+    # шаг из банка не ждёт клиента: на первом rerun импорт openai ещё идёт в прогреве
+    from_bank = use_bank(deps, step["id"], st.session_state)
+    client = None if from_bank else get_openai_client()
+    if not from_bank and not client and not can_fallback(deps, step["id"]):
         st.error("Нет OPENAI_API_KEY. Добавь в Streamlit secrets или env.")
         st.stop()
 
     model = safe_model_name(st.session_state.get("model_used", DEFAULT_MODEL))
     st.session_state["model_used"] = model
 
-    step = STEPS[idx]
-    qjson = call_ai_next_question(client, model, step["id"], step["goal"])
+    hit = take_prefetched()
+    try:
+        if from_bank or not client:
+            # сфера/тип и ясные позиции — из банка; без ключа — весь шаг из банка
+            qjson, info = bank_question(deps, step["id"], st.session_state)
+        elif hit is not None:
+            qjson, info = hit
+        elif STREAM_QUESTIONS:
+            try:
+                qjson, info = stream_question_live(client, model, step)
+            except (SchedulerBusy, ModelUnavailable):
+                raise
+            except Exception:
+                # поток оборвался или ответ не читается — обычный вызов с повторами
+                qjson, info = call_ai_next_question(client, model, step["id"], step["goal"], state_snapshot(), prompt_deps())
+        else:
+            qjson, info = call_ai_next_question(client, model, step["id"], step["goal"], state_snapshot(), prompt_deps())
+    except (SchedulerBusy, ModelUnavailable, InvalidAnswer):
+        if can_fallback(deps, step["id"]):
+            # модель недоступна — интервью продолжается по банку
+            qjson, info = bank_question(deps, step["id"], st.session_state)
+        else:
+            # перегрузка / модель не ответила в бюджет шага: ответы сохранены,
+            # вопрос просто запросим ещё раз
+            st.warning("Сейчас много обращений к модели. Подожди немного и нажми «Повторить».")
+            if st.button("Повторить", use_container_width=True):
+                st.rerun()
+            st.stop()
+    if info.get("prompt_prefix"):
+        st.session_state["prompt_prefix"] = info["prompt_prefix"]
+    add_usage(st.session_state["usage"], info.get("usage"))
+    st.session_state["calls"].append(call_record(step["id"], info))
+    journal_question(qjson, info)
     st.session_state["current_q"] = qjson
     st.session_state["current_answer"] = ""
 
+def stream_question_live(client, model: str, step: dict):
+    # текст вопроса появляется по мере генерации; после завершения
+    # черновик убирается и вопрос рисуется обычным render_current_question
+    question_chunks, finish, close = stream_ai_next_question(
+        client, model, step["id"], step["goal"], state_snapshot(), prompt_deps()
+    )
+    box = st.empty()
+    try:
+        with box.container():
+            st.markdown(f"### {step['title']}")
+            st.write_stream(question_chunks())
+            opts_box = st.empty()
+
+            def on_field(key, val):
+                if key == "options" and isinstance(val, list):
+                    opts_box.markdown("\n".join(f"- {o}" for o in val))
+
+            qjson, info = finish(on_field)
+    finally:
+        # rerun/stop посреди write_stream: место в очереди не ждёт истечения аренды
+        close()
+        box.empty()
+    return qjson, info
+
+def intake_signature(state=None) -> str:
+    s = st.session_state if state is None else state
+    return "|".join([s.get("client_name",""), s.get("client_contact",""), s.get("client_request","")])
+
+def take_prefetched():
+    # готовый кандидат под выбранный вариант ответа (или None → обычный вызов)
+    if not PREFETCH_ENABLED or not st.session_state["answers"]:
+        return None
+    sid = st.session_state["session_id"]
+    idx = st.session_state["step_index"]
+    pf = get_prefetcher()
+    last = st.session_state["answers"][-1]
+    # не готов за PREFETCH_WAIT_SEC — обычный путь, а кандидат доработает как брошенный
+    hit = pf.take((sid, idx, last["answer"], intake_signature()), timeout=PREFETCH_WAIT_SEC)
+    # кандидаты под другие варианты (и другие следующие шаги) больше не нужны
+    pf.discard(sid)
+    collect_unused_prefetch(sid)
+    return hit
+
+def collect_unused_prefetch(sid: str):
+    # токены брошенных кандидатов, доработавших к этому rerun, — в meta.prefetch_usage
+    for _, info in get_prefetcher().pop_unused(sid):
+        add_usage(st.session_state["prefetch_usage"], info.get("usage"))
+
+def schedule_prefetch(q: dict):
+    # пока клиент выбирает вариант, генерируем следующий вопрос под каждый вариант
+    if not PREFETCH_ENABLED or q.get("type") != "single":
+        return
+    ss = st.session_state
+    if ss["q_count"] + 1 >= MAX_Q_TOTAL:
+        return
+    options = [
+        o for o in (q.get("options") or [])
+        if isinstance(o, str) and o.strip() and not o.lower().startswith("другое")
+    ][:PREFETCH_MAX_CANDIDATES]
+    pf = get_prefetcher()
+    # пока клиент греется — без префетча, rerun его не ждёт
+    client = get_openai_client() if start_warmup()["client"] else None
+    if not options or not client:
+        return
+
+    model = ss.get("model_used", DEFAULT_MODEL)
+    deps = prompt_deps()
+    base = state_snapshot()
+    sig = intake_signature()
+    for opt in options:
+        # следующий шаг зависит от ответа (пропуски в adaptive.py) — считаем на копии
+        state = copy.deepcopy(base)
+        record_answer(q, opt, state, ADAPTIVE, MAX_Q_TOTAL, HISTORY_CFG)
+        nxt = current_step(state)
+        key = (ss["session_id"], state["step_index"], opt, sig)
+        if nxt is None or pf.has(key) or confident_enough(state, CONF_STOP) or use_bank(deps, nxt["id"], state):
+            continue
+        pf.submit(key, call_ai_next_question, client, model, nxt["id"], nxt["goal"], state, deps,
+                  kind="prefetch")
+
 def render_current_question():
     q = st.session_state.get("current_q")
     if not q:
         return
 
     idx = st.session_state["step_index"]
-    step_title = STEPS[idx]["title"] if idx < len(STEPS) else "—"
+    step = current_step(st.session_state)
+    step_title = step["title"] if step else "—"
 
     st.markdown(f"### {step_title}")
     st.markdown(q.get("question","(вопрос отсутствует)"))
@@ -493,6 +882,8 @@ def render_current_question():
     else:
         ans = st.text_area("Ответ:", key=ui_key, height=150)
 
+    schedule_prefetch(q)
+
     c1, c2 = st.columns([1,1])
     with c1:
         if st.button("Далее ➜", use_container_width=True):
@@ -500,26 +891,18 @@ def render_current_question():
                 st.warning("Заполни ответ.")
                 return
 
-            # сохранить ответ
-            st.session_state["answers"].append({
-                "step_id": STEPS[st.session_state["step_index"]]["id"] if st.session_state["step_index"] < len(STEPS) else "done",
-                "question": q.get("question",""),
-                "answer": ans,
-                "timestamp": utcnow_iso()
-            })
-
-            # применить апдейт скоринга
-            apply_analysis_update(q.get("analysis_update", {}))
-
-            # двигаться дальше
-            st.session_state["q_count"] += 1
-            st.session_state["step_index"] += 1
+            # сохранить ответ, применить апдейт, двигаться дальше
+            update = record_answer(q, ans, st.session_state, ADAPTIVE, MAX_Q_TOTAL, HISTORY_CFG)
+            journal_step(q, update, idx)
             st.session_state["current_q"] = None  # важно: сброс, чтобы получить новый вопрос
 
             st.rerun()
 
     with c2:
         if st.button("Завершить сейчас", use_container_width=True):
+            # ещё идущие кандидаты попадут только в метрики процесса (prefetch.unused_*)
+            get_prefetcher().discard(st.session_state["session_id"])
+            collect_unused_prefetch(st.session_state["session_id"])
             st.session_state["done"] = True
             st.session_state["current_q"] = None
             st.rerun()
@@ -527,8 +910,7 @@ def render_current_question():
 def render_done():
     st.success("Диагностика завершена ✅")
 
-    payload = build_payload_final()
-    save_session(payload)
+    payload = finalize_session()
 
     st.markdown("## Мини-отчёт (для клиента)")
     st.markdown(build_client_report_text())
@@ -539,6 +921,218 @@ def render_done():
 # =========================
 # MASTER PANEL
 # =========================
+SESSION_SORTS = {"Дата": "timestamp", "Уверенность": "confidence", "Вопросов": "q_count"}
+
+def render_session_browser():
+    # фильтры и сортировка уходят в SQL, на экран — только одна страница
+    q = st.text_input("Поиск (имя / контакт / запрос)", key="mb_q")
+    c1, c2, c3 = st.columns([2,1,1])
+    with c1:
+        dates = st.date_input("Период", value=(), key="mb_dates")
+    with c2:
+        sort_label = st.selectbox("Сортировка", list(SESSION_SORTS), key="mb_sort")
+    with c3:
+        page_size = st.selectbox("На странице", [25, 50, 100], key="mb_size")
+    desc = st.toggle("Сначала большие / новые", value=True, key="mb_desc")
+
+    date_from = date_to = ""
+    if isinstance(dates, (list, tuple)) and dates:
+        date_from = dates[0].isoformat()
+        date_to = ((dates[1] if len(dates) > 1 else dates[0]) + timedelta(days=1)).isoformat()
+
+    # при смене фильтров — на первую страницу
+    sig = (q, date_from, date_to, sort_label, page_size, desc)
+    if st.session_state.get("mb_sig") != sig:
+        st.session_state["mb_sig"] = sig
+        st.session_state["mb_page"] = 1
+
+    filters = dict(text=q, date_from=date_from, date_to=date_to, sort=SESSION_SORTS[sort_label], desc=desc)
+    page = int(st.session_state.get("mb_page", 1))
+    rows, total = query_sessions(limit=page_size, offset=(page - 1) * page_size, **filters)
+    if not total:
+        st.info("Пока нет сохранённых сессий." if not any([q, date_from]) else "Ничего не найдено.")
+        return None, {}
+
+    pages = max(1, (total + page_size - 1) // page_size)
+    if page > pages:
+        st.session_state["mb_page"] = page = pages
+        rows, _ = query_sessions(limit=page_size, offset=(page - 1) * page_size, with_total=False, **filters)
+
+    labels = {
+        r["session_id"]: f"{r.get('name') or '—'} | {r.get('request') or '—'} | {r.get('timestamp') or '—'} "
+                         f"| q={r.get('q_count', 0)} | conf={float(r.get('conf_avg') or 0):.2f} | {r['session_id'][:8]}"
+        for r in rows
+    }
+    pick = st.selectbox("Сессии:", list(labels), format_func=labels.get, key="pick")
+    n1, n2 = st.columns([1,3])
+    with n1:
+        st.number_input("Страница", min_value=1, max_value=pages, step=1, key="mb_page")
+    with n2:
+        st.caption(f"Найдено: {total} · страница {page} из {pages}")
+    return pick, labels
+
+def render_metrics(meta: dict):
+    # процесс: перцентили этапов и счётчики; сессия: её вызовы из meta.calls
+    snap = METRICS.snapshot()
+    st.caption(f"Процесс: {snap['uptime_sec']:.0f} с с запуска · окно {METRICS.window} наблюдений на этап")
+    warm = start_warmup()
+    st.caption(f"Первая отрисовка: {startup_timing()['first_paint_sec']} с · прогрев: "
+               + (f"{warm['sec']} с {warm['error']}" if warm["done"] else "идёт"))
+    if snap["stages"]:
+        st.dataframe(snap["stages"], use_container_width=True, hide_index=True)
+    if snap["counters"]:
+        st.dataframe(snap["counters"], use_container_width=True, hide_index=True)
+    calls = meta.get("calls") or []
+    if calls:
+        usage = meta.get("usage") or {}
+        st.caption(f"Сессия: {len(calls)} вопросов · токенов {usage.get('input_tokens', 0)} / "
+                   f"{usage.get('output_tokens', 0)} · ${usage.get('cost_usd', 0):.4f}")
+        wasted = meta.get("prefetch_usage") or {}
+        if wasted:
+            st.caption(f"Префетч впустую: {wasted.get('calls', 0)} вызовов · токенов {wasted.get('input_tokens', 0)} / "
+                       f"{wasted.get('output_tokens', 0)} · ${wasted.get('cost_usd', 0):.4f}")
+        st.dataframe(calls, use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Prometheus (текст)",
+        data=METRICS.to_prometheus().encode("utf-8"),
+        file_name="metrics.prom",
+        mime="text/plain",
+        use_container_width=True,
+    )
+
+def render_analytics():
+    # сводка по всем сессиям: numpy по столбцам в памяти, без чтения файлов
+    an = get_analytics()
+    t0 = time.perf_counter()
+    an.refresh()
+    dates = st.date_input("Период", value=(), key="an_dates")
+    date_from = date_to = ""
+    if isinstance(dates, (list, tuple)) and dates:
+        date_from = dates[0].isoformat()
+        date_to = ((dates[1] if len(dates) > 1 else dates[0]) + timedelta(days=1)).isoformat()
+    f = an.select(date_from, date_to)
+    if not len(f["day"]):
+        st.info("Нет сессий за период.")
+        return
+
+    st.markdown("**Позиции: сколько раз камень стал p1 / p2 / p3**")
+    st.bar_chart(analytics.positions(f))
+
+    c1, c2 = st.columns([1,1])
+    with c1:
+        a = st.selectbox("Строки", analytics.POSITIONS, index=0, key="an_a")
+    with c2:
+        b = st.selectbox("Столбцы", analytics.POSITIONS, index=1, key="an_b")
+    co = analytics.cooccurrence(f, a, b)
+    st.markdown(f"**Совместная встречаемость: {a} × {b}**")
+    st.dataframe({"": list(scoring.POTS), **{pot: co[:, i].tolist() for i, pot in enumerate(scoring.POTS)}},
+                 use_container_width=True, hide_index=True)
+
+    hist = analytics.confidence_hist(f)
+    st.markdown("**Уверенность по позициям**")
+    st.bar_chart({p: hist[p] for p in analytics.POSITIONS})
+    st.caption("Корзины: " + ", ".join(f"{lo:.1f}–{hi:.1f}" for lo, hi in zip(hist["edges"], hist["edges"][1:])))
+
+    c1, c2 = st.columns([1,1])
+    with c1:
+        pos = st.selectbox("Дрейф позиции", analytics.POSITIONS, key="an_drift_pos")
+    with c2:
+        period = st.selectbox("Период", list(analytics.PERIODS), index=1, key="an_drift_period")
+    labels, shares = analytics.drift(f, pos, period)
+    if labels:
+        st.line_chart({pot: shares[:, i].tolist() for i, pot in enumerate(scoring.POTS)})
+        st.caption(f"С {labels[0]} по {labels[-1]} · {len(labels)} периодов")
+
+    st.markdown("**Средние баллы**")
+    st.json(analytics.mean_scores(f), expanded=False)
+    snap = an.snapshot()
+    st.caption(f"Сессий: {len(f['day'])} из {snap['sessions']} · {snap['memory_mb']} МБ · "
+               f"{(time.perf_counter() - t0) * 1000:.0f} мс")
+
+def render_bulk_export():
+    # файл собирается только по кнопке, потоком на диск (storage.export_dir)
+    import session_export
+    ss = st.session_state
+    store = get_session_store()
+    dates = st.date_input("Период", value=(), key="ex_dates")
+    c1, c2, c3 = st.columns([1,1,1])
+    with c1:
+        done = st.selectbox("Позиции", ["все", "определены p1–p3", "не определены"], key="ex_done")
+    with c2:
+        rep = st.selectbox("Мастер-отчёт", ["все", "есть", "нет"], key="ex_rep")
+    with c3:
+        fmt = st.selectbox("Формат", session_export.available_formats(), key="ex_fmt")
+    filters = {"date_from": "", "date_to": "",
+               "completed": {"все": None, "определены p1–p3": True, "не определены": False}[done],
+               "has_report": {"все": None, "есть": True, "нет": False}[rep]}
+    if isinstance(dates, (list, tuple)) and dates:
+        filters["date_from"] = dates[0].isoformat()
+        filters["date_to"] = ((dates[1] if len(dates) > 1 else dates[0]) + timedelta(days=1)).isoformat()
+    if st.button("Собрать выгрузку", use_container_width=True):
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        path = EXPORT_DIR / session_export.export_name(fmt, **filters)
+        with span("export.sessions"):
+            res = session_export.export(store, path, fmt, **filters)
+        ss["export_file"] = {**res, "path": str(path), "bytes": path.stat().st_size}
+    ex = ss.get("export_file")
+    if ex and Path(ex["path"]).exists():
+        st.caption(f"{ex['exported']} сессий · {ex['bytes'] / 2**20:.2f} МБ · {ex['sec']} с · {ex['path']}")
+        with open(ex["path"], "rb") as f:
+            st.download_button(f"⬇️ {Path(ex['path']).name}", data=f, file_name=Path(ex["path"]).name,
+                               mime=session_export.MIME[ex["format"]], use_container_width=True)
+
+    st.markdown("**Загрузка** (ndjson.gz / parquet / arrow)")
+    up = st.file_uploader("Файл выгрузки", type=["gz", "parquet", "arrow"], key="im_file")
+    overwrite = st.checkbox("Перезаписывать существующие сессии", key="im_overwrite")
+    if up is not None and st.button("Загрузить сессии", use_container_width=True):
+        try:
+            with span("import.sessions"):
+                res = session_export.import_sessions(store, up, session_export.format_of(up.name), overwrite)
+        except Exception as e:
+            st.error(f"Не удалось загрузить: {type(e).__name__}: {e}")
+        else:
+            st.success(f"Загружено {res['imported']}, пропущено {res['skipped']}, битых {res['invalid']} · {res['sec']} с")
+            if res["error"]:
+                st.caption(f"Первая битая: {res['error']}")
+
+def show_report_progress():
+    queue = get_report_queue()
+    p = queue.progress(st.session_state.get("rj_batch"))
+    finished = p["done"] + p["skipped"] + p["failed"]
+    if p["total"]:
+        st.progress(finished / p["total"], text=f"Готово {finished} из {p['total']} · в очереди {p['queued']} "
+                                                f"· в работе {p['running']} · ошибок {p['failed']} · воркеров {p['workers']}")
+    rows = queue.recent(limit=10)
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+# пока очередь не пуста — прогресс обновляется сам, без rerun всей страницы
+show_report_progress_live = st.fragment(run_every=2.0)(show_report_progress)
+
+def render_report_jobs(labels: dict, model: str):
+    queue = get_report_queue()
+    ready = bool(get_openai_client())
+    if not ready:
+        st.error("Нет OPENAI_API_KEY")
+    missing = get_session_store().without_report()
+    picked = st.multiselect("Сессии (текущая страница)", list(labels), format_func=labels.get, key="rj_pick")
+    force = st.checkbox("Перегенерировать готовые отчёты", key="rj_force")
+    c1, c2 = st.columns([1,1])
+    with c1:
+        if st.button(f"В очередь: выбранные ({len(picked)})", use_container_width=True, disabled=not (picked and ready)):
+            st.session_state["rj_batch"] = queue.enqueue(picked, model, force)
+    with c2:
+        if st.button(f"В очередь: все без отчёта ({len(missing)})", use_container_width=True, disabled=not (missing and ready)):
+            st.session_state["rj_batch"] = queue.enqueue(missing, model)
+    p = queue.progress()
+    if p["failed"] and ready and st.button(f"Повторить неудачные ({p['failed']})", use_container_width=True):
+        st.session_state["rj_batch"] = queue.retry_failed(model)
+        p = queue.progress()
+    if p["queued"] or p["running"]:
+        show_report_progress_live()
+    else:
+        show_report_progress()
+
 def render_master_panel():
     st.subheader("🛠️ Мастер-панель")
 
@@ -557,20 +1151,15 @@ def render_master_panel():
                 st.error("Неверный пароль")
         st.stop()
 
-    sessions = list_sessions()
-    if not sessions:
-        st.info("Пока нет сохранённых сессий.")
+    with span("render.session_browser"):
+        chosen_id, labels = render_session_browser()
+    with st.expander("📊 Аналитика по всем сессиям"):
+        with span("render.analytics"):
+            render_analytics()
+    with st.expander("🗄️ Выгрузка / загрузка сессий (пакетно)"):
+        render_bulk_export()
+    if not chosen_id:
         st.stop()
-
-    labels, ids = [], []
-    for s in sessions:
-        meta = s.get("meta", {})
-        sid = meta.get("session_id", "")
-        labels.append(f"{meta.get('name','—')} | {meta.get('request','—')} | {meta.get('timestamp','—')} | {sid[:8]}")
-        ids.append(sid)
-
-    pick = st.selectbox("Сессии:", labels, index=0, key="pick")
-    chosen_id = ids[labels.index(pick)]
     payload = load_session(chosen_id)
 
     if not payload:
@@ -587,20 +1176,21 @@ def render_master_panel():
 
     st.download_button(
         "⬇️ Скачать JSON (сессия)",
-        data=json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"),
+        data=session_json(chosen_id, file_mtime(get_session_store().path(chosen_id))),
         file_name=f"session_{chosen_id[:8]}.json",
         mime="application/json",
         use_container_width=True
     )
 
     with st.expander("📌 Таблица (для мастера)"):
+        matrix = scoring.from_payload(payload)
         st.json({
             "positions_guess": payload.get("positions_guess"),
             "confidence": payload.get("confidence"),
             "top6": payload.get("top6"),
             "col_scores_top2": {
-                col: topn(payload.get("col_scores", {}).get(col, {}), 2)
-                for col in ["perception","motivation","tool","result"]
+                col: scoring.topk(matrix, col, 2)
+                for col in COLS
             }
         })
 
@@ -609,46 +1199,82 @@ def render_master_panel():
 
     model_in = st.text_input("Модель", value=DEFAULT_MODEL, key="mmodel")
 
-    if st.button("Сгенерировать мастер-отчёт", use_container_width=True):
-        client = get_openai_client()
-        if not client:
+    with st.expander("⚙️ OpenAI-клиент (пул соединений)"):
+        st.json(openai_pool_stats())
+
+    with st.expander("🗃️ Кэш ответов модели"):
+        cache = get_response_cache()
+        st.json(cache.snapshot() if cache else {"enabled": False})
+
+    with st.expander("🚦 Очередь вызовов модели"):
+        sched = get_scheduler()
+        st.json(sched.snapshot() if sched else {"enabled": False})
+
+    with st.expander("📚 Банк вопросов (без модели)"):
+        bank = load_question_bank()
+        st.json(bank.snapshot() if bank else {"enabled": False})
+
+    with st.expander("🛡️ Повторы / хедж / breaker"):
+        res = get_resilience()
+        st.json(res.snapshot() if res else {"enabled": False})
+
+    with st.expander("📈 Метрики (этапы, токены, стоимость)"):
+        render_metrics(meta)
+
+    # отчёт генерирует фоновая очередь: вкладку можно закрыть, результат запишется в сессию
+    from report_jobs import ACTIVE
+    queue = get_report_queue()
+    job = queue.status(chosen_id)
+    if job and job["status"] in ACTIVE:
+        st.info(f"Отчёт в очереди ({job['status']}). Можно закрыть вкладку — он сохранится в сессии.")
+    elif st.button("Сгенерировать мастер-отчёт", use_container_width=True):
+        if not get_openai_client():
             st.error("Нет OPENAI_API_KEY")
         else:
-            model = safe_model_name(model_in)
-            report = call_ai_master_report(client, model, payload)
-            payload["ai_master_report"] = report
-            save_session(payload)
-            st.success("Готово ✅ Сохранено в сессии.")
-            st.write(report)
+            st.session_state["rj_batch"] = queue.enqueue(
+                [chosen_id], safe_model_name(model_in), force=bool(payload.get("ai_master_report")))
+            st.rerun()
+    elif job and job["status"] == "failed":
+        st.warning(f"Прошлая попытка не удалась: {job['error'] or '—'}")
 
     if payload.get("ai_master_report"):
         with st.expander("Показать сохранённый мастер-отчёт"):
             st.write(payload["ai_master_report"])
 
+    with st.expander("📦 Очередь мастер-отчётов (пакетно)"):
+        render_report_jobs(labels, safe_model_name(model_in))
+
 # =========================
 # MAIN
 # =========================
 init_state()
+start_metrics_export()
+start_warmup()
 
 st.title(APP_TITLE)
 st.caption(f"Версия: {APP_VERSION}")
 
 tab1, tab2 = st.tabs(["🧑‍💼 Клиент", "🛠️ Мастер"])
 
-with tab1:
-    # Intake если еще не начали
-    if not st.session_state["answers"] and not st.session_state["done"] and st.session_state["current_q"] is None:
-        client_intake()
+# st.stop()/st.rerun() прерывают скрипт исключением — замер в finally
+try:
+    with tab1:
+        # Intake если еще не начали
+        if not st.session_state["answers"] and not st.session_state["done"] and st.session_state["current_q"] is None:
+            client_intake()
 
-    if not st.session_state["done"]:
-        ensure_current_question()
         if not st.session_state["done"]:
-            st.caption(f"Прогресс: {st.session_state['q_count']} / {MAX_Q_TOTAL}")
-            render_current_question()
+            ensure_current_question()
+            if not st.session_state["done"]:
+                st.caption(f"Прогресс: {st.session_state['q_count']} / {MAX_Q_TOTAL}")
+                render_current_question()
+            else:
+                render_done()
         else:
             render_done()
-    else:
-        render_done()
 
-with tab2:
-    render_master_panel()
+    with tab2:
+        with span("render.master_panel"):
+            render_master_panel()
+finally:
+    rerun_done()
@@ -0,0 +1,134 @@
+import re
+
+import numpy as np
+
+import scoring
+
+# =========================
+# ADAPTIVE FLOW (пропуск шагов и уточнения)
+# =========================
+# Для каждой позиции считается разрыв top-1 / top-2 по баллам, набранным
+# за её шаги (total + 4 колонки, камни прошлых позиций исключены).
+# После каждого ответа advance() решает, какой шаг следующий:
+#   - дожимающий шаг (*_scope_2 / *_pot_2) пропускается, если позиция уже
+#     отделилась (разрыв ≥ skip_margin),
+#   - после основного плана сэкономленные вопросы уходят на уточнение
+#     самой неоднозначной позиции (шаг p{n}_refine_{k}, разрыв < refine_margin).
+# Пропуски и добавленные шаги живут в state (skipped / extra_steps)
+# и пишутся в журнал вместе с ответом.
+
+DEFAULTS = {
+    "enabled": True,
+    "skip_margin": 1.2,
+    "refine_margin": 0.8,
+    "max_refine_per_position": 2,
+}
+
+SKIPPABLE = ("scope_2", "pot_2")
+
+
+def position_of(step_id: str) -> int:
+    m = re.match(r"p(\d)_", step_id or "")
+    return int(m.group(1)) if m else 0
+
+
+def step_kind(step_id: str) -> str:
+    # "p2_pot_1" → "pot_1"
+    return (step_id or "").split("_", 1)[-1]
+
+
+def position_scores(state, pos: int, axis: str = None) -> np.ndarray:
+    # баллы по камням, набранные за шаги этой позиции (axis=None — сумма осей);
+    # камни, уже занятые прошлыми позициями, — -inf
+    steps = state.get("score_steps") or []
+    mine = [i for i, a in enumerate(state.get("answers") or [])
+            if str(a.get("step_id", "")).startswith(f"p{pos}_")]
+    if not mine:
+        return _exclude(state, pos, np.zeros(len(scoring.POTS)))
+    # сумма дельт своих ответов: уточнение в конце не подмешивает чужие позиции
+    local = scoring.empty()
+    for i in mine:
+        # снимка после текущего ответа ещё нет, пока ответ применяется
+        after = steps[i] if len(steps) > i else state["score_matrix"]
+        before = steps[i - 1] if 0 < i <= len(steps) else 0.0
+        local += after - before
+    vec = local[:, scoring.AXIS_INDEX[axis]] if axis else local.sum(axis=1)
+    return _exclude(state, pos, np.array(vec, dtype=np.float64))
+
+
+def _exclude(state, pos: int, vec: np.ndarray) -> np.ndarray:
+    for p in range(1, pos):
+        taken = scoring.POT_INDEX.get((state.get("positions") or {}).get(f"p{p}"))
+        if taken is not None:
+            vec[taken] = -np.inf
+    return vec
+
+
+def margin(vec: np.ndarray) -> float:
+    xs = np.sort(vec[np.isfinite(vec)])[::-1]
+    if len(xs) < 2:
+        return 0.0
+    return float(xs[0] - xs[1])
+
+
+def margins(state) -> dict:
+    # разрыв по каждой позиции, у которой уже есть ответы
+    out = {}
+    for pos in (1, 2, 3):
+        if any(str(a.get("step_id", "")).startswith(f"p{pos}_") for a in state.get("answers") or []):
+            out[f"p{pos}"] = round(margin(position_scores(state, pos)), 3)
+    return out
+
+
+def leaders(state, pos: int, k: int = 2):
+    vec = position_scores(state, pos)
+    idx = [i for i in np.argsort(-vec, kind="stable") if np.isfinite(vec[i])][:k]
+    return [scoring.POTS[i] for i in idx]
+
+
+def refine_step(state, pos: int, n: int) -> dict:
+    a, b = (leaders(state, pos, 2) + [None, None])[:2]
+    goal = f"уточнить потенциал позиции {pos}"
+    if a and b:
+        goal += f": различить {a} и {b} одним бытовым вопросом"
+    return {"id": f"p{pos}_refine_{n}", "title": f"Позиция {pos} — уточнение ({n})", "goal": goal}
+
+
+def advance(state, steps: list, cfg: dict = None, max_questions: int = None) -> int:
+    # индекс следующего шага после ответа (state["step_index"] — только что отвеченный)
+    cfg = {**DEFAULTS, **(cfg or {})}
+    idx = state["step_index"] + 1
+    if not cfg["enabled"]:
+        return idx
+    skipped = state.setdefault("skipped", [])
+    extra = state.setdefault("extra_steps", [])
+
+    while idx < len(steps):
+        sid = steps[idx]["id"]
+        pos = position_of(sid)
+        if not (pos and step_kind(sid).startswith(SKIPPABLE)):
+            break
+        if margin(position_scores(state, pos)) < float(cfg["skip_margin"]):
+            break
+        skipped.append(sid)
+        idx += 1
+
+    if idx < len(steps) + len(extra):
+        return idx
+
+    # основной план пройден: сэкономленное — на самую неоднозначную позицию
+    if len(extra) >= len(skipped):
+        return idx
+    if max_questions is not None and state["q_count"] >= max_questions:
+        return idx
+    limit = int(cfg["max_refine_per_position"])
+    cands = []
+    for key, mg in margins(state).items():
+        pos = int(key[1:])
+        used = sum(1 for s in extra if position_of(s["id"]) == pos)
+        if mg < float(cfg["refine_margin"]) and used < limit:
+            cands.append((mg, pos, used))
+    if cands:
+        _, pos, used = min(cands)
+        extra.append(refine_step(state, pos, used + 1))
+    return idx
@@ -0,0 +1,201 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+import scoring
+
+# =========================
+# ANALYTICS (по всем сессиям)
+# =========================
+# Сводная таблица session_summary живёт в том же SQLite, что и индекс сессий,
+# и обновляется в SessionStore при каждом save/sync (одна строка на сессию:
+# день, p1/p2/p3 индексами камней, уверенности, матрица 9×5 float32 в BLOB;
+# seq растёт при каждой записи). Здесь она держится в памяти по столбцам
+# (numpy): refresh() дочитывает только строки с seq больше уже виденного,
+# запросы — bincount/histogram по маске, миллисекунды на 100k сессий.
+
+SUMMARY_SQL = [
+    """CREATE TABLE IF NOT EXISTS session_summary (
+        session_id TEXT PRIMARY KEY,
+        seq        INTEGER NOT NULL DEFAULT 0,
+        day        INTEGER NOT NULL DEFAULT 0,
+        p1         INTEGER NOT NULL DEFAULT -1,
+        p2         INTEGER NOT NULL DEFAULT -1,
+        p3         INTEGER NOT NULL DEFAULT -1,
+        c1         REAL NOT NULL DEFAULT 0,
+        c2         REAL NOT NULL DEFAULT 0,
+        c3         REAL NOT NULL DEFAULT 0,
+        scores     BLOB
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_summary_seq ON session_summary(seq)",
+]
+
+POSITIONS = ("p1", "p2", "p3")
+EPOCH = date(1970, 1, 1)
+PERIODS = {"day": 1, "week": 7, "month": 30}
+
+
+def day_number(ts: str) -> int:
+    # "2026-10-17T..." → дней от 1970-01-01; без даты — 0
+    try:
+        return (date.fromisoformat(str(ts)[:10]) - EPOCH).days
+    except ValueError:
+        return 0
+
+
+def day_label(n: int) -> str:
+    return (EPOCH + timedelta(days=int(n))).isoformat()
+
+
+def summary_row(payload: dict) -> tuple:
+    meta = payload.get("meta", {}) or {}
+    guess = payload.get("positions_guess", {}) or {}
+    conf = payload.get("confidence", {}) or {}
+    matrix = scoring.from_payload(payload).astype(np.float32)
+    return (
+        meta.get("session_id", ""),
+        day_number(meta.get("timestamp", "")),
+        *[scoring.POT_INDEX.get(guess.get(p), -1) for p in POSITIONS],
+        *[float(scoring.as_number(conf.get(p)) or 0.0) for p in POSITIONS],
+        matrix.tobytes(),
+    )
+
+
+def upsert_summary(conn, row: tuple):
+    # seq — сквозной номер записи: по нему кэш в памяти дочитывает изменения
+    conn.execute(
+        "INSERT INTO session_summary (session_id, seq, day, p1, p2, p3, c1, c2, c3, scores) "
+        "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM session_summary), ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(session_id) DO UPDATE SET seq=excluded.seq, day=excluded.day, "
+        "p1=excluded.p1, p2=excluded.p2, p3=excluded.p3, c1=excluded.c1, c2=excluded.c2, c3=excluded.c3, "
+        "scores=excluded.scores",
+        row,
+    )
+
+
+class Analytics:
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.ids = {}  # session_id → номер строки
+        self.seq = 0
+        self.day = np.zeros(0, dtype=np.int32)
+        self.pos = np.zeros((0, 3), dtype=np.int8)
+        self.conf = np.zeros((0, 3), dtype=np.float32)
+        self.scores = np.zeros((0, len(scoring.POTS), len(scoring.AXES)), dtype=np.float32)
+
+    # ---------- refresh ----------
+    def refresh(self) -> int:
+        # дочитывает изменённые строки; если сессии удалялись — перечитывает всё
+        with self.lock:
+            rows = self.store.summary_rows(self.seq)
+            if rows:
+                self._apply(rows)
+            if self.store.summary_count() != len(self.ids):
+                self._reset()
+                full = self.store.summary_rows(0)
+                if full:
+                    self._apply(full)
+            return len(rows)
+
+    def _apply(self, rows):
+        new, upd = [], []
+        for r in rows:
+            (upd if r[0] in self.ids else new).append(r)
+        shape = (len(scoring.POTS), len(scoring.AXES))
+        for r in upd:
+            i = self.ids[r[0]]
+            self.day[i] = r[2]
+            self.pos[i] = r[3:6]
+            self.conf[i] = r[6:9]
+            self.scores[i] = np.frombuffer(r[9], dtype=np.float32).reshape(shape) if r[9] else 0
+        if new:
+            base = len(self.ids)
+            for k, r in enumerate(new):
+                self.ids[r[0]] = base + k
+            self.day = np.concatenate([self.day, np.array([r[2] for r in new], dtype=np.int32)])
+            self.pos = np.concatenate([self.pos, np.array([r[3:6] for r in new], dtype=np.int8)])
+            self.conf = np.concatenate([self.conf, np.array([r[6:9] for r in new], dtype=np.float32)])
+            blobs = b"".join(r[9] or bytes(4 * shape[0] * shape[1]) for r in new)
+            self.scores = np.concatenate([self.scores, np.frombuffer(blobs, dtype=np.float32).reshape(-1, *shape)])
+        self.seq = max(self.seq, rows[-1][1])
+
+    # ---------- selection ----------
+    def select(self, date_from: str = "", date_to: str = "") -> dict:
+        # согласованный срез столбцов под фильтром (date_to — не включительно,
+        # как в SessionStore.query); без фильтра — без копий
+        with self.lock:
+            cols = {"day": self.day, "pos": self.pos, "conf": self.conf, "scores": self.scores}
+            m = np.ones(len(self.day), dtype=bool)
+            if date_from:
+                m &= self.day >= day_number(date_from)
+            if date_to:
+                m &= self.day < day_number(date_to)
+            if m.all():
+                return dict(cols)
+            return {k: v[m] for k, v in cols.items()}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"sessions": len(self.ids), "seq": self.seq,
+                    "memory_mb": round((self.day.nbytes + self.pos.nbytes + self.conf.nbytes
+                                        + self.scores.nbytes) / 2**20, 2)}
+
+
+# =========================
+# QUERIES (по срезу Analytics.select)
+# =========================
+def positions(f: dict) -> dict:
+    # сколько раз каждый камень стал p1/p2/p3
+    out = {}
+    for j, p in enumerate(POSITIONS):
+        col = f["pos"][:, j].astype(np.int64)
+        counts = np.bincount(col[col >= 0], minlength=len(scoring.POTS))
+        out[p] = {pot: int(counts[i]) for i, pot in enumerate(scoring.POTS)}
+    return out
+
+
+def cooccurrence(f: dict, a: str = "p1", b: str = "p2") -> np.ndarray:
+    # матрица 9×9: строка — камень позиции a, столбец — позиции b
+    n = len(scoring.POTS)
+    x = f["pos"][:, POSITIONS.index(a)].astype(np.int64)
+    y = f["pos"][:, POSITIONS.index(b)].astype(np.int64)
+    ok = (x >= 0) & (y >= 0)
+    return np.bincount(x[ok] * n + y[ok], minlength=n * n).reshape(n, n)
+
+
+def confidence_hist(f: dict, bins: int = 10) -> dict:
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    return {
+        "edges": [round(float(e), 2) for e in edges],
+        **{p: np.histogram(f["conf"][:, j], bins=edges)[0].tolist() for j, p in enumerate(POSITIONS)},
+    }
+
+
+def drift(f: dict, position: str = "p1", period: str = "week"):
+    # доля каждого камня на позиции по периодам: (начала периодов, массив (T, 9))
+    step = PERIODS.get(period, 7)
+    n = len(scoring.POTS)
+    col = f["pos"][:, POSITIONS.index(position)].astype(np.int64)
+    bucket = f["day"].astype(np.int64) // step
+    ok = col >= 0
+    col, bucket = col[ok], bucket[ok]
+    if not len(col):
+        return [], np.zeros((0, n))
+    b0 = int(bucket.min())
+    t = int(bucket.max()) - b0 + 1
+    counts = np.bincount((bucket - b0) * n + col, minlength=t * n).reshape(t, n).astype(np.float64)
+    totals = counts.sum(axis=1)
+    keep = totals > 0
+    shares = counts[keep] / totals[keep, None]
+    labels = [day_label((b0 + i) * step) for i in np.flatnonzero(keep)]
+    return labels, shares
+
+
+def mean_scores(f: dict) -> dict:
+    # средние баллы и частота первого места — тем же scoring.summary
+    return scoring.summary(f["scores"].astype(np.float64))
@@ -0,0 +1,113 @@
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import scoring
+from session_store import SessionStore
+from analytics import (
+    Analytics, upsert_summary, day_number,
+    positions, cooccurrence, confidence_hist, drift, mean_scores,
+)
+
+# =========================
+# ANALYTICS BENCHMARK (сводка по сессиям)
+# =========================
+# Во временном каталоге — SessionStore со сводкой на N синтетических сессий
+# (строки session_summary пишутся напрямую, без JSON-файлов). Меряется:
+# полная загрузка столбцов, дочитка после K новых сохранений и каждый запрос
+# мастер-панели (p50/max по повторам), без фильтра и за последние 30 дней.
+#
+#   python -m bench.analytics --sessions 100000
+
+
+def synthetic_rows(n: int, seed: int, days: int):
+    rng = np.random.default_rng(seed)
+    today = day_number(time.strftime("%Y-%m-%d"))
+    shape = (len(scoring.POTS), len(scoring.AXES))
+    for i in range(n):
+        pots = rng.choice(len(scoring.POTS), 3, replace=False)
+        m = rng.normal(0, 0.5, shape).astype(np.float32)
+        m[pots, 0] += (3.0, 2.0, 1.0)
+        yield (f"s{seed}-{i:07d}", today - int(rng.integers(0, days)), *[int(p) for p in pots],
+               *[float(x) for x in rng.uniform(0.3, 1.0, 3)], m.tobytes())
+
+
+def timed(fn, repeat: int):
+    xs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        xs.append((time.perf_counter() - t) * 1000)
+    xs.sort()
+    return {"p50_ms": round(xs[len(xs) // 2], 3), "max_ms": round(xs[-1], 3)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Скорость аналитики мастер-панели на N сессиях")
+    ap.add_argument("--sessions", type=int, default=100000)
+    ap.add_argument("--days", type=int, default=365, help="сессии раскиданы по последним N дням")
+    ap.add_argument("--new", type=int, default=100, help="сохранений между двумя refresh")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(Path(tmp))
+        conn = store._conn()
+        t = time.perf_counter()
+        with conn:
+            for row in synthetic_rows(args.sessions, args.seed, args.days):
+                upsert_summary(conn, row)
+        insert_sec = time.perf_counter() - t
+
+        an = Analytics(store)
+        t = time.perf_counter()
+        an.refresh()
+        load_ms = (time.perf_counter() - t) * 1000
+
+        t = time.perf_counter()
+        for row in synthetic_rows(args.new, args.seed + 1, args.days):
+            with conn:
+                upsert_summary(conn, row)
+        save_ms = (time.perf_counter() - t) * 1000 / max(args.new, 1)
+        t = time.perf_counter()
+        an.refresh()
+        incr_ms = (time.perf_counter() - t) * 1000
+
+        since = time.strftime("%Y-%m-%d", time.localtime(time.time() - 30 * 86400))
+        queries = {}
+        for label, kw in (("all", {}), ("last_30d", {"date_from": since})):
+            f = an.select(**kw)
+            queries[label] = {
+                "sessions": int(len(f["day"])),
+                "select": timed(lambda: an.select(**kw), args.repeat),
+                "positions": timed(lambda: positions(f), args.repeat),
+                "cooccurrence": timed(lambda: cooccurrence(f, "p1", "p2"), args.repeat),
+                "confidence_hist": timed(lambda: confidence_hist(f), args.repeat),
+                "drift_week": timed(lambda: drift(f, "p1", "week"), args.repeat),
+                "mean_scores": timed(lambda: mean_scores(f), args.repeat),
+            }
+
+        result = {
+            "config": vars(args),
+            "insert_rows_per_sec": round(args.sessions / insert_sec) if insert_sec else None,
+            "full_load_ms": round(load_ms, 1),
+            "save_summary_ms": round(save_ms, 3),
+            "incremental_refresh_ms": round(incr_ms, 2),
+            "memory": an.snapshot(),
+            "queries": queries,
+        }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import gzip
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import session_codec
+
+# =========================
+# ENCODING BENCHMARK (формат файла сессии)
+# =========================
+# Те же сессии в нескольких кодировках: размер файла, время записи
+# (сериализация) и чтения (файл с диска + разбор) на сессию, p50/p95 по всем.
+#   json_indent — прежний формат (json.dumps(..., indent=2));
+#   json_compact — без отступов;
+#   json_gzip — компактный JSON + gzip;
+#   neo — session_codec (zlib со словарём, матрицы баллов массивами).
+#
+#   python -m bench.encoding --sessions-dir data/sessions --repeat 5
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _json_compact(p):
+    return json.dumps(p, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+CODECS = {
+    "json_indent": (lambda p: session_codec.dumps(p, "json"), lambda b: json.loads(b.decode("utf-8"))),
+    "json_compact": (_json_compact, lambda b: json.loads(b.decode("utf-8"))),
+    "json_gzip": (lambda p: gzip.compress(_json_compact(p), 6), lambda b: json.loads(gzip.decompress(b).decode("utf-8"))),
+    "neo": (session_codec.encode, session_codec.loads),
+}
+
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(int(q * len(xs)), len(xs) - 1)] if xs else 0.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Размер и скорость чтения файла сессии по кодировкам")
+    ap.add_argument("--sessions-dir", default=str(ROOT / "data/sessions"))
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args(argv)
+
+    d = Path(args.sessions_dir)
+    payloads = []
+    for p in sorted(x for s in session_codec.SUFFIX.values() for x in d.glob(f"*{s}")):
+        try:
+            payloads.append(session_codec.loads(p.read_bytes()))
+        except Exception:
+            continue
+    if not payloads:
+        raise SystemExit(f"нет сессий в {d}")
+
+    result = {"config": {**vars(args), "sessions": len(payloads)}, "codecs": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (enc, dec) in CODECS.items():
+            enc_ms, load_ms, sizes = [], [], []
+            paths = []
+            for i, p in enumerate(payloads):
+                t = time.perf_counter()
+                data = enc(p)
+                enc_ms.append((time.perf_counter() - t) * 1000)
+                path = Path(tmp) / f"{name}-{i}"
+                path.write_bytes(data)
+                paths.append(path)
+                sizes.append(len(data))
+                assert dec(data) == p, f"{name}: круг кодирования не совпал"
+            for _ in range(args.repeat):
+                for path in paths:
+                    t = time.perf_counter()
+                    dec(path.read_bytes())
+                    load_ms.append((time.perf_counter() - t) * 1000)
+            result["codecs"][name] = {
+                "bytes_total": sum(sizes),
+                "bytes_avg": round(sum(sizes) / len(sizes)),
+                "encode_p50_ms": round(pct(enc_ms, 0.5), 3),
+                "load_p50_ms": round(pct(load_ms, 0.5), 3),
+                "load_p95_ms": round(pct(load_ms, 0.95), 3),
+            }
+    base = result["codecs"]["json_indent"]
+    for r in result["codecs"].values():
+        r["size_vs_json"] = round(r["bytes_total"] / base["bytes_total"], 3)
+        r["load_vs_json"] = round(r["load_p50_ms"] / base["load_p50_ms"], 3) if base["load_p50_ms"] else None
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import hashlib
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================
+# FAKE OPENAI (Responses API)
+# =========================
+# Локальная подмена POST /v1/responses для нагрузочных прогонов без токенов:
+#   - text.format=json_object → JSON вопроса по контракту App.py (question/type/options/analysis_update),
+#   - иначе → текст мастер-отчёта,
+#   - stream=true → SSE (response.created / output_text.delta / completed),
+#   - задержки: логнормальное распределение полного ответа + отдельно TTFT,
+#   - ошибки: доля 429/500 и доля "битого" JSON,
+#   - usage: cached_tokens растут, когда первый (системный) блок уже встречался.
+#
+#   python -m bench.fake_openai --port 8765 --latency-ms 600 --ttft-ms 250
+
+POTS = ["Сапфир","Гелиодор","Аметист","Изумруд","Гранат","Рубин","Янтарь","Шунгит","Цитрин"]
+COLS = ["perception","motivation","tool","result"]
+
+DEFAULTS = {
+    "latency_ms": 600.0,      # медиана полного ответа (без стрима)
+    "latency_sigma": 0.5,     # sigma логнормального распределения
+    "ttft_ms": 250.0,         # медиана времени до первого токена (стрим)
+    "chunk_chars": 12,        # размер дельты в стриме
+    "error_rate": 0.0,        # доля ответов 429/500
+    "malformed_rate": 0.0,    # доля ответов с битым JSON
+    "report_factor": 3.0,     # мастер-отчёт во столько раз дольше вопроса
+    "chars_per_token": 3.0,
+    "seed": None,
+}
+
+
+def lognormal_ms(rng: random.Random, median_ms: float, sigma: float) -> float:
+    if median_ms <= 0:
+        return 0.0
+    return rng.lognormvariate(math.log(median_ms), sigma)
+
+
+class FakeState:
+    def __init__(self, cfg: dict):
+        self.cfg = {**DEFAULTS, **(cfg or {})}
+        self.rng = random.Random(self.cfg["seed"])
+        self.lock = threading.Lock()
+        self.prefixes = set()
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0, "malformed": 0}
+
+    def draw(self, fn, *args):
+        # random.Random не потокобезопасен для воспроизводимости — под замком
+        with self.lock:
+            return fn(self.rng, *args)
+
+    def count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def cached_tokens(self, messages: list) -> int:
+        # провайдер кэширует стабильный префикс: первый блок сообщений
+        if not messages:
+            return 0
+        first = json.dumps(messages[0], ensure_ascii=False, sort_keys=True)
+        fp = hashlib.sha256(first.encode("utf-8")).hexdigest()
+        with self.lock:
+            hit = fp in self.prefixes
+            self.prefixes.add(fp)
+        return int(len(first) / self.cfg["chars_per_token"]) if hit else 0
+
+
+def _step_index(messages: list) -> int:
+    for m in reversed(messages or []):
+        c = m.get("content") if isinstance(m, dict) else None
+        if isinstance(c, str):
+            hit = re.search(r'"step_index":\s*(\d+)', c)
+            if hit:
+                return int(hit.group(1))
+    return 0
+
+
+def fake_question(rng: random.Random, step_index: int) -> dict:
+    pots = rng.sample(POTS, 3)
+    conf = min(0.95, 0.12 + 0.07 * step_index + rng.uniform(-0.05, 0.05))
+    single = rng.random() < 0.8
+    return {
+        "question": f"Шаг {step_index + 1}: что из этого ближе всего к тому, как вы обычно действуете?",
+        "type": "single" if single else "text",
+        "options": [f"Вариант {c}: {p}" for c, p in zip("АБВ", pots)] + ["Другое (напишу)"] if single else [],
+        "analysis_update": {
+            "scores_delta": {p: round(rng.uniform(0.05, 0.4), 3) for p in pots},
+            "col_scores_delta": {col: {rng.choice(pots): round(rng.uniform(0.05, 0.3), 3)} for col in COLS},
+            "positions_guess": {"p1": pots[0], "p2": None, "p3": None},
+            "confidence": {p: round(max(conf - i * 0.03, 0.0), 3) for i, p in enumerate(["p1","p2","p3"])},
+            "notes_for_master": "fake",
+        },
+    }
+
+
+def fake_report(rng: random.Random) -> str:
+    pots = rng.sample(POTS, 3)
+    return (
+        "1) Позиции: " + ", ".join(f"p{i + 1} — {p}" for i, p in enumerate(pots)) + ".\n"
+        "2) Сильные стороны и риски — по колонкам восприятие/мотивация/инструмент/результат.\n"
+        "3) Гипотезы для проверки на встрече.\n"
+    )
+
+
+def response_object(model: str, text: str, usage: dict, status: str = "completed") -> dict:
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": status,
+        "model": model,
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }] if text is not None else [],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": usage,
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+    disable_nagle_algorithm = True  # иначе мелкие записи SSE ждут delayed ACK (~40 мс)
+    state: FakeState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, code: int, obj: dict):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _sse(self, event: str, obj: dict):
+        obj = {"type": event, **obj}
+        self._chunk(f"event: {event}\ndata: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/v1/health"):
+            with self.state.lock:
+                return self._json(200, {"ok": True, **self.state.stats})
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/responses"):
+            return self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+        st_ = self.state
+        cfg = st_.cfg
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0) or 0)) or b"{}")
+        except Exception:
+            return self._json(400, {"error": {"message": "bad json", "type": "invalid_request_error"}})
+        st_.count("requests")
+
+        messages = req.get("input") or []
+        model = req.get("model", "fake")
+        is_question = ((req.get("text") or {}).get("format") or {}).get("type") == "json_object"
+        stream = bool(req.get("stream"))
+
+        total_ms = st_.draw(lognormal_ms, cfg["latency_ms"], cfg["latency_sigma"])
+        if not is_question:
+            total_ms *= cfg["report_factor"]
+
+        roll = st_.draw(lambda r: r.random())
+        if roll < cfg["error_rate"]:
+            st_.count("errors")
+            time.sleep(total_ms / 1000 * 0.2)
+            code = 429 if st_.draw(lambda r: r.random()) < 0.5 else 500
+            return self._json(code, {"error": {
+                "message": "fake: rate limited" if code == 429 else "fake: server error",
+                "type": "rate_limit_error" if code == 429 else "server_error",
+            }})
+
+        if is_question:
+            text = json.dumps(st_.draw(fake_question, _step_index(messages)), ensure_ascii=False)
+            if roll < cfg["error_rate"] + cfg["malformed_rate"]:
+                st_.count("malformed")
+                text = text[: len(text) // 2]
+        else:
+            text = st_.draw(fake_report)
+
+        prompt_chars = sum(len(m.get("content", "")) for m in messages if isinstance(m, dict))
+        inp = int(prompt_chars / cfg["chars_per_token"])
+        out = max(1, int(len(text) / cfg["chars_per_token"]))
+        usage = {
+            "input_tokens": inp,
+            "input_tokens_details": {"cached_tokens": min(st_.cached_tokens(messages), inp)},
+            "output_tokens": out,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": inp + out,
+        }
+
+        if not stream:
+            time.sleep(total_ms / 1000)
+            return self._json(200, response_object(model, text, usage))
+
+        st_.count("streamed")
+        ttft_ms = min(st_.draw(lognormal_ms, cfg["ttft_ms"], cfg["latency_sigma"]), total_ms)
+        step = max(1, int(cfg["chunk_chars"]))
+        parts = [text[i:i + step] for i in range(0, len(text), step)] or [""]
+        gap = max(total_ms - ttft_ms, 0) / 1000 / len(parts)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        resp = response_object(model, None, None, "in_progress")
+        item_id = f"msg_{uuid.uuid4().hex}"
+        seq = 0
+        self._sse("response.created", {"response": resp, "sequence_number": seq})
+        time.sleep(ttft_ms / 1000)
+        for part in parts:
+            seq += 1
+            self._sse("response.output_text.delta", {
+                "item_id": item_id, "output_index": 0, "content_index": 0,
+                "delta": part, "logprobs": [], "sequence_number": seq,
+            })
+            time.sleep(gap)
+        seq += 1
+        self._sse("response.output_text.done", {
+            "item_id": item_id, "output_index": 0, "content_index": 0,
+            "text": text, "logprobs": [], "sequence_number": seq,
+        })
+        done = response_object(model, text, usage)
+        done["id"] = resp["id"]
+        self._sse("response.completed", {"response": done, "sequence_number": seq + 1})
+        self._chunk(b"")
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # клиент закрыл keep-alive соединение — это не ошибка сервера
+        pass
+
+
+def start_server(cfg: dict = None, host: str = "127.0.0.1", port: int = 0):
+    # поднимает сервер в фоне; возвращает (server, base_url) — base_url для OpenAI(base_url=...)
+    handler = type("FakeHandler", (Handler,), {"state": FakeState(cfg)})
+    server = Server((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_server_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--latency-ms", type=float, default=DEFAULTS["latency_ms"])
+    ap.add_argument("--latency-sigma", type=float, default=DEFAULTS["latency_sigma"])
+    ap.add_argument("--ttft-ms", type=float, default=DEFAULTS["ttft_ms"])
+    ap.add_argument("--chunk-chars", type=int, default=DEFAULTS["chunk_chars"])
+    ap.add_argument("--error-rate", type=float, default=DEFAULTS["error_rate"])
+    ap.add_argument("--malformed-rate", type=float, default=DEFAULTS["malformed_rate"])
+    ap.add_argument("--report-factor", type=float, default=DEFAULTS["report_factor"])
+    ap.add_argument("--seed", type=int, default=None)
+
+
+def server_cfg(args) -> dict:
+    return {k: getattr(args, k) for k in DEFAULTS if k != "chars_per_token"}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Локальная подмена OpenAI Responses API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    add_server_args(ap)
+    args = ap.parse_args()
+    server, url = start_server(server_cfg(args), args.host, args.port)
+    print(f"fake OpenAI: {url}  (config.json → openai.base_url)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,282 @@
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from knowledge_index import build_index
+from prompting import PrefixGuard, add_usage
+from openai_pool import make_openai_client
+from response_cache import ResponseCache
+from scheduler import Scheduler
+from question_bank import build_bank
+from resilience import ResilientCaller, ModelUnavailable
+from metrics import METRICS
+import budget
+from interview import (
+    STEPS, new_state, current_step, make_deps, record_answer, confident_enough,
+    call_ai_next_question, stream_ai_next_question, call_ai_master_report,
+    use_bank, can_fallback, bank_question, build_final_payload,
+)
+from bench.fake_openai import start_server, add_server_args, server_cfg
+
+# =========================
+# LOAD TEST (headless interview flow)
+# =========================
+# N параллельных "клиентов" проходят весь STEPS (тот же код сборки промпта,
+# скоринга и стопа, что и в App.py) и мастер-отчёт. По умолчанию поднимается
+# встроенный bench/fake_openai.py; --base-url — внешний сервер.
+#
+#   python -m bench.loadtest --clients 16 --sessions 64
+#   python -m bench.loadtest --clients 8 --no-stream --out data/bench.json
+#
+# Итог — JSON: p50/p95/p99 по шагам, TTFT, мастер-отчёт, sessions/sec, ошибки.
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_config():
+    p = ROOT / "config.json"
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+
+
+def percentiles(xs: list) -> dict:
+    # nearest-rank; миллисекунды
+    if not xs:
+        return {"n": 0}
+    s = sorted(xs)
+
+    def pick(q):
+        return round(s[min(len(s) - 1, max(0, int(q * len(s) + 0.999999) - 1))] * 1000, 1)
+
+    return {
+        "n": len(s),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(s[-1] * 1000, 1),
+        "mean": round(sum(s) / len(s) * 1000, 1),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.steps = {}
+        self.ttft = []
+        self.report = []
+        self.session = []
+        self.errors = {}
+        self.counters = {}
+        self.usage = {}
+        self.ok = 0
+        self.failed = 0
+
+    def add(self, bucket: str, sec: float):
+        with self.lock:
+            getattr(self, bucket).append(sec)
+
+    def step(self, step_id: str, sec: float):
+        with self.lock:
+            self.steps.setdefault(step_id, []).append(sec)
+
+    def error(self, where: str, e: Exception):
+        with self.lock:
+            k = f"{where}: {type(e).__name__}"
+            self.errors[k] = self.errors.get(k, 0) + 1
+
+    def count(self, key: str):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def tokens(self, u: dict):
+        with self.lock:
+            add_usage(self.usage, u)
+
+
+def run_session(n: int, client, model: str, deps: dict, args, rec: Recorder):
+    rng = random.Random(n)
+    state = new_state()
+    state["client_name"] = f"bench-{n}"
+    state["client_request"] = "хочу понять, где моя реализация"
+    conf_stop = deps["limits"]["confidence_stop"]
+    max_q = deps["limits"]["max_questions_total"]
+    t_session = time.perf_counter()
+
+    adaptive = args.adaptive_cfg
+    while current_step(state) is not None and state["q_count"] < max_q and not confident_enough(state, conf_stop):
+        step = current_step(state)
+        t0 = time.perf_counter()
+        try:
+            if use_bank(deps, step["id"], state):
+                q, info = bank_question(deps, step["id"], state)
+                rec.count("bank")
+            elif args.stream:
+                try:
+                    chunks, finish, close = stream_ai_next_question(client, model, step["id"], step["goal"], state, deps)
+                    try:
+                        for _ in chunks():
+                            rec.add("ttft", time.perf_counter() - t0)
+                            break
+                        q, info = finish()
+                    finally:
+                        close()
+                except ModelUnavailable:
+                    raise
+                except Exception:
+                    # как в App.py: оборванный/битый поток → обычный вызов с повторами
+                    if deps["resilience"] is None:
+                        raise
+                    q, info = call_ai_next_question(client, model, step["id"], step["goal"], state, deps)
+            else:
+                q, info = call_ai_next_question(client, model, step["id"], step["goal"], state, deps)
+        except Exception as e:
+            if not can_fallback(deps, step["id"]):
+                rec.error(step["id"], e)
+                with rec.lock:
+                    rec.failed += 1
+                return
+            # как в App.py: модель недоступна — шаг из банка
+            q, info = bank_question(deps, step["id"], state)
+            rec.count("bank_fallback")
+        rec.step(step["id"], time.perf_counter() - t0)
+        rec.tokens(info.get("usage"))
+
+        opts = [o for o in (q.get("options") or []) if isinstance(o, str)]
+        ans = rng.choice(opts) if q.get("type") == "single" and opts else "отвечаю своими словами"
+        if args.think_ms:
+            time.sleep(rng.uniform(0, args.think_ms) / 1000)
+        record_answer(q, ans, state, adaptive, max_q, deps["history"])
+
+    if args.report:
+        payload = build_final_payload(state, "bench", model)
+        t0 = time.perf_counter()
+        try:
+            _, usage = call_ai_master_report(client, model, payload, deps["guard"], deps["cache"], deps["scheduler"],
+                                             deps["resilience"], deps["history"], deps["budget"])
+        except Exception as e:
+            rec.error("master_report", e)
+            with rec.lock:
+                rec.failed += 1
+            return
+        rec.add("report", time.perf_counter() - t0)
+        rec.tokens(usage)
+
+    rec.add("session", time.perf_counter() - t_session)
+    with rec.lock:
+        rec.ok += 1
+
+
+def main(argv=None):
+    cfg = load_config()
+    METRICS.configure(cfg.get("metrics", {}).get("pricing"))
+    ocfg = cfg.get("openai", {})
+    flow = cfg.get("flow", {})
+    kcfg = cfg.get("knowledge", {})
+
+    ap = argparse.ArgumentParser(description="Нагрузочный прогон интервью")
+    ap.add_argument("--clients", type=int, default=8, help="параллельных клиентов")
+    ap.add_argument("--sessions", type=int, default=0, help="всего сессий (по умолчанию = clients)")
+    ap.add_argument("--stream", dest="stream", action="store_true", default=bool(ocfg.get("stream", True)))
+    ap.add_argument("--no-stream", dest="stream", action="store_false")
+    ap.add_argument("--no-report", dest="report", action="store_false", default=True)
+    ap.add_argument("--think-ms", type=float, default=0.0, help="пауза клиента перед ответом (равномерно 0..think)")
+    ap.add_argument("--base-url", default="", help="внешний сервер; без него поднимается встроенный fake")
+    ap.add_argument("--model", default=ocfg.get("model", "gpt-4.1-mini"))
+    ap.add_argument("--cache", action="store_true", help="кэш ответов в памяти (как в приложении)")
+    ap.add_argument("--sched", action="store_true", help="очередь вызовов модели (scheduler.py)")
+    ap.add_argument("--sched-concurrency", type=int, default=16)
+    ap.add_argument("--rpm", type=float, default=0, help="лимит запросов/мин для очереди (0 — без лимита)")
+    ap.add_argument("--tpm", type=float, default=0, help="лимит токенов/мин для очереди (0 — без лимита)")
+    ap.add_argument("--adaptive", action="store_true", help="пропуск шагов / уточнения по разрыву баллов (adaptive.py)")
+    ap.add_argument("--bank", action="store_true", help="сфера/тип из банка вопросов + фолбэк (question_bank.py)")
+    ap.add_argument("--resilience", action="store_true", help="повторы / хедж / breaker (resilience.py)")
+    ap.add_argument("--out", default="", help="куда записать JSON с результатом")
+    add_server_args(ap)
+    args = ap.parse_args(argv)
+    total = args.sessions or args.clients
+    args.adaptive_cfg = {**(flow.get("adaptive") or {}), "enabled": True} if args.adaptive else None
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_server(server_cfg(args))
+
+    http_cfg = {**(ocfg.get("http") or {}), "max_connections": max(args.clients * 2, 16)}
+    if args.resilience:
+        http_cfg["max_retries"] = 0
+    client, http_client, stats = make_openai_client("sk-bench", http_cfg, base_url)
+    if client is None:
+        raise SystemExit(f"openai недоступен: {stats.last_error}")
+
+    index = build_index(ROOT / kcfg.get("path", "knowledge/positions.md"),
+                        ROOT / kcfg.get("index_cache", "data/knowledge_index.json"))
+    deps = make_deps(
+        index,
+        PrefixGuard(ocfg.get("prefix_fingerprints")),
+        int(flow.get("max_questions_total", 24)),
+        float(flow.get("confidence_stop", 0.78)),
+        int(kcfg.get("budget_tokens", 3500)),
+        int(kcfg.get("top_k", 8)),
+        ResponseCache() if args.cache else None,
+        Scheduler(args.sched_concurrency, args.rpm, args.tpm) if args.sched else None,
+        ResilientCaller(cfg.get("resilience")) if args.resilience else None,
+        build_bank(ROOT / kcfg.get("path", "knowledge/positions.md"),
+                   ROOT / cfg.get("question_bank", {}).get("path", "data/question_bank.json")) if args.bank else None,
+        cfg.get("question_bank"),
+        cfg.get("history"),
+        budget.configure(cfg.get("budget")),
+    )
+
+    rec = Recorder()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as ex:
+        list(ex.map(lambda n: run_session(n, client, args.model, deps, args, rec), range(total)))
+    wall = time.perf_counter() - t0
+
+    all_steps = [x for xs in rec.steps.values() for x in xs]
+    result = {
+        "config": {
+            "clients": args.clients, "sessions": total, "stream": args.stream, "report": args.report,
+            "think_ms": args.think_ms, "cache": args.cache, "resilience": args.resilience, "bank": args.bank,
+            "adaptive": args.adaptive,
+            "scheduler": {"concurrency": args.sched_concurrency, "rpm": args.rpm, "tpm": args.tpm} if args.sched else None, "base_url": args.base_url or "embedded", "model": args.model,
+            "server": server_cfg(args) if server else None,
+        },
+        "wall_sec": round(wall, 3),
+        "sessions_ok": rec.ok,
+        "sessions_failed": rec.failed,
+        "sessions_per_sec": round(rec.ok / wall, 3) if wall else 0.0,
+        "questions_per_sec": round(len(all_steps) / wall, 3) if wall else 0.0,
+        "step_all": percentiles(all_steps),
+        "steps": {k: percentiles(rec.steps[k]) for k in
+                  [s["id"] for s in STEPS if s["id"] in rec.steps] + sorted(set(rec.steps) - {s["id"] for s in STEPS})},
+        "questions_per_session": round(len(all_steps) / max(rec.ok + rec.failed, 1), 2),
+        "ttft": percentiles(rec.ttft),
+        "master_report": percentiles(rec.report),
+        "session": percentiles(rec.session),
+        "errors": rec.errors,
+        "counters": rec.counters,
+        "usage": rec.usage,
+        "pool": stats.snapshot(http_client),
+        "cache": deps["cache"].snapshot() if deps["cache"] else None,
+        "scheduler": deps["scheduler"].snapshot() if deps["scheduler"] else None,
+        "resilience": deps["resilience"].snapshot() if deps["resilience"] else None,
+        # этапы изнутри (сборка промпта, очередь, первый байт, разбор JSON, баллы) и стоимость
+        "metrics": METRICS.snapshot(),
+    }
+    if server:
+        server.shutdown()
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
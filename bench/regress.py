@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import scoring
+import session_codec
+from knowledge_index import build_index
+from prompting import PrefixGuard, add_usage
+from openai_pool import make_openai_client
+from question_bank import build_bank
+from resilience import ResilientCaller
+from metrics import METRICS
+import budget
+from interview import (
+    STEPS, new_state, current_step, make_deps, record_answer, confident_enough,
+    call_ai_next_question, use_bank, bank_question,
+)
+from bench.fake_openai import start_server, add_server_args, server_cfg
+from bench.loadtest import load_config, percentiles
+
+# =========================
+# REGRESSION REPLAY (сохранённые сессии заново через модель)
+# =========================
+# Сохранённые сессии проигрываются текущим кодом: шаги STEPS/adaptive, сборка
+# промпта, call_ai_next_question, apply_analysis_update, стоп по CONF_STOP.
+# "Клиент" отвечает записанными ответами: для шага берётся следующий ответ
+# с тем же step_id. Если новый план дошёл до шага, на который ответа нет,
+# сессия останавливается ("diverged") и сравнивается как есть.
+# Модель:
+#   - встроенный bench/fake_openai.py или --base-url (в т.ч. настоящий API);
+#   - --cassette FILE — записанные ответы, ключ "сессия/шаг/номер"; промпт,
+#     отличающийся от записанного, всё равно получает тот же ответ, но считается
+#     в prompt_changed — так видно, чего коснулась правка промпта;
+#     --tape-latency — с записанной задержкой, чтобы латентность сравнивалась
+#     с отчётом, снятым вживую;
+#   - --record FILE — записать кассету с текущего бэкенда.
+# Итог (JSON): латентность и токены по шагам, вопросов на сессию, совпадение
+# positions_guess и top-6 с исходной сессией. С --baseline — сравнение с прошлым
+# отчётом и код выхода 1, если порог нарушен (гейт для правок STEPS, промпта,
+# confidence_stop).
+#
+#   python -m bench.regress --latency-ms 50 --record data/bench/cassette.jsonl --out data/bench/base.json
+#   python -m bench.regress --cassette data/bench/cassette.jsonl --baseline data/bench/base.json
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def prompt_hash(messages) -> str:
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# =========================
+# CASSETTE
+# =========================
+class Cassette:
+    # обёртка над client.responses.create: запись и/или воспроизведение;
+    # ключ вызова задаёт прогон (set_key) — в своём потоке
+    def __init__(self, inner=None, replay: dict = None, record_path: str = "", tape_latency: bool = False):
+        self.inner = inner
+        self.tape_latency = tape_latency
+        self.tapes = replay or {}
+        self.record_path = record_path
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "prompt_changed": 0, "recorded": 0}
+        self.responses = self
+        if record_path:
+            Path(record_path).parent.mkdir(parents=True, exist_ok=True)
+            Path(record_path).write_text("", encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str, inner=None, record_path: str = "", tape_latency: bool = False):
+        tapes = {}
+        for line in Path(path).read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                t = json.loads(line)
+                tapes[t["key"]] = t
+        return cls(inner, tapes, record_path, tape_latency)
+
+    def set_key(self, key: str):
+        self.local.key = key
+
+    def count(self, k: str):
+        with self.lock:
+            self.stats[k] += 1
+
+    def create(self, model: str, input: list, **kw):
+        key, ph = getattr(self.local, "key", ""), prompt_hash(input)
+        tape = self.tapes.get(key)
+        if tape is not None:
+            self.count("hits")
+            if tape.get("prompt") != ph:
+                self.count("prompt_changed")
+            if self.tape_latency:
+                time.sleep(tape.get("latency_ms", 0) / 1000)
+            return fake_response(tape["text"], tape.get("usage") or {})
+        self.count("misses")
+        if self.inner is None:
+            raise KeyError(f"нет записи в кассете: {key}")
+        t0 = time.perf_counter()
+        r = self.inner.responses.create(model=model, input=input, **kw)
+        if self.record_path:
+            u = getattr(r, "usage", None)
+            det = getattr(u, "input_tokens_details", None)
+            line = {"key": key, "prompt": ph, "model": model, "text": getattr(r, "output_text", "") or "",
+                    "usage": {"input_tokens": int(getattr(u, "input_tokens", 0) or 0),
+                              "cached_tokens": int(getattr(det, "cached_tokens", 0) or 0),
+                              "output_tokens": int(getattr(u, "output_tokens", 0) or 0)},
+                    "latency_ms": round((time.perf_counter() - t0) * 1000, 1)}
+            with self.lock:
+                with open(self.record_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                self.stats["recorded"] += 1
+        return r
+
+
+def fake_response(text: str, usage: dict):
+    # минимум полей, которые читают response_text/usage_from_response
+    return SimpleNamespace(
+        output_text=text,
+        usage=SimpleNamespace(
+            input_tokens=usage.get("input_tokens", 0),
+            input_tokens_details=SimpleNamespace(cached_tokens=usage.get("cached_tokens", 0)),
+            output_tokens=usage.get("output_tokens", 0),
+        ),
+    )
+
+
+# =========================
+# REPLAY
+# =========================
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.steps = {}
+        self.usage = {}
+        self.errors = {}
+
+    def step(self, step_id: str, sec: float, usage: dict):
+        with self.lock:
+            self.steps.setdefault(step_id, []).append(sec)
+            add_usage(self.usage, usage)
+
+    def error(self, e: Exception):
+        with self.lock:
+            k = type(e).__name__
+            self.errors[k] = self.errors.get(k, 0) + 1
+
+
+def recorded_answers(payload: dict) -> dict:
+    out = {}
+    for a in payload.get("answers") or []:
+        if isinstance(a, dict) and a.get("step_id"):
+            out.setdefault(a["step_id"], []).append(str(a.get("answer", "")))
+    return out
+
+
+def top6_of(payload: dict) -> list:
+    return [t.get("pot") for t in payload.get("top6") or [] if isinstance(t, dict)]
+
+
+def replay_session(payload: dict, client, model: str, deps: dict, adaptive, rec: Recorder) -> dict:
+    meta = payload.get("meta") or {}
+    sid = meta.get("session_id", "")
+    answers = recorded_answers(payload)
+    used = {}
+    state = new_state(sid)
+    state["client_name"] = meta.get("name", "")
+    state["client_request"] = meta.get("request", "")
+    conf_stop = deps["limits"]["confidence_stop"]
+    max_q = deps["limits"]["max_questions_total"]
+    out = {"session_id": sid, "diverged_at": None, "error": None, "model_calls": 0, "in_options": 0}
+
+    while current_step(state) is not None and state["q_count"] < max_q and not confident_enough(state, conf_stop):
+        step = current_step(state)
+        n = used.get(step["id"], 0)
+        if n >= len(answers.get(step["id"], [])):
+            out["diverged_at"] = step["id"]
+            break
+        t0 = time.perf_counter()
+        try:
+            if use_bank(deps, step["id"], state):
+                q, info = bank_question(deps, step["id"], state)
+            else:
+                if isinstance(client, Cassette):
+                    client.set_key(f"{sid}/{step['id']}/{n}")
+                q, info = call_ai_next_question(client, model, step["id"], step["goal"], state, deps)
+                out["model_calls"] += 1
+        except Exception as e:
+            rec.error(e)
+            out["error"] = f"{step['id']}: {type(e).__name__}"
+            break
+        rec.step(step["id"], time.perf_counter() - t0, info.get("usage"))
+        ans = answers[step["id"]][n]
+        used[step["id"]] = n + 1
+        out["in_options"] += ans in (q.get("options") or [])
+        record_answer(q, ans, state, adaptive, max_q, deps["history"])
+
+    orig_pos = payload.get("positions_guess") or {}
+    orig_top = top6_of(payload)
+    new_top = [p for p, _ in scoring.topk(state["score_matrix"], "total", 6)]
+    out.update({
+        "questions": {"original": len(payload.get("answers") or []), "replay": state["q_count"]},
+        "positions": {p: [orig_pos.get(p), state["positions"].get(p)] for p in ("p1", "p2", "p3")},
+        "agree": {p: orig_pos.get(p) == state["positions"].get(p) for p in ("p1", "p2", "p3")},
+        "top1": bool(orig_top and new_top and orig_top[0] == new_top[0]),
+        "top6_overlap": round(len(set(orig_top) & set(new_top)) / max(len(orig_top), 1), 4),
+    })
+    return out
+
+
+def summarize(rec: Recorder, sessions: list, wall: float) -> dict:
+    n = max(len(sessions), 1)
+    all_steps = [x for xs in rec.steps.values() for x in xs]
+    tok = rec.usage.get("input_tokens", 0) + rec.usage.get("output_tokens", 0)
+    return {
+        "wall_sec": round(wall, 3),
+        "sessions": len(sessions),
+        "completed": sum(1 for s in sessions if not s["diverged_at"] and not s["error"]),
+        "diverged": sum(1 for s in sessions if s["diverged_at"]),
+        "failed": sum(1 for s in sessions if s["error"]),
+        "errors": rec.errors,
+        "step_all": percentiles(all_steps),
+        "steps": {k: percentiles(rec.steps[k]) for k in
+                  [s["id"] for s in STEPS if s["id"] in rec.steps] + sorted(set(rec.steps) - {s["id"] for s in STEPS})},
+        "questions_per_session": {
+            "original": round(sum(s["questions"]["original"] for s in sessions) / n, 2),
+            "replay": round(sum(s["questions"]["replay"] for s in sessions) / n, 2),
+        },
+        "model_calls_per_session": round(sum(s["model_calls"] for s in sessions) / n, 2),
+        "tokens_per_session": round(tok / n, 1),
+        "usage": rec.usage,
+        "answer_in_options": round(sum(s["in_options"] for s in sessions)
+                                   / max(sum(s["questions"]["replay"] for s in sessions), 1), 4),
+        "agreement": {
+            **{p: round(sum(s["agree"][p] for s in sessions) / n, 4) for p in ("p1", "p2", "p3")},
+            "all3": round(sum(all(s["agree"].values()) for s in sessions) / n, 4),
+            "top1": round(sum(s["top1"] for s in sessions) / n, 4),
+            "top6_overlap": round(sum(s["top6_overlap"] for s in sessions) / n, 4),
+        },
+    }
+
+
+# =========================
+# GATE
+# =========================
+def gate(result: dict, base: dict, args) -> dict:
+    # относительно прошлого отчёта: латентность и токены не выросли больше
+    # допуска, совпадение с исходными сессиями не упало больше допуска
+    checks = []
+
+    def check(name, value, limit, ok):
+        checks.append({"check": name, "value": value, "limit": limit, "ok": bool(ok)})
+
+    cur, ref = result["step_all"].get("p95"), base.get("step_all", {}).get("p95")
+    if cur is not None and ref:
+        lim = round(ref * (1 + args.max_latency_regress), 1)
+        check("step_all.p95_ms", cur, lim, cur <= lim)
+    cur, ref = result["tokens_per_session"], base.get("tokens_per_session")
+    if ref:
+        lim = round(ref * (1 + args.max_token_regress), 1)
+        check("tokens_per_session", cur, lim, cur <= lim)
+    check("failed", result["failed"], base.get("failed", 0), result["failed"] <= base.get("failed", 0))
+    for k in ("all3", "top6_overlap"):
+        cur, ref = result["agreement"][k], base.get("agreement", {}).get(k)
+        if ref is not None:
+            lim = round(ref - args.max_agreement_drop, 4)
+            check(f"agreement.{k}", cur, lim, cur >= lim)
+    return {"baseline": args.baseline, "passed": all(c["ok"] for c in checks), "checks": checks}
+
+
+def main(argv=None):
+    cfg = load_config()
+    METRICS.configure(cfg.get("metrics", {}).get("pricing"))
+    ocfg, flow, kcfg, bcfg = cfg.get("openai", {}), cfg.get("flow", {}), cfg.get("knowledge", {}), cfg.get("question_bank", {})
+    acfg = flow.get("adaptive") or {}
+
+    ap = argparse.ArgumentParser(description="Регрессионный прогон сохранённых сессий через модель")
+    ap.add_argument("--sessions-dir", default=str(ROOT / cfg.get("storage", {}).get("data_dir", "data/sessions")))
+    ap.add_argument("--limit", type=int, default=0, help="первые N сессий (по имени файла)")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--model", default=ocfg.get("model", "gpt-4.1-mini"))
+    ap.add_argument("--base-url", default="", help="внешний сервер/API; без него — встроенный fake")
+    ap.add_argument("--cassette", default="", help="воспроизвести записанные ответы (без сети)")
+    ap.add_argument("--record", default="", help="записать кассету с текущего бэкенда")
+    ap.add_argument("--tape-latency", action="store_true", help="кассета отвечает с записанной задержкой")
+    ap.add_argument("--adaptive", dest="adaptive", action="store_true", default=bool(acfg.get("enabled", True)))
+    ap.add_argument("--no-adaptive", dest="adaptive", action="store_false")
+    ap.add_argument("--bank", dest="bank", action="store_true", default=bool(bcfg.get("enabled", True)))
+    ap.add_argument("--no-bank", dest="bank", action="store_false")
+    ap.add_argument("--resilience", action="store_true")
+    ap.add_argument("--details", action="store_true", help="результат по каждой сессии")
+    ap.add_argument("--baseline", default="", help="прошлый отчёт для гейта")
+    ap.add_argument("--max-latency-regress", type=float, default=0.2, help="допуск роста p95 шага (доля)")
+    ap.add_argument("--max-token-regress", type=float, default=0.1, help="допуск роста токенов на сессию (доля)")
+    ap.add_argument("--max-agreement-drop", type=float, default=0.05, help="допуск падения совпадения")
+    ap.add_argument("--out", default="")
+    add_server_args(ap)
+    args = ap.parse_args(argv)
+
+    d = Path(args.sessions_dir)
+    paths = sorted(p for x in session_codec.SUFFIX.values() for p in d.glob(f"*{x}"))
+    payloads = []
+    for p in paths:
+        try:
+            payloads.append(session_codec.loads(p.read_bytes()))
+        except Exception:
+            continue
+        if args.limit and len(payloads) >= args.limit:
+            break
+    if not payloads:
+        raise SystemExit(f"нет сессий в {d}")
+
+    server, inner, http_client, stats = None, None, None, None
+    if not args.cassette or args.record:
+        base_url = args.base_url
+        if not base_url:
+            server, base_url = start_server(server_cfg(args))
+        http_cfg = {**(ocfg.get("http") or {}), "max_connections": max(args.workers * 2, 16)}
+        if args.resilience:
+            http_cfg["max_retries"] = 0
+        key = os.getenv("OPENAI_API_KEY", "") if args.base_url else "sk-bench"
+        inner, http_client, stats = make_openai_client(key or "sk-bench", http_cfg, base_url)
+        if inner is None:
+            raise SystemExit(f"openai недоступен: {stats.last_error}")
+    if args.cassette:
+        client = Cassette.load(args.cassette, inner, args.record, args.tape_latency)
+    elif args.record:
+        client = Cassette(inner, record_path=args.record)
+    else:
+        client = inner
+
+    index = build_index(ROOT / kcfg.get("path", "knowledge/positions.md"),
+                        ROOT / kcfg.get("index_cache", "data/knowledge_index.json"))
+    deps = make_deps(
+        index,
+        PrefixGuard(ocfg.get("prefix_fingerprints")),
+        int(flow.get("max_questions_total", 24)),
+        float(flow.get("confidence_stop", 0.78)),
+        int(kcfg.get("budget_tokens", 3500)),
+        int(kcfg.get("top_k", 8)),
+        None,  # без кэша ответов: каждый шаг — вызов
+        None,
+        ResilientCaller(cfg.get("resilience")) if args.resilience else None,
+        build_bank(ROOT / kcfg.get("path", "knowledge/positions.md"),
+                   ROOT / bcfg.get("path", "data/question_bank.json")) if args.bank else None,
+        {k: v for k, v in bcfg.items() if k in ("serve_scope", "pot_margin", "fallback")},
+        cfg.get("history"),
+        budget.configure(cfg.get("budget")),
+    )
+    adaptive = {**acfg, "enabled": True} if args.adaptive else None
+
+    rec = Recorder()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as ex:
+        sessions = list(ex.map(lambda p: replay_session(p, client, args.model, deps, adaptive, rec), payloads))
+    wall = time.perf_counter() - t0
+
+    result = {
+        "config": {
+            "sessions_dir": str(d), "model": args.model, "adaptive": args.adaptive, "bank": args.bank,
+            "resilience": args.resilience, "max_questions_total": deps["limits"]["max_questions_total"],
+            "confidence_stop": deps["limits"]["confidence_stop"], "steps": [s["id"] for s in STEPS],
+            "backend": "cassette" if args.cassette else (args.base_url or "embedded"),
+            "server": server_cfg(args) if server else None,
+        },
+        **summarize(rec, sessions, wall),
+        "cassette": client.stats if isinstance(client, Cassette) else None,
+        "pool": stats.snapshot(http_client) if stats else None,
+        "metrics": METRICS.snapshot(),
+    }
+    if args.details:
+        result["details"] = sessions
+    if args.baseline:
+        result["gate"] = gate(result, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args)
+    if server:
+        server.shutdown()
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    if result.get("gate") and not result["gate"]["passed"]:
+        raise SystemExit(1)
+    return result
+
+
+if __name__ == "__main__":
+    main()
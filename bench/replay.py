@@ -0,0 +1,224 @@
+import json
+import random
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+import scoring
+import session_codec
+from adaptive import leaders, position_of
+from question_bank import build_bank
+from interview import (
+    new_state, current_step, record_answer, confident_enough, use_bank,
+)
+
+# =========================
+# REPLAY BENCHMARK (adaptive flow)
+# =========================
+# Сравнивает линейный план (все 12 шагов) и адаптивный (adaptive.py) на одних
+# и тех же ответах — без модели и без сети:
+#   - stored: сохранённые сессии data/sessions/*.neo|*.json; дельта каждого шага
+#     берётся из scores_by_step и проигрывается в порядке плана. Уточнение
+#     (refine), которого в записи нет, завершает прогон — оценка снизу;
+#   - synthetic: "клиент" с известными p1/p2/p3 отвечает на вопросы банка
+#     (с долей случайных ответов --noise); качество — доля угаданных позиций.
+# Итог — JSON: вопросов и вызовов модели на сессию, совпадение/точность позиций.
+#
+#   python -m bench.replay --synthetic 500 --noise 0.2
+#   python -m bench.replay --sessions-dir data/sessions
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_config():
+    p = ROOT / "config.json"
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+
+
+def guess_positions(state):
+    # p1/p2/p3 — лидер позиции по набранным за её шаги баллам
+    for pos in (1, 2, 3):
+        top = leaders(state, pos, 1)
+        state["positions"][f"p{pos}"] = top[0] if top else None
+
+
+def model_step(deps: dict, step_id: str, state) -> bool:
+    # пошёл бы шаг в модель в приложении (а не в банк)
+    return deps.get("bank") is None or not use_bank(deps, step_id, state)
+
+
+def run_flow(answer, deps: dict, adaptive, max_q: int, conf_stop: float):
+    # answer(step, state) → (q, ans) или None (ответа нет — прогон окончен)
+    state = new_state()
+    calls = 0
+    while current_step(state) is not None and state["q_count"] < max_q and not confident_enough(state, conf_stop):
+        step = current_step(state)
+        calls += model_step(deps, step["id"], state)
+        got = answer(step, state)
+        if got is None:
+            break
+        q, ans = got
+        record_answer(q, ans, state, adaptive, max_q)
+        pos = position_of(step["id"])
+        if pos:
+            top = leaders(state, pos, 1)
+            state["positions"][f"p{pos}"] = top[0] if top else None
+    guess_positions(state)
+    return state, calls
+
+
+# ---------- stored sessions ----------
+def stored_answers(payload: dict):
+    # step_id → analysis_update из разницы соседних снимков матрицы
+    answers = payload.get("answers") or []
+    mats = [np.asarray(x, dtype=np.float64) for x in payload.get("scores_by_step") or []]
+    if not answers or len(mats) != len(answers):
+        return None
+    out, prev = {}, scoring.empty()
+    for a, m in zip(answers, mats):
+        scores, col_scores = scoring.to_dicts(m - prev)
+        out.setdefault(a.get("step_id"), {
+            "q": {"question": a.get("question", ""), "analysis_update": {
+                "scores_delta": scores, "col_scores_delta": col_scores,
+            }},
+            "ans": a.get("answer", ""),
+        })
+        prev = m
+    return out
+
+
+def replay_stored(paths, deps, adaptive, max_q, conf_stop) -> dict:
+    res = {"sessions": 0, "questions": {"linear": 0, "adaptive": 0},
+           "model_calls": {"linear": 0, "adaptive": 0}, "tokens": {"linear": 0, "adaptive": 0},
+           "agree": 0, "positions": 0, "refine_unreplayable": 0}
+    for p in paths:
+        try:
+            payload = session_codec.loads(Path(p).read_bytes())
+        except Exception:
+            continue
+        recorded = stored_answers(payload)
+        if not recorded:
+            continue
+        usage = (payload.get("meta") or {}).get("usage") or {}
+        per_call = (usage.get("input_tokens", 0) + usage.get("output_tokens", 0)) / max(usage.get("calls", 0), 1)
+
+        def answer(step, state):
+            r = recorded.get(step["id"])
+            return (r["q"], r["ans"]) if r else None
+
+        base, base_calls = run_flow(answer, deps, None, max_q, conf_stop)
+        fast, fast_calls = run_flow(answer, deps, adaptive, max_q, conf_stop)
+        step = current_step(fast)
+        if step is not None and step["id"] not in recorded:
+            res["refine_unreplayable"] += 1
+        res["sessions"] += 1
+        for mode, st_, calls in (("linear", base, base_calls), ("adaptive", fast, fast_calls)):
+            res["questions"][mode] += st_["q_count"]
+            res["model_calls"][mode] += calls
+            res["tokens"][mode] += int(calls * per_call)
+        for k in ("p1", "p2", "p3"):
+            if base["positions"][k]:
+                res["positions"] += 1
+                res["agree"] += base["positions"][k] == fast["positions"][k]
+    return res
+
+
+# ---------- synthetic clients ----------
+def synthetic_answer(rng: random.Random, truth: list, noise: float, bank):
+    def answer(step, state):
+        q = bank.question(step["id"], state)
+        opts = q["bank_options"]
+        pos = position_of(step["id"])
+        right = [label for label, o in opts.items() if scoring.POT_INDEX[truth[pos - 1]] in o["pots"]]
+        if right and rng.random() >= noise:
+            return q, right[0]
+        return q, rng.choice(q["options"])  # в т.ч. "Другое" без совпадений
+    return answer
+
+
+def replay_synthetic(n: int, noise: float, seed: int, deps, adaptive, max_q, conf_stop) -> dict:
+    res = {"sessions": n, "noise": noise, "questions": {"linear": 0, "adaptive": 0},
+           "model_calls": {"linear": 0, "adaptive": 0}, "correct": {"linear": 0, "adaptive": 0},
+           "positions": 3 * n, "refine_steps": 0, "skipped_steps": 0}
+    for i in range(n):
+        truth = random.Random(seed + i).sample(scoring.POTS, 3)
+        for mode, cfg in (("linear", None), ("adaptive", adaptive)):
+            # одинаковые случайные ответы в обоих режимах — одним и тем же seed
+            rng = random.Random(seed * 7919 + i)
+            st_, calls = run_flow(synthetic_answer(rng, truth, noise, deps["bank"]), deps, cfg, max_q, conf_stop)
+            res["questions"][mode] += st_["q_count"]
+            res["model_calls"][mode] += calls
+            res["correct"][mode] += sum(st_["positions"][f"p{k + 1}"] == truth[k] for k in range(3))
+            if mode == "adaptive":
+                res["refine_steps"] += len(st_["extra_steps"])
+                res["skipped_steps"] += len(st_["skipped"])
+    return res
+
+
+def summarize(res: dict) -> dict:
+    n = max(res["sessions"], 1)
+    out = dict(res)
+    for key in ("questions", "model_calls", "tokens"):
+        if key in res:
+            out[f"{key}_per_session"] = {m: round(v / n, 2) for m, v in res[key].items()}
+    if "correct" in res:
+        out["accuracy"] = {m: round(v / max(res["positions"], 1), 4) for m, v in res["correct"].items()}
+    if "agree" in res:
+        out["agreement"] = round(res["agree"] / max(res["positions"], 1), 4)
+    q = res["questions"]
+    out["questions_saved_pct"] = round(100 * (1 - q["adaptive"] / q["linear"]), 1) if q["linear"] else 0.0
+    return out
+
+
+def main(argv=None):
+    cfg = load_config()
+    flow = cfg.get("flow", {})
+    kcfg = cfg.get("knowledge", {})
+    bcfg = cfg.get("question_bank", {})
+
+    ap = argparse.ArgumentParser(description="Линейный vs адаптивный план на одних и тех же ответах")
+    ap.add_argument("--sessions-dir", default="", help="сохранённые сессии (*.json)")
+    ap.add_argument("--synthetic", type=int, default=0, help="сколько синтетических клиентов")
+    ap.add_argument("--noise", type=float, default=0.2, help="доля случайных ответов синтетического клиента")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--skip-margin", type=float, default=None)
+    ap.add_argument("--refine-margin", type=float, default=None)
+    ap.add_argument("--no-bank", dest="bank", action="store_false", default=True,
+                    help="stored: считать все шаги вызовами модели")
+    ap.add_argument("--out", default="")
+    args = ap.parse_args(argv)
+
+    adaptive = {**(flow.get("adaptive") or {}), "enabled": True}
+    if args.skip_margin is not None:
+        adaptive["skip_margin"] = args.skip_margin
+    if args.refine_margin is not None:
+        adaptive["refine_margin"] = args.refine_margin
+    max_q = int(flow.get("max_questions_total", 24))
+    conf_stop = float(flow.get("confidence_stop", 0.78))
+
+    bank = build_bank(ROOT / kcfg.get("path", "knowledge/positions.md"),
+                      ROOT / bcfg.get("path", "data/question_bank.json"))
+    deps = {
+        "bank": bank if args.bank or args.synthetic else None,
+        "bank_cfg": {"serve_scope": True, "pot_margin": 1.0, "fallback": True, **bcfg},
+    }
+
+    result = {"config": {"adaptive": adaptive, "max_questions_total": max_q, "confidence_stop": conf_stop}}
+    if args.synthetic:
+        if bank is None:
+            raise SystemExit("нет базы знаний для банка вопросов")
+        result["synthetic"] = summarize(replay_synthetic(
+            args.synthetic, args.noise, args.seed, deps, adaptive, max_q, conf_stop))
+    if args.sessions_dir or not args.synthetic:
+        d = Path(args.sessions_dir or ROOT / cfg.get("storage", {}).get("data_dir", "data/sessions"))
+        result["stored"] = summarize(replay_stored(sorted(p for x in session_codec.SUFFIX.values() for p in d.glob(f"*{x}")), deps, adaptive, max_q, conf_stop))
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
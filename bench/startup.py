@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+# =========================
+# STARTUP BENCHMARK (cold start / rerun)
+# =========================
+# Каждый прогон — новый процесс python: импорт streamlit, первый запуск App.py
+# через streamlit.testing (AppTest) и N повторных rerun без действий
+# пользователя. Модель — встроенный bench/fake_openai.py (через OPENAI_BASE_URL),
+# так что прогрев и префетч ходят в локальный сервер, а не в сеть.
+# Итог — JSON: время от старта процесса до первой отрисовки, первый rerun,
+# p50/p95 повторных rerun и этапы из metrics.py (config/knowledge/bank/warmup).
+#
+#   python -m bench.startup --runs 5 --reruns 20
+
+ROOT = Path(__file__).resolve().parent.parent
+STAGES = ("config.load", "knowledge.load", "bank.load", "warmup", "app.first_paint", "app.rerun")
+
+
+def pct(xs: list, q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else 0.0
+
+
+def child(reruns: int) -> dict:
+    # внутри нового процесса; время старта — от родителя (NEO_BENCH_T0)
+    spawned = float(os.environ["NEO_BENCH_T0"])
+    t0 = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    import_sec = time.perf_counter() - t0
+
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    at = AppTest.from_file(str(ROOT / "App.py"), default_timeout=120)
+    t1 = time.perf_counter()
+    at.run()
+    first_sec = time.perf_counter() - t1
+    first_paint = time.time() - spawned
+    errors = [str(e.value)[:200] for e in at.exception]
+
+    times = []
+    for _ in range(reruns):
+        t = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - t)
+
+    from metrics import METRICS
+    stages = {s["stage"]: s for s in METRICS.snapshot()["stages"] if s["stage"] in STAGES}
+    return {
+        "spawn_to_first_paint_sec": round(first_paint, 3),
+        "streamlit_import_sec": round(import_sec, 3),
+        "first_run_sec": round(first_sec, 3),
+        "rerun_ms": [round(x * 1000, 2) for x in times],
+        "stages": stages,
+        "errors": errors,
+    }
+
+
+def run_once(reruns: int, base_url: str) -> dict:
+    env = {**os.environ, "NEO_BENCH_T0": repr(time.time()), "OPENAI_BASE_URL": base_url,
+           "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "sk-bench"}
+    out = subprocess.run(
+        [sys.executable, "-m", "bench.startup", "--child", "--reruns", str(reruns)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+    if out.returncode or not lines:
+        return {"error": (out.stderr or out.stdout)[-500:]}
+    return json.loads(lines[-1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Холодный старт и стоимость rerun App.py")
+    ap.add_argument("--runs", type=int, default=3, help="сколько новых процессов")
+    ap.add_argument("--reruns", type=int, default=10, help="повторных rerun в каждом процессе")
+    ap.add_argument("--base-url", default="", help="внешний сервер вместо встроенного fake_openai")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.reruns), ensure_ascii=False))
+        return None
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        from bench.fake_openai import start_server
+        server, base_url = start_server()
+
+    runs = [run_once(args.reruns, base_url) for _ in range(args.runs)]
+    if server:
+        server.shutdown()
+
+    ok = [r for r in runs if "error" not in r]
+    reruns = [x for r in ok for x in r["rerun_ms"]]
+    first_paint = [r["spawn_to_first_paint_sec"] for r in ok]
+    first_run = [r["first_run_sec"] for r in ok]
+    result = {
+        "config": {"runs": args.runs, "reruns": args.reruns, "base_url": args.base_url or "embedded"},
+        "runs_ok": len(ok),
+        "first_paint_sec": {"p50": pct(first_paint, 0.5), "max": max(first_paint, default=0.0)},
+        "first_run_sec": {"p50": pct(first_run, 0.5), "max": max(first_run, default=0.0)},
+        "rerun_ms": {"p50": pct(reruns, 0.5), "p95": pct(reruns, 0.95), "max": max(reruns, default=0.0)},
+        "streamlit_import_sec": pct([r["streamlit_import_sec"] for r in ok], 0.5),
+        "stages": ok[-1]["stages"] if ok else {},
+        "errors": [r.get("error") or r.get("errors") for r in runs if r.get("error") or r.get("errors")],
+    }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
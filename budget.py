@@ -0,0 +1,177 @@
+import json
+import logging
+
+import tokenizer
+from tokenizer import count_tokens
+from metrics import METRICS
+
+# =========================
+# TOKEN BUDGET (размер промпта каждого вызова)
+# =========================
+# Промпт считается по частям (tokenizer.py): префикс (правила + формат +
+# ядро базы / инструкция отчёта), фрагменты базы под шаг, состояние сессии,
+# история ответов. Если сумма больше лимита вызова, режется в порядке
+# приоритета — сначала то, что дешевле потерять:
+#   вопрос: фрагменты базы (до min_knowledge) → хвост истории (старые первыми,
+#           последний ответ остаётся) → примеры "вопрос → ответ" в дайджесте;
+#   отчёт:  длинные свободные поля (запрос клиента, ответы) → хвост ответов
+#           (пока не влезет) → примеры в дайджесте → flow.
+# Префикс не режется никогда (он же кэш промпта у провайдера). Разбивка по
+# частям — в лог (neo.budget), в метрики (budget.tokens / budget.trimmed)
+# и в info["budget"] вызова (дальше — в meta.calls сессии).
+
+log = logging.getLogger("neo.budget")
+
+DEFAULTS = {
+    "enabled": True,
+    "tokenizer": "heuristic",            # или "tiktoken", если он установлен
+    "message_overhead_tokens": 4,        # служебные токены на сообщение
+    "question_max_input_tokens": 9000,
+    "question_min_knowledge_tokens": 500,
+    "report_max_input_tokens": 6000,
+    "report_field_chars": 600,           # длинные свободные поля отчёта обрезаются до стольких символов
+}
+
+
+def configure(cfg: dict = None):
+    # → нормализованный конфиг для deps["budget"] или None, если выключено
+    cfg = {**DEFAULTS, **(cfg or {})}
+    if not cfg.get("enabled", True):
+        return None
+    tokenizer.use(cfg["tokenizer"])
+    return cfg
+
+
+def message_tokens(messages: list, cfg: dict = None) -> int:
+    over = int((cfg or DEFAULTS)["message_overhead_tokens"])
+    return sum(count_tokens(m.get("content", "")) + over for m in messages)
+
+
+def json_tokens(obj) -> int:
+    return count_tokens(json.dumps(obj, ensure_ascii=False))
+
+
+def report(kind: str, parts: dict, limit: int, trimmed: list) -> dict:
+    # разбивка одного вызова: в лог и в метрики
+    out = {**parts, "total": sum(parts.values()), "limit": limit, "trimmed": trimmed}
+    for k, v in parts.items():
+        METRICS.inc("budget.tokens", v, kind=kind, part=k)
+    for k in trimmed:
+        METRICS.inc("budget.trimmed", kind=kind, part=k)
+    if out["total"] > limit:
+        METRICS.inc("budget.over", kind=kind)
+        log.warning("budget %s: %s > %s после обрезки %s", kind, out["total"], limit, trimmed)
+    else:
+        log.info("budget %s: %s", kind, out)
+    return out
+
+
+# =========================
+# QUESTION
+# =========================
+def _history_tokens(payload: dict) -> int:
+    return json_tokens({"history_digest": payload.get("history_digest"), "history_tail": payload.get("history_tail")})
+
+
+def fit_question(cfg: dict, prefix: list, knowledge: str, payload: dict, reselect):
+    # reselect(budget_tokens) → фрагменты базы заново в меньшем бюджете;
+    # возвращает (knowledge, payload, разбивка); payload меняется на месте
+    over = int(cfg["message_overhead_tokens"])
+    limit = int(cfg["question_max_input_tokens"])
+    trimmed = []
+
+    def parts():
+        pl = json_tokens(payload) + over
+        hist = _history_tokens(payload)
+        return {
+            "prefix": message_tokens(prefix, cfg),
+            "knowledge": count_tokens(knowledge) + over,
+            "state": pl - hist,
+            "history": hist,
+        }
+
+    p = parts()
+    excess = sum(p.values()) - limit
+    if excess > 0 and p["knowledge"] > int(cfg["question_min_knowledge_tokens"]):
+        knowledge = reselect(max(int(cfg["question_min_knowledge_tokens"]), p["knowledge"] - excess))
+        trimmed.append("knowledge")
+        p = parts()
+        excess = sum(p.values()) - limit
+    tail = payload.get("history_tail") or []
+    if excess > 0 and len(tail) > 1:
+        while excess > 0 and len(tail) > 1:
+            excess -= json_tokens(tail.pop(0))
+        trimmed.append("history_tail")
+        p = parts()
+        excess = sum(p.values()) - limit
+    digest = payload.get("history_digest") or {}
+    if excess > 0 and any(e.get("evidence") for e in digest.values()):
+        for e in digest.values():
+            if excess <= 0:
+                break
+            if e.get("evidence"):
+                excess -= json_tokens(e["evidence"])
+                e["evidence"] = []
+        trimmed.append("history_digest")
+        p = parts()
+    return knowledge, payload, report("question", p, limit, trimmed)
+
+
+# =========================
+# MASTER REPORT
+# =========================
+def _clip(text, n: int):
+    text = str(text or "")
+    return text if len(text) <= n else text[: max(n - 1, 0)].rstrip() + "…"
+
+
+def fit_report(cfg: dict, prefix: list, data: dict):
+    # data — report_input(payload); возвращает (data, разбивка), data меняется на месте
+    over = int(cfg["message_overhead_tokens"])
+    limit = int(cfg["report_max_input_tokens"])
+    n = int(cfg["report_field_chars"])
+    trimmed = []
+
+    def parts():
+        hist = json_tokens({"answers_digest": data.get("answers_digest"), "answers_tail": data.get("answers_tail")})
+        return {
+            "prefix": message_tokens(prefix, cfg),
+            "state": json_tokens(data) + over - hist,
+            "history": hist,
+        }
+
+    def excess():
+        return sum(parts().values()) - limit
+
+    # сначала обрезаются длинные поля: одно огромное поле иначе съело бы весь хвост,
+    # а итог всё равно остался бы сильно ниже лимита
+    tail = data.get("answers_tail") or []
+    if excess() > 0:
+        meta = data.get("meta") or {}
+        clipped = False
+        for k in ("request", "name", "contact"):
+            if isinstance(meta.get(k), str) and len(meta[k]) > n:
+                meta[k] = _clip(meta[k], n)
+                clipped = True
+        for a in tail:
+            for k in ("question", "answer"):
+                if len(str(a.get(k) or "")) > n // 2:
+                    a[k] = _clip(a.get(k), n // 2)
+                    clipped = True
+        if clipped:
+            trimmed.append("free_text")
+    if excess() > 0 and len(tail) > 1:
+        while len(tail) > 1 and excess() > 0:
+            tail.pop(0)
+        trimmed.append("answers_tail")
+    digest = data.get("answers_digest") or {}
+    if excess() > 0 and any(e.get("evidence") for e in digest.values()):
+        for e in digest.values():
+            e["evidence"] = []
+            if excess() <= 0:
+                break
+        trimmed.append("answers_digest")
+    if excess() > 0 and "flow" in data:
+        del data["flow"]
+        trimmed.append("flow")
+    return data, report("master_report", parts(), limit, trimmed)
@@ -0,0 +1,94 @@
+from knowledge_index import estimate_tokens
+from adaptive import position_of, position_scores, leaders, margin
+
+# =========================
+# HISTORY DIGEST (сжатие истории ответов)
+# =========================
+# В промпт уходит не вся история, а хвост последних ответов (не больше `tail`
+# штук и `tail_budget_tokens` токенов) + дайджест всего, что старше хвоста:
+# по каждой позиции — сколько ответов, лидеры и разрыв по баллам, последние
+# короткие "вопрос → ответ". Дайджест копится инкрементально в state["digest"]
+# (upto — сколько ответов уже свёрнуто), полная запись остаётся в журнале
+# и в payload — размер промпта не растёт с max_questions_total.
+
+DEFAULTS = {
+    "tail": 6,                    # ответов в хвосте, не больше
+    "tail_budget_tokens": 800,    # и не больше токенов
+    "answer_chars": 400,          # длинный свободный ответ в промпте обрезается
+    "evidence_per_position": 3,   # "вопрос → ответ" в дайджесте позиции
+    "evidence_chars": 140,
+    "report_tail": 12,            # для мастер-отчёта — хвост длиннее
+    "report_budget_tokens": 2500,
+}
+
+
+def empty_digest() -> dict:
+    return {"upto": 0, "positions": {}}
+
+
+def clip(text, n: int) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= n else text[: max(n - 1, 0)].rstrip() + "…"
+
+
+def tail_entry(a: dict, cfg: dict) -> dict:
+    return {
+        "step_id": a.get("step_id"),
+        "question": clip(a.get("question"), cfg["answer_chars"]),
+        "answer": clip(a.get("answer"), cfg["answer_chars"]),
+    }
+
+
+def tail_tokens(answers: list, cfg: dict) -> int:
+    return sum(estimate_tokens(e["question"]) + estimate_tokens(e["answer"])
+               for e in (tail_entry(a, cfg) for a in answers))
+
+
+def fold(digest: dict, a: dict, cfg: dict):
+    # один ответ из хвоста → в дайджест своей позиции
+    pos = position_of(a.get("step_id"))
+    entry = digest["positions"].setdefault(f"p{pos}" if pos else "other", {"answers": 0, "evidence": []})
+    entry["answers"] += 1
+    n = cfg["evidence_chars"]
+    entry["evidence"].append(f"{clip(a.get('question'), n)} → {clip(a.get('answer'), n)}")
+    del entry["evidence"][: -int(cfg["evidence_per_position"])]
+    digest["upto"] += 1
+
+
+def compact(state, cfg: dict = None) -> dict:
+    # сворачивает всё, что не влезает в хвост; повторный вызов — ничего не делает
+    cfg = {**DEFAULTS, **(cfg or {})}
+    digest = state.get("digest")
+    if not isinstance(digest, dict) or digest.get("upto", 0) > len(state["answers"]):
+        digest = state["digest"] = empty_digest()
+    answers = state["answers"]
+    while digest["upto"] < len(answers):
+        rest = answers[digest["upto"]:]
+        if len(rest) <= int(cfg["tail"]) and (len(rest) == 1 or tail_tokens(rest, cfg) <= int(cfg["tail_budget_tokens"])):
+            break
+        fold(digest, answers[digest["upto"]], cfg)
+    return digest
+
+
+def history_for_prompt(state, cfg: dict = None):
+    # (дайджест, хвост) для промпта вопроса; лидеры — по текущим баллам позиции
+    cfg = {**DEFAULTS, **(cfg or {})}
+    digest = compact(state, cfg)
+    out = {}
+    for key, entry in sorted(digest["positions"].items()):
+        item = dict(entry)
+        if key != "other" and state.get("score_steps") is not None:
+            pos = int(key[1:])
+            item["leaders"] = leaders(state, pos, 2)
+            item["margin"] = round(margin(position_scores(state, pos)), 2)
+        out[key] = item
+    return out, [tail_entry(a, cfg) for a in state["answers"][digest["upto"]:]]
+
+
+def history_for_report(answers: list, cfg: dict = None):
+    # мастер-отчёт: тот же дайджест по ответам payload, хвост длиннее
+    cfg = {**DEFAULTS, **(cfg or {})}
+    cfg = {**cfg, "tail": cfg["report_tail"], "tail_budget_tokens": cfg["report_budget_tokens"]}
+    state = {"answers": list(answers or [])}
+    digest = compact(state, cfg)
+    return digest["positions"], [tail_entry(a, cfg) for a in state["answers"][digest["upto"]:]]
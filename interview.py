@@ -0,0 +1,639 @@
+import copy
+import json
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+import numpy as np
+
+import scoring
+from knowledge_index import format_chunks, estimate_tokens
+from prompting import (
+    assemble, build_question_prefix, build_question_tail,
+    build_master_prefix, usage_from_response,
+)
+from jsonstream import ObjectStreamParser
+from response_cache import cache_key
+from resilience import parse_question, InvalidAnswer
+from question_bank import answer_update, bank_first
+from adaptive import advance
+from metrics import METRICS, span
+from budget import fit_question, fit_report
+from history import empty_digest, compact, history_for_prompt, history_for_report
+
+# =========================
+# INTERVIEW CORE (без Streamlit)
+# =========================
+# Шаги, состояние интервью, контракт с моделью и скоринг. Всё работает
+# с обычным dict состояния (или st.session_state — он ведёт себя так же),
+# поэтому одинаково используется в App.py, в префетче и в бенчмарках.
+
+STEPS = [
+    # позиция 1: 2 вопроса сфера + 2 вопроса уточнение потенциала
+    {"id":"p1_scope_1","title":"Позиция 1 — сфера (1/2)","goal":"определить сферу/тип восприятия позиции 1"},
+    {"id":"p1_scope_2","title":"Позиция 1 — сфера (2/2)","goal":"дожать сферу позиции 1"},
+    {"id":"p1_pot_1","title":"Позиция 1 — потенциал (1/2)","goal":"сузить до конкретного потенциала позиции 1"},
+    {"id":"p1_pot_2","title":"Позиция 1 — потенциал (2/2)","goal":"зафиксировать потенциал позиции 1"},
+
+    # позиция 2
+    {"id":"p2_scope_1","title":"Позиция 2 — сфера (1/2)","goal":"определить сферу позиции 2"},
+    {"id":"p2_scope_2","title":"Позиция 2 — сфера (2/2)","goal":"дожать сферу позиции 2"},
+    {"id":"p2_pot_1","title":"Позиция 2 — потенциал (1/2)","goal":"сузить до конкретного потенциала позиции 2"},
+    {"id":"p2_pot_2","title":"Позиция 2 — потенциал (2/2)","goal":"зафиксировать потенциал позиции 2"},
+
+    # позиция 3
+    {"id":"p3_scope_1","title":"Позиция 3 — сфера (1/2)","goal":"определить сферу позиции 3"},
+    {"id":"p3_scope_2","title":"Позиция 3 — сфера (2/2)","goal":"дожать сферу позиции 3"},
+    {"id":"p3_pot_1","title":"Позиция 3 — потенциал (1/2)","goal":"сузить до конкретного потенциала позиции 3"},
+    {"id":"p3_pot_2","title":"Позиция 3 — потенциал (2/2)","goal":"зафиксировать потенциал позиции 3"},
+]
+
+# оценка выхода модели — для лимита токенов в scheduler.py
+QUESTION_OUTPUT_TOKENS = 600
+REPORT_OUTPUT_TOKENS = 2500
+
+
+
+def utcnow_iso():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def new_state(session_id: str = None) -> dict:
+    return {
+        "session_id": session_id or str(uuid.uuid4()),
+        "client_name": "",
+        "client_contact": "",
+        "client_request": "",
+        "step_index": 0,
+        "q_count": 0,
+        # ответы: список {step_id, question, answer}
+        "answers": [],
+        # результаты
+        "positions": {"p1":None,"p2":None,"p3":None},
+        "confidence": {"p1":0.0,"p2":0.0,"p3":0.0},
+        # баллы: матрица 9×5 (POTS × total+COLS), см. scoring.py
+        "score_matrix": scoring.empty(),
+        # снимок матрицы после каждого ответа
+        "score_steps": [],
+        # адаптивный план: пропущенные шаги и добавленные уточнения (adaptive.py)
+        "skipped": [],
+        "extra_steps": [],
+        # сжатая история: всё старше хвоста ответов, по позициям (history.py)
+        "digest": empty_digest(),
+    }
+
+
+def current_step(state):
+    # шаг по step_index: основной план STEPS + уточнения; None — план пройден
+    plan = STEPS + list(state.get("extra_steps") or [])
+    idx = state["step_index"]
+    return plan[idx] if idx < len(plan) else None
+
+
+def snapshot(state) -> dict:
+    # независимая копия того, что нужно для вызова модели
+    return copy.deepcopy({k: state[k] for k in new_state() if k in state})
+
+
+def make_deps(index, guard, max_questions_total: int, confidence_stop: float,
+              knowledge_budget: int, knowledge_top_k: int, cache=None, scheduler=None,
+              resilience=None, bank=None, bank_cfg: dict = None, history: dict = None,
+              budget: dict = None) -> dict:
+    # всё "процессное", что нужно для сборки промпта
+    return {
+        "index": index,
+        "core": format_chunks(index.core_chunks()),
+        "guard": guard,
+        "limits": {
+            "max_questions_total": max_questions_total,
+            "confidence_stop": confidence_stop,
+        },
+        "knowledge_budget": knowledge_budget,
+        "knowledge_top_k": knowledge_top_k,
+        "cache": cache,
+        "scheduler": scheduler,
+        "resilience": resilience,
+        "bank": bank,
+        "bank_cfg": {"serve_scope": True, "pot_margin": 1.0, "fallback": True, **(bank_cfg or {})},
+        "history": history,
+        "budget": budget,  # budget.configure(...) или None — без ограничения размера промпта
+    }
+
+# =========================
+# AI CONTRACT
+# =========================
+def select_knowledge(deps: dict, step_goal: str, answers: list, request: str = "", budget_tokens: int = None) -> str:
+    # запрос к индексу: цель шага + запрос клиента + последние ответы;
+    # budget_tokens — меньший бюджет, если промпт не влезает в лимит вызова
+    recent = " ".join(f"{a.get('question','')} {a.get('answer','')}" for a in answers[-3:])
+    query = f"{step_goal} {request} {recent}"
+    if budget_tokens is None:
+        budget_tokens = deps["knowledge_budget"]
+    chunks = deps["index"].select(query, budget_tokens, deps["knowledge_top_k"], include_core=False)
+    return format_chunks(chunks)
+
+
+def build_user_payload(state: dict, step_id: str, step_goal: str, limits: dict, history: dict = None):
+    # без имени/контакта и временных меток: тот же запрос и те же ответы на одном
+    # шаге дают байт-в-байт одинаковый промпт (и попадание в кэш ответов);
+    # запрос клиента остаётся — без него вопрос не по теме, а кэш делил бы его между клиентами;
+    # история — дайджест + хвост в фиксированном бюджете (history.py)
+    scores, col_scores = scoring.to_dicts(state["score_matrix"], 3)
+    digest, tail = history_for_prompt(state, history)
+    return {
+        "mode": "client_interview",
+        "step_id": step_id,
+        "step_goal": step_goal,
+        "client": {
+            "request": state.get("client_request",""),
+        },
+        "state": {
+            "step_index": state["step_index"],
+            "q_count": state["q_count"],
+            "positions": state["positions"],
+            "confidence": state["confidence"],
+            "scores": scores,
+            "col_scores": col_scores,
+        },
+        "history_digest": digest,  # ответы старше хвоста, по позициям
+        "history_tail": tail,  # последние ответы
+        "limits": limits,
+    }
+
+# ожидаемый JSON от модели:
+# {
+#  "question": "...",
+#  "type": "single"|"text",
+#  "options": ["..."] (если single),
+#  "analysis_update": {
+#    "scores_delta": {"Аметист":0.2, ...},
+#    "col_scores_delta": {"perception":{"...":0.1}, "motivation":{...}, "tool":{...}, "result":{...}},
+#    "positions_guess": {"p1":"...", "p2":"...", "p3":"..."} (может быть null),
+#    "confidence": {"p1":0.0-1.0, ...},
+#    "notes_for_master": "..."
+#  }
+# }
+
+def build_question_messages(step_id: str, step_goal: str, state: dict, deps: dict):
+    # → (messages, отпечаток префикса, разбивка бюджета | None)
+    with span("prompt.build"):
+        def knowledge_for(budget_tokens=None):
+            return select_knowledge(
+                deps,
+                step_goal,
+                state["answers"],
+                state.get("client_request", ""),
+                budget_tokens,
+            )
+
+        knowledge = knowledge_for()
+        payload = build_user_payload(state, step_id, step_goal, deps["limits"], deps.get("history"))
+        prefix = build_question_prefix(deps["core"])
+        budget = None
+        if deps.get("budget"):
+            knowledge, payload, budget = fit_question(deps["budget"], prefix, knowledge, payload, knowledge_for)
+
+        # стабильный префикс первым, всё сессионное — после него
+        messages, fp = assemble(
+            "question",
+            prefix,
+            build_question_tail(knowledge, payload),
+            deps["guard"],
+        )
+    return messages, fp, budget
+
+
+def cached_question(model: str, step_id: str, messages: list, fp: str, deps: dict):
+    # (ключ, (вопрос, info) | None); без кэша в deps — (None, None)
+    cache = deps.get("cache")
+    if cache is None:
+        return None, None
+    key = cache_key("question", model, fp, step_id, messages)
+    q = cache.get(key)
+    if q is None:
+        return key, None
+    return key, (copy.deepcopy(q), {"usage": {}, "prompt_prefix": fp, "cached": True})
+
+
+def remember_question(key: str, q: dict, deps: dict):
+    # в кэш попадает только вопрос, прошедший validate_question
+    if key:
+        deps["cache"].put(key, q)
+
+
+def request_tokens(messages: list, max_output: int) -> int:
+    return sum(estimate_tokens(m.get("content", "")) for m in messages) + max_output
+
+
+def used_tokens(usage: dict):
+    if not usage:
+        return None
+    return int(usage.get("input_tokens", 0)) + int(usage.get("output_tokens", 0))
+
+
+def model_slot(scheduler, kind: str, session_id: str, messages: list, max_output: int, max_wait: float = None):
+    # место в очереди процесса (или ничего, если планировщик выключен);
+    # max_wait — остаток бюджета шага: ожидание в очереди входит в бюджет
+    if scheduler is None:
+        return nullcontext()
+    return scheduler.slot(kind, session_id, request_tokens(messages, max_output), max_wait)
+
+
+def left(timeout, t0: float):
+    # остаток таймаута попытки после ожидания в очереди
+    if not timeout:
+        return None
+    return max(timeout - (time.perf_counter() - t0), 0.1)
+
+
+def ms_since(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+def record_call(kind: str, model: str, info: dict):
+    # этапы вызова и токены → METRICS; стоимость ложится в usage (и дальше в meta)
+    cost = METRICS.record_call(kind, model, info.get("usage") or {}, info.get("timing") or {})
+    if cost:
+        info["usage"]["cost_usd"] = round(cost, 8)
+
+
+def timed_parse(text: str):
+    with span("json.parse"):
+        return parse_question(text)
+
+
+def response_text(r) -> str:
+    text = getattr(r, "output_text", "") or ""
+    if not text.strip():
+        # fallback на случай неожиданной структуры
+        try:
+            text = r.output[0].content[0].text or ""
+        except Exception:
+            text = ""
+    return text
+
+
+def call_ai_next_question(client, model: str, step_id: str, step_goal: str, state: dict, deps: dict,
+                          kind: str = "question"):
+    # не трогает st.session_state: вызывается и из потока скрипта, и из префетча.
+    # возвращает (вопрос, info) — info (токены, отпечаток префикса) применяет вызывающий;
+    # kind — приоритет в очереди (question / prefetch).
+    # С deps["resilience"] — бюджет шага, повторы, хедж и breaker (resilience.py)
+    messages, fp, budget = build_question_messages(step_id, step_goal, state, deps)
+    key, hit = cached_question(model, step_id, messages, fp, deps)
+    if hit is not None:
+        return hit
+    res = deps.get("resilience")
+
+    def attempt(timeout=None, hedged=False):
+        # хедж встаёт в очередь как префетч: под нагрузкой он просто не уйдёт
+        t0 = time.perf_counter()
+        with model_slot(deps.get("scheduler"), "prefetch" if hedged else kind, state.get("session_id", ""),
+                        messages, QUESTION_OUTPUT_TOKENS, timeout) as ticket:
+            queue_ms = ms_since(t0)
+            t1 = time.perf_counter()
+            rest = left(timeout, t0)
+            r = client.responses.create(
+                model=model,
+                input=messages,
+                text={"format": {"type": "json_object"}},
+                **({"timeout": rest} if rest else {}),
+            )
+            # без потока первый байт и конец ответа совпадают
+            info = {"usage": usage_from_response(r), "prompt_prefix": fp, "budget": budget,
+                    "timing": {"queue_ms": queue_ms, "total_ms": ms_since(t1)}}
+            if ticket is not None:
+                ticket.used = used_tokens(info["usage"])
+        q, repaired = timed_parse(response_text(r))
+        if repaired and res is not None:
+            res.count("repaired")
+        return q, info
+
+    q, info = res.run(attempt, hedge=kind == "question") if res is not None else attempt()
+    record_call(kind, model, info)
+    remember_question(key, q, deps)
+    return q, info
+
+
+def stream_ai_next_question(client, model: str, step_id: str, step_goal: str, state: dict, deps: dict):
+    # потоковый вариант: question_chunks() отдаёт текст вопроса по мере генерации
+    # (для st.write_stream), finish() дочитывает поток и возвращает (вопрос, info),
+    # close() отпускает место в очереди и поток, если finish() не дошёл до конца
+    # (rerun/stop Streamlit посреди write_stream) — вызывающий зовёт его в finally
+    messages, fp, budget = build_question_messages(step_id, step_goal, state, deps)
+    key, hit = cached_question(model, step_id, messages, fp, deps)
+    if hit is not None:
+        # из кэша: текст вопроса отдаётся сразу целиком
+        def cached_chunks():
+            yield hit[0].get("question", "")
+
+        def cached_finish(on_field=None):
+            for k, v in hit[0].items():
+                if on_field and k != "question":
+                    on_field(k, v)
+            return hit
+
+        return cached_chunks, cached_finish, lambda: None
+
+    # место в очереди держится до конца потока; повторов здесь нет —
+    # при сбое вызывающий переходит на call_ai_next_question
+    res = deps.get("resilience")
+    if res is not None:
+        res.guard()
+    t0 = time.monotonic()
+    tq = time.perf_counter()
+    scheduler = deps.get("scheduler")
+    ticket = None
+    if scheduler is not None:
+        ticket = scheduler.acquire("question", state.get("session_id", ""),
+                                   request_tokens(messages, QUESTION_OUTPUT_TOKENS),
+                                   res.cfg["step_budget_sec"] if res is not None else None)
+    timing = {"queue_ms": ms_since(tq)}
+    t1 = time.perf_counter()
+    try:
+        stream = client.responses.create(
+            model=model,
+            input=messages,
+            text={"format": {"type": "json_object"}},
+            stream=True,
+            **({"timeout": left(res.cfg["step_budget_sec"], tq)} if res is not None else {}),
+        )
+        events = iter(stream)
+    except Exception as e:
+        if scheduler is not None:
+            scheduler.release(ticket, e)
+        if res is not None:
+            res.observe(False)
+        raise
+    parser = ObjectStreamParser("question")
+    info = {"usage": {}, "prompt_prefix": fp, "budget": budget, "timing": timing}
+    pending = []  # поля, закрывшиеся пока отдавался текст вопроса
+    backlog = deque()  # события разобранного куска, ещё не отданные: переживают выход из pump()
+    closed = []
+
+    def done(error=None, aborted=False):
+        # ровно один раз; aborted — поток бросили (не сбой модели): без записи
+        # вызова и без отметки в breaker, соединение закрывается
+        if closed:
+            return
+        closed.append(True)
+        timing["total_ms"] = ms_since(t1)
+        if error is None and not aborted:
+            record_call("question", model, info)
+        if scheduler is not None:
+            ticket.used = used_tokens(info["usage"])
+            scheduler.release(ticket, error)
+        if res is not None and not aborted:
+            res.observe(error is None, time.monotonic() - t0)
+        if aborted and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def pump():
+        try:
+            while backlog:
+                yield backlog.popleft()
+            for ev in events:
+                t = getattr(ev, "type", "")
+                if t == "response.output_text.delta":
+                    if "ttfb_ms" not in timing:
+                        timing["ttfb_ms"] = ms_since(t1)
+                    backlog.extend(parser.feed(ev.delta or ""))
+                    while backlog:
+                        yield backlog.popleft()
+                elif t == "response.completed":
+                    info["usage"] = usage_from_response(ev.response)
+                elif t in ("response.failed", "error"):
+                    raise RuntimeError(f"stream failed: {getattr(ev, 'message', '') or t}")
+        except GeneratorExit:
+            # question_chunks() вышел после поля question — поток дочитает finish()
+            raise
+        except Exception as e:
+            done(e)
+            raise
+        except BaseException:
+            # StopException / RerunException Streamlit, KeyboardInterrupt
+            done(aborted=True)
+            raise
+
+    def question_chunks():
+        for e in pump():
+            if e[0] == "delta":
+                yield e[1]
+            else:
+                pending.append(e)
+                if e[1] == "question":
+                    return
+
+    def finish(on_field=None):
+        # options / analysis_update отдаются в on_field сразу по закрытии
+        def emit(e):
+            if e[0] == "field" and on_field:
+                on_field(e[1], e[2])
+        for e in pending:
+            emit(e)
+        for e in pump():
+            emit(e)
+        try:
+            q, repaired = timed_parse(parser.text())
+        except InvalidAnswer as e:
+            done(e)
+            raise
+        done()
+        if repaired and res is not None:
+            res.count("repaired")
+        remember_question(key, q, deps)
+        return q, info
+
+    def close():
+        done(aborted=True)
+
+    return question_chunks, finish, close
+
+
+REPORT_SKIP = ("ai_master_report", "answers", "scores_by_step", "digest")
+REPORT_SKIP_META = ("report_usage", "usage", "prefetch_usage", "calls", "prompt_prefix")
+
+
+def report_input(payload: dict, history: dict = None) -> dict:
+    # в модель — данные сессии без прошлого отчёта и служебных счётчиков:
+    # повторная генерация по неизменной сессии даёт тот же промпт.
+    # Ответы — дайджестом по позициям + хвост: размер не растёт с числом вопросов
+    data = {k: v for k, v in payload.items() if k not in REPORT_SKIP}
+    data["meta"] = {k: v for k, v in (payload.get("meta") or {}).items() if k not in REPORT_SKIP_META}
+    data["answers_digest"], data["answers_tail"] = history_for_report(payload.get("answers"), history)
+    return data
+
+
+def call_ai_master_report(client, model: str, payload: dict, guard=None, cache=None, scheduler=None,
+                          resilience=None, history=None, budget=None, force=False):
+    # возвращает (текст, usage); из кэша usage пустой.
+    # budget — budget.configure(...): данные сессии ужимаются до лимита вызова;
+    # force — перегенерация: кэш не читается (промпт тот же), новый текст в него пишется
+    prefix = build_master_prefix()
+    data = report_input(payload, history)
+    if budget:
+        data, _ = fit_report(budget, prefix, data)
+    messages, fp = assemble(
+        "master_report",
+        prefix,
+        [{"role":"user","content": json.dumps(data, ensure_ascii=False)}],
+        guard,
+    )
+    key = cache_key("master_report", model, fp, "", messages) if cache is not None else None
+    if key and not force:
+        text = cache.get(key)
+        if text is not None:
+            return text, {}
+
+    sid = (payload.get("meta") or {}).get("session_id", "")
+
+    def attempt(timeout=None, hedged=False):
+        t0 = time.perf_counter()
+        with model_slot(scheduler, "report", sid, messages, REPORT_OUTPUT_TOKENS, timeout) as ticket:
+            queue_ms = ms_since(t0)
+            t1 = time.perf_counter()
+            rest = left(timeout, t0)
+            r = client.responses.create(
+                model=model,
+                input=messages,
+                **({"timeout": rest} if rest else {}),
+            )
+            info = {"usage": usage_from_response(r), "timing": {"queue_ms": queue_ms, "total_ms": ms_since(t1)}}
+            if ticket is not None:
+                ticket.used = used_tokens(info["usage"])
+        text = response_text(r)
+        if not text.strip():
+            raise InvalidAnswer("empty report")
+        return text, info
+
+    if resilience is not None:
+        text, info = resilience.run(attempt, resilience.cfg["report_budget_sec"], hedge=False)
+    else:
+        text, info = attempt()
+    record_call("report", model, info)
+    usage = info["usage"]
+    if key:
+        cache.put(key, text)
+    return text, usage
+
+# =========================
+# QUESTION BANK
+# =========================
+def use_bank(deps: dict, step_id: str, state) -> bool:
+    # шаг берётся из банка сразу, без модели (сфера/тип, ясная позиция)
+    bank = deps.get("bank")
+    if bank is None or not bank.has(step_id) or not deps["bank_cfg"]["serve_scope"]:
+        return False
+    return bank_first(step_id, state, float(deps["bank_cfg"]["pot_margin"]))
+
+
+def can_fallback(deps: dict, step_id: str) -> bool:
+    bank = deps.get("bank")
+    return bank is not None and bank.has(step_id) and bool(deps["bank_cfg"]["fallback"])
+
+
+def bank_question(deps: dict, step_id: str, state):
+    # вопрос из офлайн-банка: мгновенно и без токенов
+    return deps["bank"].question(step_id, state), {"usage": {}, "source": "bank"}
+
+# =========================
+# SCORING / FLOW
+# =========================
+def apply_analysis_update(update: dict, state):
+    # state — st.session_state или его снимок (для префетча);
+    # нечисловые значения от модели отбрасываются, а не роняют rerun
+    if not isinstance(update, dict):
+        return
+
+    # scores / col scores — одной матрицей дельт
+    delta, _ = scoring.delta_from_update(update)
+    scoring.apply(state["score_matrix"], delta)
+
+    # guesses
+    g = update.get("positions_guess", {})
+    if isinstance(g, dict):
+        for p in ["p1","p2","p3"]:
+            if p in g and g[p]:
+                state["positions"][p] = g[p]
+
+    # confidence
+    c = update.get("confidence", {})
+    if isinstance(c, dict):
+        for p in ["p1","p2","p3"]:
+            x = scoring.as_number(c.get(p))
+            if x is not None:
+                state["confidence"][p] = min(max(x, 0.0), 1.0)
+
+
+def record_answer(q: dict, ans: str, state, adaptive: dict = None, max_questions: int = None,
+                  history: dict = None):
+    # фиксирует ответ и двигает шаг; на снимке — для префетча следующего вопроса.
+    # adaptive — конфиг adaptive.py (None — все шаги подряд), history — history.py
+    step = current_step(state)
+    state["answers"].append({
+        "step_id": step["id"] if step else "done",
+        "question": q.get("question",""),
+        "answer": ans,
+        "timestamp": utcnow_iso()
+    })
+
+    # применить апдейт скоринга; у вопроса из банка он зависит от ответа
+    if q.get("source") == "bank":
+        update = answer_update(q, ans, state)
+    else:
+        update = q.get("analysis_update", {})
+    with span("score.update"):
+        apply_analysis_update(update, state)
+        state["score_steps"].append(state["score_matrix"].copy())
+
+    # двигаться дальше
+    state["q_count"] += 1
+    if adaptive is None:
+        state["step_index"] += 1
+    else:
+        state["step_index"] = advance(state, STEPS, adaptive, max_questions)
+    compact(state, history)
+    return update
+
+
+def confident_enough(state, confidence_stop: float) -> bool:
+    # стоп по уверенностям (если все 3 позиции уже уверенно)
+    c = state["confidence"]
+    return c.get("p1",0) >= confidence_stop and c.get("p2",0) >= confidence_stop and c.get("p3",0) >= confidence_stop
+
+
+def build_final_payload(state, app_version: str, model: str, extra_meta: dict = None):
+    m = state["score_matrix"]
+    scores, col_scores = scoring.to_dicts(m)
+    payload = {
+        "meta": {
+            "schema": "ai-neo.positions.ai_only.v1",
+            "app_version": app_version,
+            "timestamp": utcnow_iso(),
+            "session_id": state["session_id"],
+            "name": state.get("client_name",""),
+            "contact": state.get("client_contact",""),
+            "request": state.get("client_request",""),
+            "q_count": state.get("q_count", 0),
+            "model": model,
+            **(extra_meta or {}),
+        },
+        "answers": state["answers"],
+        "positions_guess": state["positions"],
+        "confidence": state["confidence"],
+        "scores": scores,
+        "col_scores": col_scores,
+        "scores_by_step": [np.round(x, 4).tolist() for x in state.get("score_steps", [])],
+        "digest": state.get("digest") or empty_digest(),
+        "flow": {
+            "skipped": list(state.get("skipped") or []),
+            "extra_steps": [s["id"] for s in state.get("extra_steps") or []],
+        },
+        "top6": [{"pot":p,"score":s} for p,s in scoring.topk(m, "total", 6)],
+    }
+    return payload
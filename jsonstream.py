@@ -0,0 +1,148 @@
+import json
+
+# =========================
+# INCREMENTAL JSON (top-level object)
+# =========================
+# Разбирает JSON-объект по мере прихода текста:
+#   - значение строкового поля `stream_key` отдаётся посимвольно (уже раскодированным),
+#   - каждое остальное поле верхнего уровня отдаётся целиком, как только его значение закрылось.
+# Полный json.loads всё равно делается в конце — парсер нужен только для раннего показа.
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class ObjectStreamParser:
+    def __init__(self, stream_key: str = "question"):
+        self.stream_key = stream_key
+        self.buf = []          # весь текст (для финального json.loads)
+        self.depth = 0
+        self.in_str = False
+        self.esc = False
+        self.uni = None        # накопитель \uXXXX
+        self.high_surrogate = None
+        self.key = None        # текущий ключ верхнего уровня
+        self.key_buf = None    # набирается ключ
+        self.expect_key = False
+        self.val_start = None  # индекс начала значения верхнего уровня в buf
+        self.streaming = False  # сейчас внутри значения stream_key
+        self.fields = {}
+
+    def feed(self, chunk: str):
+        # возвращает список событий: ("delta", текст) и ("field", ключ, значение)
+        events = []
+        delta = []
+        for ch in chunk:
+            pos = len(self.buf)
+            self.buf.append(ch)
+
+            if self.in_str:
+                if self.uni is not None:
+                    self.uni += ch
+                    if len(self.uni) == 4:
+                        target = delta if self.streaming else self.key_buf
+                        if target is not None:
+                            target.append(self._decode_unicode(self.uni))
+                        self.uni = None
+                    continue
+                if self.esc:
+                    self.esc = False
+                    if ch == "u":
+                        self.uni = ""
+                    elif self.streaming:
+                        delta.append(_ESCAPES.get(ch, ch))
+                    elif self.key_buf is not None:
+                        self.key_buf.append(_ESCAPES.get(ch, ch))
+                    continue
+                if ch == "\\":
+                    self.esc = True
+                    continue
+                if ch == '"':
+                    self.in_str = False
+                    if self.key_buf is not None:
+                        self.key = "".join(self.key_buf)
+                        self.key_buf = None
+                    elif self.streaming:
+                        self.streaming = False
+                        if delta:
+                            events.append(("delta", "".join(delta)))
+                            delta = []
+                        if self.depth == 1:
+                            self._close_value(pos + 1, events)
+                    elif self.depth == 1 and self.val_start is not None:
+                        self._close_value(pos + 1, events)
+                    continue
+                if self.streaming:
+                    delta.append(ch)
+                elif self.key_buf is not None:
+                    self.key_buf.append(ch)
+                continue
+
+            # вне строки
+            if ch == '"':
+                self.in_str = True
+                if self.depth == 1 and self.expect_key:
+                    self.key_buf = []
+                    self.expect_key = False
+                elif self.depth == 1 and self.val_start is None and self.key is not None:
+                    self.val_start = pos
+                    self.streaming = self.key == self.stream_key
+                continue
+            if ch in "{[":
+                if self.depth == 0 and ch == "{":
+                    self.expect_key = True
+                elif self.depth == 1 and self.val_start is None:
+                    self.val_start = pos
+                self.depth += 1
+                continue
+            if ch in "}]":
+                self.depth -= 1
+                if self.depth == 1 and self.val_start is not None:
+                    self._close_value(pos + 1, events)
+                elif self.depth == 0 and self.val_start is not None:
+                    # скаляр последним полем перед "}"
+                    self._close_value(pos, events)
+                continue
+            if self.depth == 1:
+                if ch == ",":
+                    if self.val_start is not None:
+                        self._close_value(pos, events)
+                    self.expect_key = True
+                    self.key = None
+                elif ch == ":":
+                    pass
+                elif not ch.isspace() and self.val_start is None and self.key is not None:
+                    # число / true / false / null
+                    self.val_start = pos
+
+        if delta:
+            events.append(("delta", "".join(delta)))
+        return events
+
+    def _decode_unicode(self, hex4: str) -> str:
+        # суррогатные пары (\ud83d\ude00) склеиваются в один символ
+        try:
+            cp = int(hex4, 16)
+        except ValueError:
+            return ""
+        if 0xD800 <= cp <= 0xDBFF:
+            self.high_surrogate = cp
+            return ""
+        if 0xDC00 <= cp <= 0xDFFF and self.high_surrogate is not None:
+            hi, self.high_surrogate = self.high_surrogate, None
+            return chr(0x10000 + ((hi - 0xD800) << 10) + (cp - 0xDC00))
+        return chr(cp)
+
+    def _close_value(self, end: int, events: list):
+        raw = "".join(self.buf[self.val_start:end]).strip()
+        self.val_start = None
+        if self.key is None or self.key in self.fields:
+            return
+        try:
+            val = json.loads(raw)
+        except Exception:
+            return
+        self.fields[self.key] = val
+        events.append(("field", self.key, val))
+
+    def text(self) -> str:
+        return "".join(self.buf)
@@ -0,0 +1,220 @@
+import json
+import math
+import re
+import hashlib
+from collections import Counter
+from pathlib import Path
+
+from tokenizer import count_tokens
+
+# =========================
+# KNOWLEDGE INDEX (offline BM25)
+# =========================
+# База режется на секции по столбцу ("N потенциал.") и потенциалу (камню),
+# каждой секции проставляется сфера. Поиск — лексический BM25 без внешних
+# зависимостей: индекс строится один раз на процесс и кэшируется на диске.
+
+INDEX_VERSION = 1
+CHUNK_MAX_CHARS = 1800
+
+BM25_K1 = 1.4
+BM25_B = 0.75
+
+# камень → сфера (см. "Сферы потенциалов" в базе)
+POT_STEMS = {
+    "Сапфир": "Сапфир",
+    "Гелиодор": "Гелиодор",
+    "Аметист": "Аметист",
+    "Изумруд": "Изумруд",
+    "Гранат": "Гранат",
+    "Рубин": "Рубин",
+    "Янтар": "Янтарь",
+    "Шунгит": "Шунгит",
+    "Цитрин": "Цитрин",
+}
+POT_SPHERE = {
+    "Аметист": "Смыслы", "Гелиодор": "Смыслы", "Сапфир": "Смыслы",
+    "Рубин": "Эмоции", "Гранат": "Эмоции", "Изумруд": "Эмоции",
+    "Цитрин": "Материя", "Шунгит": "Материя", "Янтарь": "Материя",
+}
+
+_COLUMN_RE = re.compile(r"(?:^|\s)(\d+)\s+потенциал\.?\s*$")
+_POT_RE = re.compile(r"^(\w+)\s*\([^)]*\)\s*потенциал\.?$")
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    # локальный токенизатор (tokenizer.py), а не символы / 3
+    return count_tokens(text or "")
+
+
+def tokenize(text: str):
+    # дешёвый "стемминг": обрезаем слово до 6 символов
+    return [w[:6] for w in _WORD_RE.findall((text or "").lower()) if len(w) > 2]
+
+
+def _match_pot(line: str):
+    m = _POT_RE.match(line)
+    if not m:
+        return None
+    word = m.group(1)
+    for stem, pot in POT_STEMS.items():
+        if word.startswith(stem):
+            return pot
+    return None
+
+
+def _split_long(text: str, max_chars: int):
+    if len(text) <= max_chars:
+        return [text]
+    parts, buf = [], ""
+    for para in text.split("\n"):
+        if buf and len(buf) + len(para) + 1 > max_chars:
+            parts.append(buf)
+            buf = ""
+        buf = f"{buf}\n{para}" if buf else para
+    if buf:
+        parts.append(buf)
+    return parts
+
+
+def split_knowledge(text: str, max_chars: int = CHUNK_MAX_CHARS):
+    sections = []
+    cur = {"column": None, "pot": None, "lines": []}
+
+    def flush():
+        body = "\n".join(l for l in cur["lines"]).strip()
+        if body:
+            sections.append({"column": cur["column"], "pot": cur["pot"], "text": body})
+        cur["lines"] = []
+
+    for raw in text.splitlines():
+        line = re.sub(r"\s{2,}", "  ", raw.strip())
+        col = _COLUMN_RE.search(line)
+        if col:
+            flush()
+            cur["column"] = int(col.group(1))
+            cur["pot"] = None
+            # в первой строке перед номером столбца стоит заголовок документа
+            head = line[:col.start()].strip()
+            if head:
+                cur["lines"].append(head)
+            cur["lines"].append(f"{col.group(1)} потенциал.")
+            continue
+        pot = _match_pot(line)
+        if pot:
+            flush()
+            cur["pot"] = pot
+        cur["lines"].append(line)
+    flush()
+
+    chunks = []
+    for s in sections:
+        for part in _split_long(s["text"], max_chars):
+            chunks.append({
+                "id": len(chunks),
+                "column": s["column"],
+                "pot": s["pot"],
+                "sphere": POT_SPHERE.get(s["pot"]),
+                "text": part,
+            })
+    return chunks
+
+
+class KnowledgeIndex:
+    def __init__(self, chunks, source_hash: str = ""):
+        self.chunks = chunks
+        self.source_hash = source_hash
+        self.tf = [Counter(tokenize(self._index_text(c))) for c in chunks]
+        self.doc_len = [sum(tf.values()) for tf in self.tf]
+        self.avgdl = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+        df = Counter()
+        for tf in self.tf:
+            df.update(tf.keys())
+        n = len(chunks)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    @staticmethod
+    def _index_text(c: dict) -> str:
+        # метаданные участвуют в поиске наравне с текстом
+        return " ".join(x for x in [c.get("pot") or "", c.get("sphere") or "", c["text"]] if x)
+
+    def core_chunks(self):
+        # вводные части столбцов (что означает столбец, сферы/типы) — до первого камня;
+        # нужны на любом шаге и составляют стабильную часть промпта
+        return [c for c in self.chunks if c["pot"] is None]
+
+    def search(self, query: str, k: int = 8):
+        q = set(tokenize(query))
+        if not q or not self.chunks:
+            return []
+        scored = []
+        for i, tf in enumerate(self.tf):
+            s = 0.0
+            dl = self.doc_len[i] or 1
+            for t in q:
+                f = tf.get(t)
+                if not f:
+                    continue
+                s += self.idf[t] * f * (BM25_K1 + 1) / (f + BM25_K1 * (1 - BM25_B + BM25_B * dl / self.avgdl))
+            if s > 0:
+                scored.append((s, i))
+        scored.sort(reverse=True)
+        return [(self.chunks[i], s) for s, i in scored[:k]]
+
+    def select(self, query: str, budget_tokens: int, k: int = 8, include_core: bool = True):
+        picked, used = [], 0
+        candidates = list(self.core_chunks()) if include_core else []
+        candidates += [c for c, _ in self.search(query, k)]
+        seen = set()
+        for c in candidates:
+            if c["id"] in seen:
+                continue
+            cost = estimate_tokens(c["text"])
+            if used + cost > budget_tokens:
+                continue
+            seen.add(c["id"])
+            picked.append(c)
+            used += cost
+        # в промпт — в порядке документа, чтобы не рвать контекст
+        picked.sort(key=lambda c: c["id"])
+        return picked
+
+    def to_dict(self):
+        return {"version": INDEX_VERSION, "source_hash": self.source_hash, "chunks": self.chunks}
+
+
+def format_chunks(chunks) -> str:
+    out = []
+    for c in chunks:
+        tag = " / ".join(x for x in [
+            f"столбец {c['column']}" if c.get("column") else "",
+            c.get("pot") or "",
+            c.get("sphere") or "",
+        ] if x)
+        out.append(f"[{tag}]\n{c['text']}" if tag else c["text"])
+    return "\n\n".join(out)
+
+
+def build_index(md_path: Path, cache_path: Path = None) -> KnowledgeIndex:
+    if not md_path.exists():
+        return KnowledgeIndex([])
+    raw = md_path.read_bytes()
+    h = hashlib.sha256(raw).hexdigest()
+
+    if cache_path and cache_path.exists():
+        try:
+            d = json.loads(cache_path.read_text(encoding="utf-8"))
+            if d.get("version") == INDEX_VERSION and d.get("source_hash") == h:
+                return KnowledgeIndex(d["chunks"], h)
+        except Exception:
+            pass
+
+    idx = KnowledgeIndex(split_knowledge(raw.decode("utf-8")), h)
+    if cache_path:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(json.dumps(idx.to_dict(), ensure_ascii=False), encoding="utf-8")
+        except Exception:
+            pass
+    return idx
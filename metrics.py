@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================
+# METRICS (process-wide)
+# =========================
+# Один реестр на процесс: длительности этапов (span / observe) с метками,
+# счётчики (inc) — токены, стоимость, вызовы. Этапы: загрузка конфига и базы,
+# сборка промпта, вызов модели (очередь / первый байт / всего), разбор JSON,
+# применение баллов, сохранение сессии, отрисовка мастер-панели.
+# Наружу: snapshot() для мастер-панели, to_prometheus() — текст для
+# GET /metrics (serve), и периодический JSONL-дамп (start_dumper).
+
+log = logging.getLogger("neo.metrics")
+
+WINDOW = 2048  # последних наблюдений на ряд — для перцентилей
+
+# цена за 1M токенов (USD); переопределяется metrics.pricing в config.json
+DEFAULT_PRICING = {
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def _prom_value(v) -> str:
+    # значение метки в text format: экранируются обратный слэш, кавычка и перевод строки
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_name(name: str) -> str:
+    # имя метрики/метки: [a-zA-Z_][a-zA-Z0-9_]* ("budget.tokens" → "budget_tokens")
+    name = re.sub(r"[^a-zA-Z0-9_]", "_", str(name))
+    return name if not name[:1].isdigit() else f"_{name}"
+
+
+def _pct(xs: list, q: float) -> float:
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else 0.0
+
+
+class Metrics:
+    def __init__(self, window: int = WINDOW):
+        self.window = int(window)
+        self.lock = threading.Lock()
+        self.series = {}    # (name, labels) → {"count", "sum", "max", "recent"}
+        self.counters = {}  # (name, labels) → float
+        self.pricing = dict(DEFAULT_PRICING)
+        self.started = time.time()
+
+    def configure(self, pricing: dict = None):
+        if pricing:
+            self.pricing.update(pricing)
+
+    # ---------- record ----------
+    def observe(self, name: str, sec: float, **labels):
+        k = _key(name, labels)
+        with self.lock:
+            s = self.series.get(k)
+            if s is None:
+                s = self.series[k] = {"count": 0, "sum": 0.0, "max": 0.0, "recent": deque(maxlen=self.window)}
+            s["count"] += 1
+            s["sum"] += sec
+            s["max"] = max(s["max"], sec)
+            s["recent"].append(sec)
+
+    def inc(self, name: str, n: float = 1, **labels):
+        k = _key(name, labels)
+        with self.lock:
+            self.counters[k] = self.counters.get(k, 0) + n
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def cost_usd(self, model: str, usage: dict) -> float:
+        # по точному имени модели или по самому длинному префиксу ("gpt-4.1-mini-2025-04-14")
+        price = self.pricing.get(model)
+        if price is None:
+            names = [m for m in self.pricing if (model or "").startswith(m)]
+            price = self.pricing[max(names, key=len)] if names else None
+        if not price or not usage:
+            return 0.0
+        cached = int(usage.get("cached_tokens", 0) or 0)
+        fresh = max(int(usage.get("input_tokens", 0) or 0) - cached, 0)
+        out = int(usage.get("output_tokens", 0) or 0)
+        return (fresh * price.get("input", 0) + cached * price.get("cached_input", price.get("input", 0))
+                + out * price.get("output", 0)) / 1e6
+
+    def record_call(self, kind: str, model: str, usage: dict, timing: dict) -> float:
+        # вызов модели целиком: этапы, токены, стоимость → стоимость (USD)
+        for stage in ("queue", "ttfb", "total"):
+            ms = timing.get(f"{stage}_ms")
+            if ms is not None:
+                self.observe(f"model.{stage}", ms / 1000, kind=kind)
+        self.inc("model_calls", 1, kind=kind)
+        for k in ("input_tokens", "cached_tokens", "output_tokens"):
+            if usage.get(k):
+                self.inc(k, usage[k], kind=kind)
+        cost = self.cost_usd(model, usage)
+        if cost:
+            self.inc("cost_usd", cost, kind=kind)
+        return cost
+
+    # ---------- export ----------
+    def snapshot(self) -> dict:
+        with self.lock:
+            series = {k: (v["count"], v["sum"], v["max"], sorted(v["recent"])) for k, v in self.series.items()}
+            counters = dict(self.counters)
+        stages = []
+        for (name, labels), (count, total, mx, xs) in sorted(series.items()):
+            stages.append({
+                "stage": name,
+                **dict(labels),
+                "count": count,
+                "p50_ms": round(_pct(xs, 0.5) * 1000, 2),
+                "p95_ms": round(_pct(xs, 0.95) * 1000, 2),
+                "p99_ms": round(_pct(xs, 0.99) * 1000, 2),
+                "max_ms": round(mx * 1000, 2),
+                "mean_ms": round(total / count * 1000, 2) if count else 0.0,
+            })
+        return {
+            "ts": time.time(),
+            "uptime_sec": round(time.time() - self.started, 1),
+            "stages": stages,
+            "counters": [{"name": n, **dict(labels), "value": round(v, 6)} for (n, labels), v in sorted(counters.items())],
+        }
+
+    def to_prometheus(self, prefix: str = "neo") -> str:
+        def lbl(labels, extra=()):
+            items = list(labels) + list(extra)
+            return "{" + ",".join(f'{_prom_name(k)}="{_prom_value(v)}"' for k, v in items) + "}" if items else ""
+
+        with self.lock:
+            series = {k: (v["count"], v["sum"], sorted(v["recent"])) for k, v in self.series.items()}
+            counters = dict(self.counters)
+        out = [f"# TYPE {prefix}_stage_seconds summary"]
+        for (name, labels), (count, total, xs) in sorted(series.items()):
+            base = (("stage", name),) + labels
+            for q in (0.5, 0.95, 0.99):
+                out.append(f"{prefix}_stage_seconds{lbl(base, [('quantile', q)])} {_pct(xs, q):.6f}")
+            out.append(f"{prefix}_stage_seconds_sum{lbl(base)} {total:.6f}")
+            out.append(f"{prefix}_stage_seconds_count{lbl(base)} {count}")
+        for name in sorted({n for n, _ in counters}):
+            metric = f"{prefix}_{_prom_name(name)}_total"
+            out.append(f"# TYPE {metric} counter")
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    out.append(f"{metric}{lbl(labels)} {v:g}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
+span = METRICS.span
+observe = METRICS.observe
+
+
+# =========================
+# EXPORT: HTTP / JSONL
+# =========================
+def serve(registry: Metrics, host: str = "127.0.0.1", port: int = 9108):
+    # GET /metrics в формате Prometheus; сервер в фоновом потоке
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0].rstrip("/") not in ("/metrics", ""):
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="neo-metrics-http").start()
+    return server
+
+
+def rotate(path: Path, backups: int):
+    # metrics.jsonl → .1 → .2 … → .<backups>, самый старый удаляется
+    for i in range(backups - 1, 0, -1):
+        src = path.with_name(f"{path.name}.{i}")
+        if src.exists():
+            os.replace(src, path.with_name(f"{path.name}.{i + 1}"))
+    if backups > 0:
+        os.replace(path, path.with_name(f"{path.name}.1"))
+    else:
+        path.unlink()
+
+
+def start_dumper(registry: Metrics, path: Path, interval_sec: float = 60.0,
+                 max_bytes: int = 32 * 2**20, backups: int = 3):
+    # раз в interval_sec дописывает snapshot() строкой в JSONL; файл больше
+    # max_bytes уходит в .1 (хранится backups штук). Ошибка записи — в лог
+    # один раз на серию, чтобы не засорять его каждую минуту
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stop = threading.Event()
+
+    def loop():
+        failing = False
+        while not stop.wait(interval_sec):
+            try:
+                if max_bytes > 0 and path.exists() and path.stat().st_size >= max_bytes:
+                    rotate(path, int(backups))
+                with path.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(registry.snapshot(), ensure_ascii=False) + "\n")
+                if failing:
+                    log.info("metrics dump: запись в %s снова работает", path)
+                failing = False
+            except Exception as e:
+                if not failing:
+                    log.warning("metrics dump: не удалось записать %s: %s", path, e)
+                failing = True
+
+    threading.Thread(target=loop, daemon=True, name="neo-metrics-dump").start()
+    return stop
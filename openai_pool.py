@@ -0,0 +1,180 @@
+import time
+import threading
+import importlib.util
+
+# =========================
+# OPENAI CLIENT (one pooled client per process)
+# =========================
+# Один OpenAI-клиент на процесс поверх настроенного httpx-пула:
+# keep-alive, лимит соединений, HTTP/2 (если установлен h2), явные таймауты.
+# Обёртка над транспортом считает запросы/ошибки/in-flight и открытые тела
+# ответов (≈ занятые соединения пула) для мастер-панели — только своими
+# счётчиками, без приватных полей httpx/httpcore.
+
+DEFAULT_HTTP = {
+    "max_connections": 64,
+    "max_keepalive_connections": 32,
+    "keepalive_expiry": 60.0,
+    "connect_timeout": 5.0,
+    "read_timeout": 60.0,
+    "write_timeout": 10.0,
+    "pool_timeout": 10.0,
+    "http2": True,
+    "max_retries": 2,
+}
+
+
+def h2_available() -> bool:
+    # только проверка, что пакет есть: httpx сам импортирует h2 при http2=True
+    try:
+        return importlib.util.find_spec("h2") is not None
+    except Exception:
+        return False
+
+
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.requests = 0
+        self.responses = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.open_bodies = 0
+        self.peak_open_bodies = 0
+        self.last_status = None
+        self.last_error = ""
+        self.http2 = False
+        self.limits = {}
+
+    def on_request(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def on_response(self, status: int):
+        with self.lock:
+            self.responses += 1
+            self.in_flight = max(self.in_flight - 1, 0)
+            self.open_bodies += 1
+            self.peak_open_bodies = max(self.peak_open_bodies, self.open_bodies)
+            self.last_status = status
+            if status >= 400:
+                self.errors += 1
+                self.last_error = f"HTTP {status}"
+
+    def on_body_closed(self):
+        with self.lock:
+            self.open_bodies = max(self.open_bodies - 1, 0)
+
+    def on_error(self, e: Exception):
+        with self.lock:
+            self.errors += 1
+            self.in_flight = max(self.in_flight - 1, 0)
+            self.last_error = f"{type(e).__name__}: {e}"[:200]
+
+    def snapshot(self, http_client=None) -> dict:
+        # http_client — для совместимости вызовов; занятость пула — по своим счётчикам
+        with self.lock:
+            out = {
+                "uptime_sec": round(time.time() - self.created_at, 1),
+                "requests": self.requests,
+                "responses": self.responses,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                # тело ответа ещё читается (стрим) — соединение занято
+                "open_responses": self.open_bodies,
+                "peak_open_responses": self.peak_open_bodies,
+                "last_status": self.last_status,
+                "last_error": self.last_error,
+                "http2": self.http2,
+                "limits": dict(self.limits),
+            }
+        return out
+
+
+def _counting_transport(httpx, inner, stats: PoolStats):
+    class CountingStream(httpx.SyncByteStream):
+        # тело ответа: соединение вернётся в пул, когда его закроют
+        def __init__(self, stream):
+            self.stream = stream
+            self.closed = False
+
+        def __iter__(self):
+            yield from self.stream
+
+        def close(self):
+            if not self.closed:
+                self.closed = True
+                stats.on_body_closed()
+            self.stream.close()
+
+    class CountingTransport(httpx.BaseTransport):
+        # in-flight — от отправки запроса до получения заголовков ответа
+        def __init__(self):
+            self.inner = inner
+
+        def handle_request(self, request):
+            stats.on_request()
+            try:
+                resp = self.inner.handle_request(request)
+            except Exception as e:
+                stats.on_error(e)
+                raise
+            stats.on_response(resp.status_code)
+            return httpx.Response(
+                resp.status_code,
+                headers=resp.headers,
+                stream=CountingStream(resp.stream),
+                extensions=resp.extensions,
+            )
+
+        def close(self):
+            self.inner.close()
+
+    return CountingTransport()
+
+
+def make_openai_client(api_key: str, http_cfg: dict = None, base_url: str = None):
+    # возвращает (client, http_client, stats) или (None, None, stats), если openai недоступен;
+    # base_url — другой endpoint (например, локальный bench/fake_openai.py)
+    cfg = {**DEFAULT_HTTP, **(http_cfg or {})}
+    stats = PoolStats()
+    try:
+        import httpx
+        from openai import OpenAI
+    except Exception as e:
+        stats.last_error = f"import: {e}"
+        return None, None, stats
+
+    http2 = bool(cfg["http2"]) and h2_available()
+    limits = httpx.Limits(
+        max_connections=int(cfg["max_connections"]),
+        max_keepalive_connections=int(cfg["max_keepalive_connections"]),
+        keepalive_expiry=float(cfg["keepalive_expiry"]),
+    )
+    timeout = httpx.Timeout(
+        connect=float(cfg["connect_timeout"]),
+        read=float(cfg["read_timeout"]),
+        write=float(cfg["write_timeout"]),
+        pool=float(cfg["pool_timeout"]),
+    )
+    transport = _counting_transport(httpx, httpx.HTTPTransport(http2=http2, limits=limits), stats)
+    http_client = httpx.Client(transport=transport, timeout=timeout)
+    stats.http2 = http2
+    stats.limits = {
+        "max_connections": limits.max_connections,
+        "max_keepalive_connections": limits.max_keepalive_connections,
+        "keepalive_expiry": limits.keepalive_expiry,
+    }
+    client = OpenAI(
+        api_key=api_key,
+        base_url=base_url or None,
+        http_client=http_client,
+        timeout=timeout,
+        max_retries=int(cfg["max_retries"]),
+    )
+    return client, http_client, stats
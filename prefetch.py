@@ -0,0 +1,112 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# =========================
+# SPECULATIVE PREFETCH
+# =========================
+# Пока клиент читает вопрос, следующий вопрос уже генерируется в фоне —
+# по одному кандидату на каждый вариант ответа. Ключ кандидата:
+# (session_id, step_index, answer). Если клиент выбрал вариант — берём
+# готовый результат, если написал своё — кандидаты выбрасываются и идёт
+# обычный вызов. Кандидат, который не успел за timeout, тоже считается
+# брошенным. Брошенные кандидаты всё равно стоят токенов: их результаты
+# (если вызов дошёл до конца) копятся по сессии — pop_unused(), и
+# уходят в on_unused(key, результат) из потока префетча.
+
+
+class Prefetcher:
+    def __init__(self, max_workers: int = 8, ttl_sec: float = 900.0, on_unused=None):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="neo-prefetch")
+        self.ttl_sec = ttl_sec
+        self.on_unused = on_unused
+        self.futures = {}  # key -> (created_ts, future)
+        self.unused = {}   # session_id -> [(created_ts, результат)] брошенных кандидатов
+        # RLock: у готового future add_done_callback зовёт _on_dropped сразу, под тем же локом
+        self.lock = threading.RLock()
+        self.stats = {"submitted": 0, "hits": 0, "misses": 0, "errors": 0, "late": 0, "discarded": 0, "unused": 0}
+
+    def _drop(self, key, f):
+        # под self.lock: кандидат не нужен; уже идущий вызов доработает и будет учтён
+        if f.cancel():
+            return
+        f.add_done_callback(lambda f: self._on_dropped(key, f))
+
+    def _on_dropped(self, key, f):
+        if f.cancelled() or f.exception() is not None:
+            return
+        res = f.result()
+        with self.lock:
+            self.stats["unused"] += 1
+            self.unused.setdefault(key[0], []).append((time.time(), res))
+        if self.on_unused:
+            try:
+                self.on_unused(key, res)
+            except Exception:
+                pass
+
+    def _prune(self, now: float):
+        # брошенные сессии не должны копить результаты бесконечно
+        for k in [k for k, (ts, _) in self.futures.items() if now - ts > self.ttl_sec]:
+            _, f = self.futures.pop(k)
+            self._drop(k, f)
+            self.stats["discarded"] += 1
+        for sid in [sid for sid, xs in self.unused.items() if now - xs[-1][0] > self.ttl_sec]:
+            del self.unused[sid]
+
+    def submit(self, key, fn, *args, **kwargs) -> bool:
+        now = time.time()
+        with self.lock:
+            self._prune(now)
+            if key in self.futures:
+                return False
+            self.futures[key] = (now, self.pool.submit(fn, *args, **kwargs))
+            self.stats["submitted"] += 1
+            return True
+
+    def has(self, key) -> bool:
+        with self.lock:
+            return key in self.futures
+
+    def take(self, key, timeout: float = None):
+        # забирает результат кандидата; None — кандидата нет, он упал
+        # или не успел за timeout (тогда он доработает как брошенный)
+        with self.lock:
+            item = self.futures.pop(key, None)
+        if item is None:
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        try:
+            res = item[1].result(timeout=timeout)
+        except FutureTimeout:
+            with self.lock:
+                self.stats["late"] += 1
+                self._drop(key, item[1])
+            return None
+        except Exception:
+            with self.lock:
+                self.stats["errors"] += 1
+            return None
+        with self.lock:
+            self.stats["hits"] += 1
+        return res
+
+    def discard(self, session_id: str, step_index: int = None):
+        # выбрасывает кандидатов сессии (или конкретного шага)
+        with self.lock:
+            keys = [k for k in self.futures
+                    if k[0] == session_id and (step_index is None or k[1] == step_index)]
+            for k in keys:
+                _, f = self.futures.pop(k)
+                self._drop(k, f)
+            self.stats["discarded"] += len(keys)
+
+    def pop_unused(self, session_id: str) -> list:
+        # результаты брошенных кандидатов сессии (для учёта их токенов)
+        with self.lock:
+            return [res for _, res in self.unused.pop(session_id, [])]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {**self.stats, "pending": len(self.futures)}
@@ -0,0 +1,149 @@
+import json
+import hashlib
+import logging
+
+# =========================
+# PROMPT ASSEMBLY (stable prefix)
+# =========================
+# Порядок сообщений фиксирован: сначала неизменяемый префикс (правила +
+# формат ответа + ядро базы знаний), затем всё, что зависит от шага/сессии.
+# Префикс должен быть байт-в-байт одинаковым между вызовами — тогда
+# провайдер переиспользует кэш промпта. Отпечаток префикса сверяется
+# на каждом вызове, расхождение логируется.
+
+log = logging.getLogger("neo.prompting")
+
+SYSTEM_RULES = """
+Ты — интервьюер по авторской методике "Потенциалы". У тебя есть база знаний ниже.
+Твоя задача: вести интервью СТРОГО по шагам и выдавать вопрос + варианты (если подходят).
+
+ЖЁСТКИЕ ПРАВИЛА:
+1) Не задавай больше 1 уточняющего вопроса на шаг.
+2) Не "мусоль" эмоции. Один уточняющий максимум.
+3) Каждый вопрос должен быть бытовым, понятным, с конкретной ситуацией.
+4) Если возможно, давай 4 варианта ответа (короткие). Всегда добавляй вариант "Другое (своими словами)".
+5) Ты НЕ раскрываешь названия потенциалов клиенту (камни) в клиентском режиме.
+6) Ты всегда возвращаешь строго JSON по схеме.
+""".strip()
+
+QUESTION_GUIDE = """
+Верни JSON (поля строго в этом порядке — вопрос показывается клиенту по мере генерации):
+- question (строка)
+- type: "single" или "text"
+- options: если type="single", дай 4-5 вариантов, последний обязательно "Другое (своими словами)"
+- analysis_update: объект, где:
+    - scores_delta: словарь по камням (можно частично)
+    - col_scores_delta: словарь по колонкам (perception/motivation/tool/result) → частично
+    - positions_guess: p1/p2/p3 (можно null)
+    - confidence: p1/p2/p3 (0..1)
+    - notes_for_master: коротко
+""".strip()
+
+MASTER_REPORT_SYSTEM = (
+    "Ты мастер-диагност. Дай МАСТЕР-ОТЧЁТ строго структурно:\n"
+    "1) Таблица позиций: P1/P2/P3 (потенциал + краткий маркер)\n"
+    "2) Колонки: perception/motivation/tool/result: топ-2 потенциала и почему\n"
+    "3) Конфликты/смещения\n"
+    "4) 6 уточняющих вопросов (короткие)\n"
+    "5) Рекомендации по реализации/монетизации под запрос\n"
+    "Пиши по-русски, конкретно."
+)
+
+
+def build_question_prefix(core_knowledge: str):
+    sys = f"""
+{SYSTEM_RULES}
+
+ФОРМАТ ОТВЕТА:
+{QUESTION_GUIDE}
+
+БАЗА ЗНАНИЙ (ядро, общее для всех шагов):
+---BEGIN KNOWLEDGE---
+{core_knowledge}
+---END KNOWLEDGE---
+""".strip()
+    return [{"role": "system", "content": sys}]
+
+
+def build_question_tail(step_knowledge: str, payload: dict):
+    return [
+        {"role": "user", "content": (
+            "ФРАГМЕНТЫ БАЗЫ ПОД ТЕКУЩИЙ ШАГ:\n"
+            "---BEGIN KNOWLEDGE---\n"
+            f"{step_knowledge}\n"
+            "---END KNOWLEDGE---"
+        )},
+        {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+    ]
+
+
+def build_master_prefix():
+    return [{"role": "system", "content": MASTER_REPORT_SYSTEM}]
+
+
+def fingerprint(messages) -> str:
+    raw = json.dumps(messages, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class PrefixGuard:
+    # запоминает первый отпечаток каждого вида префикса в процессе;
+    # если префикс "поплыл" (например, в него попали данные сессии) — это видно сразу
+    def __init__(self, pinned: dict = None):
+        self.pinned = dict(pinned or {})
+        self.seen = {}
+        self.changes = {}
+
+    def check(self, kind: str, fp: str) -> bool:
+        expected = self.pinned.get(kind) or self.seen.get(kind)
+        self.seen.setdefault(kind, fp)
+        if expected and expected != fp:
+            self.changes[kind] = self.changes.get(kind, 0) + 1
+            log.warning("prompt prefix '%s' changed: %s -> %s (кэш промпта не переиспользуется)", kind, expected, fp)
+            return False
+        return True
+
+
+def assemble(kind: str, prefix, tail, guard: PrefixGuard = None):
+    fp = fingerprint(prefix)
+    if guard is not None:
+        guard.check(kind, fp)
+    return list(prefix) + list(tail), fp
+
+
+def usage_from_response(r) -> dict:
+    u = getattr(r, "usage", None)
+    if u is None:
+        return {}
+    inp = int(getattr(u, "input_tokens", 0) or 0)
+    det = getattr(u, "input_tokens_details", None)
+    cached = int(getattr(det, "cached_tokens", 0) or 0) if det is not None else 0
+    return {
+        "input_tokens": inp,
+        "cached_tokens": cached,
+        "uncached_tokens": max(inp - cached, 0),
+        "output_tokens": int(getattr(u, "output_tokens", 0) or 0),
+    }
+
+
+def add_usage(total: dict, u: dict) -> dict:
+    for k, v in (u or {}).items():
+        total[k] = total.get(k, 0) + v
+    if u:
+        total["calls"] = total.get("calls", 0) + 1
+    return total
+
+
+if __name__ == "__main__":
+    # печатает текущие отпечатки префиксов — их можно закрепить
+    # в config.json → openai.prefix_fingerprints
+    from pathlib import Path
+    from knowledge_index import build_index, format_chunks
+
+    cfg_path = Path("config.json")
+    cfg = json.loads(cfg_path.read_text(encoding="utf-8")) if cfg_path.exists() else {}
+    idx = build_index(Path(cfg.get("knowledge", {}).get("path", "knowledge/positions.md")))
+    print(json.dumps({
+        "question": fingerprint(build_question_prefix(format_chunks(idx.core_chunks()))),
+        "master_report": fingerprint(build_master_prefix()),
+    }, indent=2))
@@ -0,0 +1,507 @@
+import re
+import json
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from scoring import POTS
+from knowledge_index import split_knowledge, tokenize, POT_SPHERE
+from adaptive import position_of, position_scores, margin, step_kind
+
+# =========================
+# QUESTION BANK (offline, без модели)
+# =========================
+# Банк вопросов на каждый id из STEPS, собранный из knowledge/positions.md:
+#   - сфера (p*_scope_1): Смыслы / Эмоции / Материя — описания из базы,
+#   - тип (p*_scope_2): Творцы / Коммуникаторы / Управленцы,
+#   - потенциал (p*_pot_*): по фразе восприятия на каждый камень (1 столбец);
+#     у p2/p3 — другие фразы того же камня, если они в базе есть;
+#     варианты собираются на лету из лидеров позиции.
+# У каждого варианта — разреженный вектор дельт (индекс камня → дельта),
+# ответ превращается в analysis_update локально (answer_update), без модели.
+# Сфера × тип однозначно задают камень, поэтому два вопроса сферы
+# обычно оставляют модели только спорные шаги сужения.
+# Банк хранится компактным JSON в data/ и пересобирается при смене базы:
+#   python -m question_bank
+
+BANK_VERSION = 3
+
+SPHERES = ["Смыслы", "Эмоции", "Материя"]
+TYPES = ["Творцы", "Коммуникаторы", "Управленцы"]
+
+SCOPE_DELTA = 0.5   # вариант сферы/типа — каждому из трёх камней
+POT_DELTA = 0.8     # вариант потенциала — одному камню
+COL_SHARE = 0.6     # доля дельты в колонку perception (вопросы по 1 столбцу)
+OTHER = "Другое (своими словами)"
+
+# как в базе называют сферы и типы (заголовки вида "Эмоции:")
+_HEADINGS = {"Смыслы": "Смыслы", "Эмоции": "Эмоции", "Материи": "Материя", "Материя": "Материя",
+             "Творцы": "Творцы", "Коммуникаторы": "Коммуникаторы", "Управленцы": "Управленцы"}
+
+# маркеры типа в строке "Анализирует ..." у камня
+_TYPE_MARKERS = {
+    "Творцы": ("работоспособн", "исправ", "качеств"),
+    "Коммуникаторы": ("интерес", "популярн", "спрос"),
+    "Управленцы": ("эффективн",),
+}
+
+QUESTIONS = {
+    "scope_1": [
+        "Когда ты разбираешься в чём-то новом, что цепляет внимание первым — само, без усилия?",
+        "Теперь второе: что ещё ты замечаешь так же легко, но немного иначе?",
+        "И третье: на что ещё ты обращаешь внимание, пусть и реже?",
+    ],
+    "scope_2": [
+        "А что именно ты в этом оцениваешь, почти не задумываясь?",
+        "Что ты в этом оцениваешь в первую очередь?",
+        "Что ты в этом оцениваешь?",
+    ],
+    "pot_1": [
+        "Через что ты это обычно чувствуешь — что срабатывает первым?",
+        "Через что это срабатывает у тебя здесь?",
+        "А здесь — через что срабатывает?",
+    ],
+    "pot_2": [
+        "Что из этого больше всего похоже на тебя?",
+        "Что из этого про тебя?",
+        "Что из этого про тебя?",
+    ],
+}
+
+
+# =========================
+# BUILD (из базы знаний)
+# =========================
+# Вариант ответа режется только по границам предложений и запятых: клауза,
+# которая в базе оборвана (скобка без пары, "восприятие через - ...",
+# предлог на конце), в вариант не идёт целиком. Строка, перенесённая
+# посреди фразы, сначала склеивается. check_bank() проверяет готовый банк:
+# сборка с оборванной фразой падает (BankError), а не уходит клиенту.
+
+# предлоги, союзы и частицы, на которых фраза не может кончаться
+_DANGLING = {
+    "в", "во", "на", "с", "со", "к", "ко", "о", "об", "от", "до", "по", "за", "из", "у", "для",
+    "через", "при", "про", "без", "под", "над", "между", "и", "а", "но", "или", "либо", "что",
+    "как", "чтобы", "если", "не", "ни", "же", "то", "его", "её", "их",
+}
+# прилагательное без существительного ("возможную") — фраза оборвана
+_DANGLING_END = re.compile(r"(?:ую|юю)$")
+# клаузы с этими корнями клиенту не показываются (анатомия из пояснений базы)
+_SKIP_ROOTS = ("уретр", "полов", "гениталь")
+# клауза-пояснение ("…, могут различить подделку", "…, ты можешь увидеть") — не вариант
+_EXPLAINS = {"ты", "вы", "он", "она", "они", "это", "тот", "та", "те", "кто", "который", "которые",
+             "может", "могут", "можешь", "можно"}
+# опечатки базы, которые иначе попадают в варианты
+_TYPOS = {"динаминка": "динамика"}
+# "Анализирует работу …, возможную популярность" — винительный падеж в начале клаузы;
+# подпись варианта отвечает на "что из этого про тебя?" и должна быть в именительном
+_ACC_ADJ = re.compile(r"^(\w{3,})(ую|юю)$")
+# (-ому/-ему — дательный прилагательного: "к продукту, функциональному устройству")
+_ACC_NOUN = re.compile(r"^(\w{3,}[бвгджзклмнпрстфхцчшщ])(?<!ом)(?<!ем)(у|ю)$")
+_NOM = {"ую": "ая", "юю": "яя", "у": "а", "ю": "я"}
+
+
+class BankError(ValueError):
+    pass
+
+
+def _strip_parens(text: str) -> str:
+    # (…) с вложенностью; скобка без пары — всё от неё до конца строки
+    out, depth = [], 0
+    for ch in text:
+        if ch == "(":
+            depth += 1
+        elif ch == ")" and depth:
+            depth -= 1
+        elif not depth:
+            out.append(ch)
+    return "".join(out)
+
+
+def _unwrap(lines: list) -> list:
+    # строка, перенесённая посреди фразы (без точки, следующая — со строчной), склеивается
+    out = []
+    for line in lines:
+        if out and line[:1].islower() and not out[-1].endswith((".", "!", "?", ":")):
+            out[-1] = f"{out[-1]} {line}"
+        else:
+            out.append(line)
+    return out
+
+
+def _fix_word(w: str) -> str:
+    fixed = _TYPOS.get(w.lower())
+    if fixed is None:
+        return w
+    return fixed[:1].upper() + fixed[1:] if w[:1].isupper() else fixed
+
+
+def _clause_ok(clause: str) -> bool:
+    words = re.findall(r"\w+", clause.lower())
+    if not words or words[-1] in _DANGLING or _DANGLING_END.search(words[-1]):
+        return False
+    if words[0] in _EXPLAINS:
+        return False
+    return not any(w.startswith(_SKIP_ROOTS) for w in words)
+
+
+def _clean(text: str, max_chars: int = 90, whole: bool = False) -> str:
+    # короткая фраза для варианта: без скобок, целыми клаузами до max_chars;
+    # на первой негодной клаузе фраза кончается. whole — только фраза целиком
+    t = _strip_parens(text or "")
+    t = re.sub(r"\s+", " ", t).strip(" .,;:-")
+    t = re.sub(r"^Анали\w+[\s,]+", "", t)
+    t = t.split(" - ")[0]  # пояснение после тире в вариант не идёт
+    t = re.sub(r"\w+", lambda m: _fix_word(m.group()), t)
+    clauses = []
+    for sentence in re.split(r"(?<=[.;!?])\s+", t):
+        for i, clause in enumerate(sentence.split(",")):
+            clauses.append((", " if i else ". ", clause.strip(" .;:!?-")))
+    out, complete = "", True
+    for sep, clause in clauses:
+        if not _clause_ok(clause) or len(out) + len(sep) + len(clause) > max_chars:
+            complete = False
+            break
+        out = f"{out}{sep}{clause}" if out else clause
+    if whole and not complete:
+        return ""
+    return out[:1].upper() + out[1:]
+
+
+def _to_nom(word: str, rx) -> str:
+    m = rx.match(word)
+    return m.group(1) + _NOM[m.group(2)] if m else word
+
+
+def _accusative_head(clause: str) -> bool:
+    words = clause.split()
+    return bool(words) and bool(_ACC_ADJ.match(words[0].lower()) or _ACC_NOUN.match(words[0].lower()))
+
+
+def _nominative(phrase: str) -> str:
+    # "Аналитик эффективности …" → "Эффективность …" (ответ на "что ты оцениваешь?");
+    # "работу производства" → "работа …", "возможную популярность" → "возможная …"
+    head, _, rest = phrase.partition(" ")
+    if head.lower().endswith("ости"):
+        head = head[:-1] + "ь"
+    clauses = []
+    for clause in f"{head} {rest}".strip().split(", "):
+        words = clause.split(" ")
+        first = words[0]
+        if _ACC_ADJ.match(first.lower()):
+            words[0] = _to_nom(first, _ACC_ADJ)
+            if len(words) > 1:
+                words[1] = _to_nom(words[1], _ACC_NOUN)
+        else:
+            words[0] = _to_nom(first, _ACC_NOUN)
+        clauses.append(" ".join(words))
+    return ", ".join(clauses)
+
+
+def _headed(text: str) -> dict:
+    # "Эмоции:\nописание" → {"Эмоции": "описание"}
+    out = {}
+    lines = [l.strip() for l in text.splitlines()]
+    for i, line in enumerate(lines):
+        key = _HEADINGS.get(line.rstrip(":").strip()) if line.endswith(":") else None
+        if key and key not in out:
+            nxt = next((l for l in lines[i + 1:] if l), "")
+            out[key] = _clean(nxt)
+    return out
+
+
+def _analyses(line: str) -> bool:
+    return line.lower().startswith(("анализ", "аналит"))
+
+
+def _perceives(line: str) -> bool:
+    return "восприят" in line.lower() or "воспринима" in line.lower()
+
+
+def _pot_type(text: str):
+    # тип камня по строкам "Анализирует ..." (кто что анализирует в 1 столбце)
+    hits = {t: 0 for t in TYPES}
+    for line in text.splitlines():
+        low = line.lower()
+        if not _analyses(low):
+            continue
+        for t, markers in _TYPE_MARKERS.items():
+            hits[t] += sum(1 for m in markers if m in low)
+    best = max(TYPES, key=lambda t: hits[t])
+    return best if hits[best] else None
+
+
+def _pot_phrases(text: str, pot: str):
+    # [[каналы восприятия], [что анализирует]] — без названия камня и цвета;
+    # по варианту на позицию, чтобы p2/p3 не повторяли формулировки p1
+    lines = _unwrap([l.strip() for l in text.splitlines() if l.strip()])
+    head = lines[0] if lines else ""
+    # цвет из заголовка "Сапфировый (Синий) потенциал" — по корню слова
+    banned = [pot[:5].lower()] + [w[:-2].lower() for w in re.findall(r"\((\w{5,})", head)]
+    channels, analyses = [], []
+    for i, line in enumerate(lines[1:]):
+        if any(b in line.lower() for b in banned):
+            continue
+        if _analyses(line):
+            out = analyses
+        elif i == 0 or _perceives(line):
+            out = channels
+        else:
+            continue
+        # первая фраза может быть началом строки; запасные (для p2/p3) — только целые
+        phrase = _clean(line, whole=bool(out))
+        if out is analyses:
+            phrase = _nominative(phrase)
+        if out and (not phrase or "/" in phrase or phrase.split()[0].lower() in _DANGLING):
+            continue
+        if phrase and phrase not in out and len(out) < 3:
+            out.append(phrase)
+    return [channels, analyses or channels]
+
+
+def check_bank(data: dict) -> list:
+    # все подписи вариантов: целые фразы, без анатомии, различимы внутри вопроса
+    problems = []
+
+    def label(where, text, nominative=True):
+        # nominative — вопрос ждёт ответ в именительном ("что цепляет?", "что про тебя?");
+        # у scope_2 ("что оцениваешь?") — винительный
+        if not text:
+            problems.append(f"{where}: пусто")
+        elif not _clause_ok(text.rsplit(",", 1)[-1]) or text.count("(") != text.count(")"):
+            problems.append(f"{where}: оборванная фраза: {text!r}")
+        elif text.endswith(("-", ",", "…", ":")):
+            problems.append(f"{where}: оборванная фраза: {text!r}")
+        elif nominative and any(_accusative_head(c) for c in text.split(", ")):
+            problems.append(f"{where}: не именительный падеж: {text!r}")
+
+    for step_id, spec in (data.get("steps") or {}).items():
+        for text, _ in spec.get("o") or []:
+            label(step_id, text, not step_id.endswith("scope_2"))
+    phrases = data.get("phrases") or []
+    for pot, kinds in zip(data.get("pots") or [], phrases):
+        for kind, xs in enumerate(kinds):
+            if not xs:
+                problems.append(f"{pot}/{kind}: нет фраз")
+            for text in xs:
+                label(f"{pot}/{kind}", text)
+    # на одном шаге у разных камней — разные подписи (иначе bank_options схлопнется)
+    for step_id, spec in (data.get("steps") or {}).items():
+        if "phrase" not in spec:
+            continue
+        seen = [pick_phrase(kinds[spec["phrase"]], spec.get("alt", 0)) for kinds in phrases]
+        dups = {t for t in seen if t and seen.count(t) > 1}
+        if dups:
+            problems.append(f"{step_id}: одинаковые варианты у разных камней: {sorted(dups)}")
+    return problems
+
+
+def pick_phrase(xs: list, alt: int) -> str:
+    return xs[alt % len(xs)] if xs else ""
+
+
+def _sparse(pots) -> list:
+    return [POTS.index(p) for p in pots]
+
+
+def build_bank_dict(text: str, source_hash: str = "") -> dict:
+    chunks = split_knowledge(text)
+    col1 = [c for c in chunks if c["column"] == 1]
+    core = "\n".join(c["text"] for c in col1 if c["pot"] is None)
+    heads = _headed(core)
+
+    pot_text = {}
+    for c in col1:
+        if c["pot"]:
+            pot_text.setdefault(c["pot"], []).append(c["text"])
+    pot_text = {p: "\n".join(xs) for p, xs in pot_text.items()}
+
+    # сетка 3×3: сфера — из индекса, тип — из текста (иначе по порядку POTS)
+    grid = {}
+    for i, p in enumerate(POTS):
+        grid[p] = {
+            "sphere": POT_SPHERE.get(p) or SPHERES[i // 3],
+            "type": _pot_type(pot_text.get(p, "")) or TYPES[i % 3],
+        }
+
+    def scope(groups, field):
+        return [
+            [heads.get(g) or g, _sparse([p for p in POTS if grid[p][field] == g])]
+            for g in groups
+        ]
+
+    steps = {}
+    for pos in (1, 2, 3):
+        k = pos - 1
+        steps[f"p{pos}_scope_1"] = {"q": QUESTIONS["scope_1"][k],
+                                    "o": [[_nominative(t), ix] for t, ix in scope(SPHERES, "sphere")]}
+        steps[f"p{pos}_scope_2"] = {"q": QUESTIONS["scope_2"][k], "o": scope(TYPES, "type")}
+        steps[f"p{pos}_pot_1"] = {"q": QUESTIONS["pot_1"][k], "phrase": 0, "alt": k}
+        steps[f"p{pos}_pot_2"] = {"q": QUESTIONS["pot_2"][k], "phrase": 1, "alt": k}
+
+    return {
+        "v": BANK_VERSION,
+        "src": source_hash,
+        "pots": POTS,
+        "grid": [[SPHERES.index(grid[p]["sphere"]), TYPES.index(grid[p]["type"])] for p in POTS],
+        "phrases": [_pot_phrases(pot_text.get(p, ""), p) for p in POTS],
+        "steps": steps,
+    }
+
+
+# =========================
+# RUNTIME
+# =========================
+def confidence_from(local: np.ndarray) -> float:
+    # разрыв лидера со вторым: 0 → 0.2, сфера+тип совпали (0.5) → 0.5, + потенциал → 0.95
+    return round(min(0.95, 0.2 + 0.6 * margin(local)), 3)
+
+
+class QuestionBank:
+    def __init__(self, data: dict):
+        self.data = data
+        self.steps = data.get("steps") or {}
+        self.phrases = data.get("phrases") or [[[], []] for _ in POTS]
+
+    @property
+    def source_hash(self) -> str:
+        return self.data.get("src", "")
+
+    def _spec(self, step_id: str):
+        # уточнение позиции (p2_refine_1) — как дожим потенциала этой позиции
+        if step_kind(step_id).startswith("refine"):
+            step_id = f"p{position_of(step_id)}_pot_2"
+        return self.steps.get(step_id)
+
+    def has(self, step_id: str) -> bool:
+        return self._spec(step_id) is not None
+
+    def question(self, step_id: str, state) -> dict:
+        # готовый вопрос в контракте модели + варианты с дельтами (bank_options)
+        spec = self._spec(step_id)
+        if "o" in spec:
+            options = [(label, idx, SCOPE_DELTA) for label, idx in spec["o"]]
+        else:
+            local = position_scores(state, position_of(step_id), "total")
+            free = [i for i in range(len(POTS)) if np.isfinite(local[i])]
+            # лидеры позиции; при равенстве — порядок POTS
+            top = sorted(free, key=lambda i: (-local[i], i))[:3]
+            top.sort()
+            kind, alt = spec.get("phrase", 0), spec.get("alt", 0)
+            options = [(pick_phrase(self.phrases[i][kind], alt) or POTS[i], [i], POT_DELTA) for i in top]
+        return {
+            "question": spec["q"],
+            "type": "single",
+            "options": [label for label, _, _ in options] + [OTHER],
+            "analysis_update": {},
+            "source": "bank",
+            "bank_step": step_id,
+            "bank_options": {label: {"pots": idx, "delta": d} for label, idx, d in options},
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "version": self.data.get("v"),
+            "source_hash": self.source_hash[:12],
+            "steps": len(self.steps),
+            "grid": {p: f"{SPHERES[s]} / {TYPES[t]}" for p, (s, t) in zip(POTS, self.data.get("grid") or [])},
+        }
+
+
+def _match_option(ans: str, options: dict):
+    # свободный ответ → вариант с наибольшим пересечением слов (или None)
+    words = set(tokenize(ans))
+    best, best_n = None, 0
+    for label in options:
+        n = len(words & set(tokenize(label)))
+        if n > best_n:
+            best, best_n = label, n
+    return best
+
+
+def answer_update(q: dict, ans: str, state) -> dict:
+    # локальный скоринг ответа на вопрос из банка → analysis_update
+    options = q.get("bank_options") or {}
+    label = ans if ans in options else _match_option(str(ans or ""), options)
+    pos = position_of(q.get("bank_step", ""))
+    update = {"notes_for_master": "bank"}
+    if label is None or not pos:
+        return update
+    opt = options[label]
+    # свободный текст весит вдвое меньше явного выбора
+    d = float(opt["delta"]) * (1.0 if label == ans else 0.5)
+    local = position_scores(state, pos, "total")
+    pots = [i for i in opt["pots"] if np.isfinite(local[i])]
+    if not pots:
+        return update
+    for i in pots:
+        local[i] += d
+    lead = int(np.argmax(local))
+    update.update({
+        "scores_delta": {POTS[i]: d for i in pots},
+        "col_scores_delta": {"perception": {POTS[i]: round(d * COL_SHARE, 3) for i in pots}},
+        "positions_guess": {f"p{pos}": POTS[lead]},
+        "confidence": {f"p{pos}": confidence_from(local)},
+    })
+    return update
+
+
+def bank_first(step_id: str, state, pot_margin: float) -> bool:
+    # сфера/тип — всегда из банка; сужение до потенциала — только если позиция уже ясна
+    if step_kind(step_id).startswith("scope"):
+        return True
+    pos = position_of(step_id)
+    return bool(pos) and margin(position_scores(state, pos, "total")) >= pot_margin
+
+
+def build_bank(md_path: Path, cache_path: Path = None):
+    # QuestionBank или None (нет базы); пересборка при смене базы или версии банка;
+    # BankError — банк не прошёл check_bank
+    if not md_path.exists():
+        return None
+    raw = md_path.read_bytes()
+    h = hashlib.sha256(raw).hexdigest()
+
+    if cache_path and cache_path.exists():
+        try:
+            d = json.loads(cache_path.read_text(encoding="utf-8"))
+            if d.get("v") == BANK_VERSION and d.get("src") == h:
+                return QuestionBank(d)
+        except Exception:
+            pass
+
+    data = build_bank_dict(raw.decode("utf-8"), h)
+    problems = check_bank(data)
+    if problems:
+        # оборванные варианты клиенту не уходят: банк не собирается, вопросы задаёт модель
+        raise BankError("; ".join(problems))
+    bank = QuestionBank(data)
+    if cache_path:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(
+                json.dumps(bank.data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8"
+            )
+        except Exception:
+            pass
+    return bank
+
+
+if __name__ == "__main__":
+    # пересобрать банк заранее (например, в сборке образа) и показать сетку
+    cfg_path = Path("config.json")
+    cfg = json.loads(cfg_path.read_text(encoding="utf-8")) if cfg_path.exists() else {}
+    bcfg = cfg.get("question_bank", {})
+    md = Path(cfg.get("knowledge", {}).get("path", "knowledge/positions.md"))
+    out = Path(bcfg.get("path", "data/question_bank.json"))
+    if out.exists():
+        out.unlink()
+    try:
+        bank = build_bank(md, out)
+    except BankError as e:
+        raise SystemExit(f"банк вопросов не прошёл проверку: {e}")
+    if bank is None:
+        raise SystemExit(f"нет базы знаний: {md}")
+    print(json.dumps({**bank.snapshot(), "bytes": out.stat().st_size if out.exists() else 0},
+                     ensure_ascii=False, indent=2))
@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import logging
+import uuid
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+
+from prompting import add_usage
+
+# =========================
+# REPORT JOBS (фоновая очередь мастер-отчётов)
+# =========================
+# Очередь — таблица report_jobs в том же SQLite, что и индекс сессий:
+# переживает закрытие вкладки и рестарт процесса (зависшие "running"
+# старше stale_sec возвращаются в очередь — при старте и из kick(), не чаще
+# раза в STALE_CHECK_SEC). Ошибка захвата (SQLite "database is locked")
+# не убивает воркера: повтор с паузой, после CLAIM_RETRIES подряд воркер
+# выходит, следующий kick() поднимет нового. Локальные воркеры-потоки
+# (не больше `workers`) забирают задания по одному, модель вызывается
+# через generate(payload, model, force) — тот же call_ai_master_report с очередью
+# вызовов и повторами. Запись идемпотентна: payload перечитывается перед
+# записью, готовый отчёт без force не перезаписывается; с force кэш ответов
+# не читается — иначе неизменная сессия получила бы тот же текст.
+#
+#   python -m report_jobs --missing --workers 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    session_id TEXT PRIMARY KEY,
+    batch      TEXT NOT NULL DEFAULT '',
+    status     TEXT NOT NULL DEFAULT 'queued',
+    model      TEXT NOT NULL DEFAULT '',
+    force      INTEGER NOT NULL DEFAULT 0,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    error      TEXT NOT NULL DEFAULT '',
+    created    REAL NOT NULL DEFAULT 0,
+    started    REAL NOT NULL DEFAULT 0,
+    finished   REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_report_jobs_status ON report_jobs(status, created);
+"""
+
+log = logging.getLogger("neo.report_jobs")
+
+STALE_CHECK_SEC = 60.0
+CLAIM_RETRIES = 5
+
+STATUSES = ("queued", "running", "done", "skipped", "failed", "cancelled")
+ACTIVE = ("queued", "running")
+
+
+class ReportQueue:
+    def __init__(self, store, generate, workers: int = 2, max_attempts: int = 2, stale_sec: float = 600.0):
+        # generate(payload, model, force) → (текст, usage); исключение — задание не удалось;
+        # force — перегенерация готового отчёта, мимо кэша ответов
+        self.store = store
+        self.generate = generate
+        self.workers = max(int(workers), 1)
+        self.max_attempts = max(int(max_attempts), 1)
+        self.stale_sec = float(stale_sec)
+        self.lock = threading.Lock()
+        self.threads = []
+        self._local = threading.local()
+        self.stale_checked = 0.0
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self.requeue_stale()
+        self.stale_checked = time.monotonic()
+
+    # ---------- db ----------
+    def _conn(self) -> sqlite3.Connection:
+        # своё соединение на поток, транзакции — вручную (BEGIN IMMEDIATE при захвате)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.store.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def requeue_stale(self) -> int:
+        # "running", брошенные упавшим процессом, — снова в очередь
+        cur = self._conn().execute(
+            "UPDATE report_jobs SET status='queued' WHERE status='running' AND started < ?",
+            (time.time() - self.stale_sec,),
+        )
+        return cur.rowcount
+
+    # ---------- enqueue ----------
+    def enqueue(self, session_ids, model: str, force: bool = False) -> str:
+        # уже стоящие в очереди / выполняемые не дублируются; остальные — заново
+        batch = uuid.uuid4().hex[:8]
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO report_jobs (session_id, batch, status, model, force, created) "
+                "VALUES (?, ?, 'queued', ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET batch=excluded.batch, status='queued', "
+                "model=excluded.model, force=excluded.force, attempts=0, error='', "
+                "created=excluded.created, started=0, finished=0 "
+                "WHERE report_jobs.status NOT IN ('queued', 'running')",
+                [(sid, batch, model, int(bool(force)), now + i * 1e-6) for i, sid in enumerate(session_ids)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.kick()
+        return batch
+
+    def enqueue_missing(self, model: str, limit: int = -1) -> str:
+        # все сессии без ai_master_report (по индексу)
+        return self.enqueue(self.store.without_report(limit), model)
+
+    def cancel(self, batch: str = None) -> int:
+        sql = "UPDATE report_jobs SET status='cancelled', finished=? WHERE status='queued'"
+        args = [time.time()]
+        if batch:
+            sql += " AND batch=?"
+            args.append(batch)
+        return self._conn().execute(sql, args).rowcount
+
+    def retry_failed(self, model: str = None) -> str:
+        rows = self._conn().execute("SELECT session_id, model FROM report_jobs WHERE status='failed'").fetchall()
+        if not rows:
+            return ""
+        return self.enqueue([r["session_id"] for r in rows], model or rows[0]["model"])
+
+    # ---------- workers ----------
+    def kick(self):
+        # добрать воркеров до лимита, если в очереди что-то есть;
+        # заодно вернуть в очередь задания упавших воркеров
+        now = time.monotonic()
+        if now - self.stale_checked >= min(STALE_CHECK_SEC, self.stale_sec):
+            self.stale_checked = now
+            try:
+                n = self.requeue_stale()
+                if n:
+                    log.warning("report_jobs: %s зависших заданий снова в очереди", n)
+            except sqlite3.Error as e:
+                log.warning("report_jobs: requeue_stale: %s", e)
+        with self.lock:
+            self.threads = [t for t in self.threads if t.is_alive()]
+            need = min(self.workers - len(self.threads), self.pending())
+            for _ in range(max(need, 0)):
+                t = threading.Thread(target=self._worker, daemon=True, name="neo-report-job")
+                t.start()
+                self.threads.append(t)
+
+    def pending(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM report_jobs WHERE status='queued'").fetchone()[0]
+
+    def alive(self) -> int:
+        with self.lock:
+            return sum(t.is_alive() for t in self.threads)
+
+    def _claim(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT session_id, batch, model, force, attempts FROM report_jobs "
+                "WHERE status='queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE report_jobs SET status='running', started=?, attempts=attempts+1 WHERE session_id=?",
+                    (time.time(), row["session_id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row is not None else None
+
+    def _finish(self, sid: str, status: str, error: str = ""):
+        self._conn().execute(
+            "UPDATE report_jobs SET status=?, error=?, finished=? WHERE session_id=? AND status='running'",
+            (status, error[:300], time.time(), sid),
+        )
+
+    def _worker(self):
+        fails = 0
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                fails += 1
+                log.warning("report_jobs: захват задания не удался (%s/%s): %s", fails, CLAIM_RETRIES, e)
+                if fails >= CLAIM_RETRIES:
+                    return
+                time.sleep(min(0.5 * 2 ** fails, 8.0))
+                continue
+            fails = 0
+            if job is None:
+                return
+            sid = job["session_id"]
+            try:
+                status, error = self.run_job(job), ""
+            except Exception as e:
+                status, error = "failed", f"{type(e).__name__}: {e}"
+            try:
+                if status == "failed" and job["attempts"] + 1 < self.max_attempts:
+                    self._conn().execute("UPDATE report_jobs SET status='queued', error=? WHERE session_id=?",
+                                         (error[:300], sid))
+                else:
+                    self._finish(sid, status, error)
+            except sqlite3.Error as e:
+                # задание останется "running" — его вернёт requeue_stale
+                log.warning("report_jobs: статус %s для %s не записан: %s", status, sid, e)
+
+    def run_job(self, job: dict) -> str:
+        sid, force = job["session_id"], bool(job["force"])
+        payload = self.store.load(sid)
+        if payload is None:
+            raise FileNotFoundError(f"нет сессии {sid}")
+        if payload.get("ai_master_report") and not force:
+            return "skipped"
+        text, usage = self.generate(payload, job["model"], force)
+        # пока шёл вызов, сессию могли изменить — пишем в свежую копию
+        fresh = self.store.load(sid) or payload
+        if fresh.get("ai_master_report") and not force:
+            return "skipped"
+        fresh["ai_master_report"] = text
+        meta = fresh.setdefault("meta", {})
+        add_usage(meta.setdefault("report_usage", {}), usage)
+        meta["report_job"] = {"batch": job["batch"], "model": job["model"], "ts": time.time()}
+        self.store.save(fresh)
+        return "done"
+
+    # ---------- progress ----------
+    def progress(self, batch: str = None) -> dict:
+        sql, args = "SELECT status, COUNT(*) AS n FROM report_jobs", []
+        if batch:
+            sql += " WHERE batch=?"
+            args.append(batch)
+        counts = {s: 0 for s in STATUSES}
+        for r in self._conn().execute(sql + " GROUP BY status", args):
+            counts[r["status"]] = r["n"]
+        counts["total"] = sum(counts[s] for s in STATUSES if s != "cancelled")
+        counts["workers"] = self.alive()
+        return counts
+
+    def status(self, session_id: str):
+        r = self._conn().execute("SELECT * FROM report_jobs WHERE session_id=?", (session_id,)).fetchone()
+        return dict(r) if r else None
+
+    def recent(self, status: str = None, limit: int = 20) -> list:
+        sql, args = "SELECT session_id, batch, status, model, attempts, error, finished FROM report_jobs", []
+        if status:
+            sql += " WHERE status=?"
+            args.append(status)
+        sql += " ORDER BY created DESC LIMIT ?"
+        return [dict(r) for r in self._conn().execute(sql, args + [limit])]
+
+    def wait(self, poll_sec: float = 1.0, on_progress=None):
+        # до опустошения очереди (для CLI)
+        while True:
+            p = self.progress()
+            if on_progress:
+                on_progress(p)
+            if not (p["queued"] or p["running"]):
+                return p
+            self.kick()
+            time.sleep(poll_sec)
+
+
+def main(argv=None):
+    # пакетная генерация без UI (например, утренним cron); ключ — OPENAI_API_KEY
+    from session_store import SessionStore
+    from openai_pool import make_openai_client
+    from prompting import PrefixGuard
+    from response_cache import ResponseCache
+    from scheduler import Scheduler
+    from resilience import ResilientCaller
+    from interview import call_ai_master_report
+    import budget
+
+    cfg_path = Path("config.json")
+    cfg = json.loads(cfg_path.read_text(encoding="utf-8")) if cfg_path.exists() else {}
+    ocfg, rcfg = cfg.get("openai", {}), cfg.get("reports", {})
+
+    ap = argparse.ArgumentParser(description="Фоновая генерация мастер-отчётов")
+    ap.add_argument("--missing", action="store_true", help="все сессии без ai_master_report")
+    ap.add_argument("--sessions", nargs="*", default=[], help="конкретные session_id")
+    ap.add_argument("--force", action="store_true", help="перегенерировать готовые отчёты")
+    ap.add_argument("--retry-failed", action="store_true")
+    ap.add_argument("--workers", type=int, default=int(rcfg.get("workers", 2)))
+    ap.add_argument("--model", default=ocfg.get("model", "gpt-4.1-mini"))
+    args = ap.parse_args(argv)
+
+    http_cfg = dict(ocfg.get("http") or {})
+    if cfg.get("resilience", {}).get("enabled", True):
+        http_cfg["max_retries"] = 0
+    client, _, stats = make_openai_client(os.getenv("OPENAI_API_KEY", ""), http_cfg, ocfg.get("base_url"))
+    if client is None:
+        raise SystemExit(f"openai недоступен: {stats.last_error}")
+    guard = PrefixGuard(ocfg.get("prefix_fingerprints"))
+    ccfg, scfg = cfg.get("cache", {}), cfg.get("scheduler", {})
+    cache = ResponseCache(
+        disk_dir=ccfg.get("disk_dir") or None,
+        disk_max_bytes=int(float(ccfg.get("disk_max_mb", 256)) * 2**20),
+        disk_max_files=int(ccfg.get("disk_max_files", 50000)),
+    ) if ccfg.get("enabled", True) else None
+    scheduler = Scheduler(max_concurrency=args.workers) if scfg.get("enabled", True) else None
+    resilience = ResilientCaller(cfg.get("resilience")) if cfg.get("resilience", {}).get("enabled", True) else None
+    limits = budget.configure(cfg.get("budget"))
+
+    def generate(payload, model, force=False):
+        return call_ai_master_report(client, model, payload, guard, cache, scheduler, resilience,
+                                     cfg.get("history"), limits, force)
+
+    scfg = cfg.get("storage", {})
+    store = SessionStore(Path(scfg.get("data_dir", "data/sessions")), encoding=scfg.get("encoding", "compact"))
+    store.sync()
+    queue = ReportQueue(store, generate, args.workers, int(rcfg.get("max_attempts", 2)),
+                        float(rcfg.get("stale_sec", 600)))
+    if args.missing:
+        queue.enqueue_missing(args.model)
+    if args.sessions:
+        queue.enqueue(args.sessions, args.model, args.force)
+    if args.retry_failed:
+        queue.retry_failed(args.model)
+    queue.kick()  # и то, что осталось от прошлого запуска
+
+    t0 = time.time()
+    last = {}
+
+    def show(p):
+        if p != last:
+            last.clear()
+            last.update(p)
+            print(json.dumps({"t": round(time.time() - t0, 1), **p}, ensure_ascii=False), flush=True)
+
+    queue.wait(on_progress=show)
+    for r in queue.recent("failed"):
+        print(json.dumps(r, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
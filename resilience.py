@@ -0,0 +1,331 @@
+import re
+import json
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from scheduler import SchedulerBusy
+
+# =========================
+# RESILIENT MODEL CALLS
+# =========================
+# Слой между интервью и моделью:
+#   - бюджет времени на шаг: все попытки укладываются в step_budget_sec,
+#     у каждого запроса — таймаут на остаток бюджета, он же предел ожидания
+#     в очереди вызовов (scheduler.py),
+#   - повтор с экспоненциальной задержкой и джиттером (только для
+#     временных ошибок: таймаут, сеть, 429, 5xx, битый ответ),
+#   - хеджирование: если ответа нет дольше p95 недавних вызовов, уходит
+#     второй такой же запрос — берётся первый валидный,
+#   - circuit breaker: после серии сбоев модель не дёргается reset_sec,
+#   - перед повтором ответ чинится и проверяется локально (repair_json / validate_question).
+# Исчерпанный бюджет / открытый breaker → ModelUnavailable (UI предлагает «Повторить»).
+# Ошибка запроса, которую повтор не исправит (FATAL_STATUS: ключ, модель, запрос), —
+# тоже ModelUnavailable, с исходной ошибкой в __cause__: тот же банк / «Повторить»,
+# а не трейсбек у клиента.
+
+DEFAULTS = {
+    "step_budget_sec": 25.0,
+    "report_budget_sec": 120.0,
+    "max_attempts": 3,
+    "backoff_base_sec": 0.5,
+    "backoff_max_sec": 4.0,
+    "hedge": True,
+    "hedge_after_sec": 0.0,     # 0 — адаптивно, p95 последних вызовов
+    "hedge_min_sec": 2.0,
+    "breaker_failures": 5,
+    "breaker_reset_sec": 30.0,
+}
+
+# ошибки запроса, которые повтор не исправит
+FATAL_STATUS = {400, 401, 403, 404, 422}
+
+
+class ModelUnavailable(RuntimeError):
+    pass
+
+
+class CircuitOpen(ModelUnavailable):
+    pass
+
+
+class InvalidAnswer(ValueError):
+    pass
+
+
+# =========================
+# JSON REPAIR / SCHEMA
+# =========================
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.I)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def _close_truncated(text: str) -> str:
+    # дописывает незакрытые строку/скобки (ответ оборван по длине)
+    stack, in_str, esc = [], False, False
+    for ch in text:
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    out = text
+    if esc:
+        out = out[:-1]
+    if in_str:
+        out += '"'
+    out = re.sub(r'[,:]\s*$', "", out.rstrip())
+    out = re.sub(r',\s*"[^"]*"\s*$', "", out)  # ключ без значения
+    return out + "".join(reversed(stack))
+
+
+def repair_json(text: str):
+    # dict или None; дёшево и без обращений к модели
+    if not isinstance(text, str) or not text.strip():
+        return None
+    try:
+        v = json.loads(text)
+        return v if isinstance(v, dict) else None
+    except Exception:
+        pass
+    t = _FENCE.sub("", text.strip())
+    start = t.find("{")
+    if start < 0:
+        return None
+    t = t[start:]
+    end = t.rfind("}")
+    for cand in ([t[:end + 1]] if end > 0 else []) + [_close_truncated(t)]:
+        cand = _TRAILING_COMMA.sub(r"\1", cand)
+        try:
+            v = json.loads(cand)
+        except Exception:
+            continue
+        if isinstance(v, dict):
+            return v
+    return None
+
+
+def validate_question(q) -> dict:
+    # приводит ответ к контракту вопроса; InvalidAnswer — если вопроса нет совсем
+    if not isinstance(q, dict):
+        raise InvalidAnswer("not an object")
+    text = q.get("question")
+    if not isinstance(text, str) or not text.strip():
+        raise InvalidAnswer("no question")
+    options = q.get("options")
+    options = [str(o) for o in options if isinstance(o, (str, int, float)) and str(o).strip()] \
+        if isinstance(options, list) else []
+    qtype = q.get("type")
+    if qtype not in ("single", "text"):
+        qtype = "single" if options else "text"
+    if qtype == "single" and not options:
+        qtype = "text"
+    update = q.get("analysis_update")
+    return {
+        **q,
+        "question": text.strip(),
+        "type": qtype,
+        "options": options if qtype == "single" else [],
+        "analysis_update": update if isinstance(update, dict) else {},
+    }
+
+
+def parse_question(text: str):
+    # → (вопрос, был ли ремонт JSON)
+    try:
+        q, repaired = json.loads(text), False
+    except Exception:
+        q, repaired = repair_json(text), True
+    if q is None:
+        raise InvalidAnswer("unparseable JSON")
+    return validate_question(q), repaired
+
+
+# =========================
+# BREAKER / CALLER
+# =========================
+class CircuitBreaker:
+    def __init__(self, failures: int = 5, reset_sec: float = 30.0):
+        self.failures = max(int(failures), 1)
+        self.reset_sec = float(reset_sec)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.opened_at = None
+        self.trips = 0
+
+    def state(self, now: float = None) -> str:
+        now = time.monotonic() if now is None else now
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if now - self.opened_at >= self.reset_sec else "open"
+
+    def allow(self) -> bool:
+        # в half_open пропускаем пробные запросы; первый успех закроет breaker
+        with self.lock:
+            return self.state() != "open"
+
+    def on_success(self):
+        with self.lock:
+            self.count = 0
+            self.opened_at = None
+
+    def on_failure(self):
+        with self.lock:
+            self.count += 1
+            if self.count >= self.failures and self.state() != "open":
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+
+def retriable(e: Exception) -> bool:
+    if isinstance(e, (SchedulerBusy, ModelUnavailable)):
+        return False
+    return getattr(e, "status_code", None) not in FATAL_STATUS
+
+
+def fatal_reason(e: Exception) -> str:
+    status = getattr(e, "status_code", None)
+    return f"{status} {type(e).__name__}" if status else type(e).__name__
+
+
+class ResilientCaller:
+    def __init__(self, cfg: dict = None):
+        self.cfg = {**DEFAULTS, **(cfg or {})}
+        self.breaker = CircuitBreaker(self.cfg["breaker_failures"], self.cfg["breaker_reset_sec"])
+        self.pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="neo-hedge")
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=500)
+        self.stats = {
+            "calls": 0, "ok": 0, "failed": 0, "attempts": 0, "retries": 0,
+            "hedges": 0, "hedge_wins": 0, "repaired": 0, "invalid": 0, "fast_fail": 0, "fatal": 0,
+        }
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] += n
+
+    def hedge_after(self) -> float:
+        fixed = float(self.cfg["hedge_after_sec"])
+        if fixed > 0:
+            return fixed
+        with self.lock:
+            xs = sorted(self.latencies)
+        if len(xs) < 20:
+            return max(float(self.cfg["hedge_min_sec"]), 8.0)
+        return max(float(self.cfg["hedge_min_sec"]), xs[int(len(xs) * 0.95)])
+
+    def _backoff(self, attempt: int) -> float:
+        base = float(self.cfg["backoff_base_sec"]) * (2 ** attempt)
+        return random.uniform(0, min(base, float(self.cfg["backoff_max_sec"])))  # full jitter
+
+    def _attempt(self, fn, remaining: float, hedge: bool):
+        # одна попытка (+ хедж): fn(timeout, hedged) → результат или исключение;
+        # timeout — остаток бюджета, он же предел ожидания в очереди
+        if not hedge:
+            return fn(remaining, False)
+        deadline = time.monotonic() + remaining
+        first = self.pool.submit(fn, remaining, False)
+        done, _ = wait([first], timeout=min(self.hedge_after(), remaining))
+        if done:
+            return first.result()
+        self.count("hedges")
+        second = self.pool.submit(fn, max(deadline - time.monotonic(), 0.1), True)
+        pending = {first, second}
+        errors = {}
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for f in done:
+                try:
+                    res = f.result()
+                except Exception as e:
+                    errors[f] = e
+                    continue
+                if f is second:
+                    self.count("hedge_wins")
+                return res
+        # ошибка основного запроса важнее: хедж, не попавший в очередь (SchedulerBusy),
+        # не должен подменять временную ошибку и отменять повтор
+        if first in errors:
+            raise errors[first]
+        if second in errors and not isinstance(errors[second], SchedulerBusy):
+            raise errors[second]
+        raise TimeoutError(f"no answer in {remaining:.1f}s")
+
+    def guard(self):
+        # для потокового вызова: он идёт мимо run(), но уважает breaker
+        if not self.breaker.allow():
+            self.count("fast_fail")
+            raise CircuitOpen("model circuit is open")
+
+    def observe(self, ok: bool, latency: float = None):
+        if ok:
+            self.breaker.on_success()
+            if latency is not None:
+                with self.lock:
+                    self.latencies.append(latency)
+        else:
+            self.breaker.on_failure()
+
+    def run(self, fn, budget_sec: float = None, hedge: bool = None):
+        # fn(timeout, hedged) делает один запрос и возвращает уже проверенный результат
+        budget = float(budget_sec or self.cfg["step_budget_sec"])
+        hedge = bool(self.cfg["hedge"]) if hedge is None else hedge
+        self.count("calls")
+        self.guard()
+        t0 = time.monotonic()
+        deadline = t0 + budget
+        last = None
+        for attempt in range(max(int(self.cfg["max_attempts"]), 1)):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.1:
+                break
+            if attempt:
+                self.count("retries")
+            self.count("attempts")
+            t_try = time.monotonic()
+            try:
+                res = self._attempt(fn, remaining, hedge)
+            except Exception as e:
+                last = e
+                if isinstance(e, InvalidAnswer):
+                    self.count("invalid")
+                if isinstance(e, (SchedulerBusy, ModelUnavailable)):
+                    raise
+                if not retriable(e):
+                    self.count("fatal")
+                    self.breaker.on_failure()
+                    raise ModelUnavailable(f"model request rejected: {fatal_reason(e)}") from e
+                self.breaker.on_failure()
+                if not self.breaker.allow():
+                    break
+                time.sleep(min(self._backoff(attempt), max(deadline - time.monotonic() - 0.1, 0)))
+                continue
+            self.observe(True, time.monotonic() - t_try)
+            self.count("ok")
+            return res
+        self.count("failed")
+        raise ModelUnavailable(f"no valid answer in {time.monotonic() - t0:.1f}s: {type(last).__name__ if last else 'budget'}") from last
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            out = dict(self.stats)
+            xs = sorted(self.latencies)
+        out["breaker"] = self.breaker.state()
+        out["breaker_trips"] = self.breaker.trips
+        out["hedge_after_sec"] = round(self.hedge_after(), 2)
+        out["latency_p50_ms"] = round(xs[len(xs) // 2] * 1000, 1) if xs else 0.0
+        out["latency_p95_ms"] = round(xs[int(len(xs) * 0.95)] * 1000, 1) if xs else 0.0
+        return out
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+# =========================
+# RESPONSE CACHE (content-addressed)
+# =========================
+# Ответ модели кэшируется по хэшу того, что реально уходит в модель
+# (модель + сообщения, без идентификаторов клиента и временных меток).
+# Запрос клиента в сообщениях остаётся: вопрос может его цитировать, так
+# что разные клиенты ключ не делят — попадания в основном внутри сессии.
+# Память: LRU + TTL. Диск (опционально): <disk_dir>/<ab>/<key>.json,
+# переживает рестарт и общий для воркеров. Диск чистится при старте и
+# дальше раз в prune_interval_sec или при выходе за лимит: просроченные
+# файлы удаляются, затем самые старые — пока каталог не влезет в
+# disk_max_bytes / disk_max_files. Счётчики — для мастер-панели.
+
+
+def cache_key(kind: str, model: str, prefix_fp: str, step_id: str, body) -> str:
+    raw = json.dumps(
+        {"kind": kind, "model": model, "prefix": prefix_fp, "step": step_id, "body": body},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+PRUNE_TO = 0.9  # чистка оставляет запас до следующей
+
+
+def _unlink(path) -> int:
+    try:
+        os.unlink(path)
+        return 1
+    except OSError:
+        return 0
+
+
+class ResponseCache:
+    def __init__(self, max_items: int = 2048, ttl_sec: float = 86400.0, disk_dir: Path = None,
+                 disk_max_bytes: int = 256 * 2**20, disk_max_files: int = 50000,
+                 prune_interval_sec: float = 600.0):
+        self.max_items = max(int(max_items), 1)
+        self.ttl_sec = float(ttl_sec)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = int(disk_max_bytes)
+        self.disk_max_files = int(disk_max_files)
+        self.prune_interval_sec = float(prune_interval_sec)
+        self.lock = threading.Lock()
+        self.prune_lock = threading.Lock()
+        self.items = OrderedDict()  # key → (ts, value)
+        self.stats = {
+            "hits": 0, "disk_hits": 0, "misses": 0, "puts": 0,
+            "evicted": 0, "expired": 0, "disk_errors": 0, "disk_pruned": 0,
+        }
+        # размер каталога — по последней чистке + записанное после неё
+        self.disk_bytes = 0
+        self.disk_files = 0
+        self.pruned_at = 0.0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self.prune()
+
+    # ---------- memory ----------
+    def _fresh(self, ts: float) -> bool:
+        return self.ttl_sec <= 0 or time.time() - ts < self.ttl_sec
+
+    def _remember(self, key: str, ts: float, value):
+        self.items[key] = (ts, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    # ---------- disk ----------
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str):
+        p = self._path(key)
+        try:
+            rec = json.loads(p.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            with self.lock:
+                self.stats["disk_errors"] += 1
+            return None
+        if not self._fresh(float(rec.get("ts", 0))):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+            return None
+        return rec
+
+    def _disk_put(self, key: str, ts: float, value):
+        p = self._path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            data = json.dumps({"ts": ts, "value": value}, ensure_ascii=False).encode("utf-8")
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
+        except Exception:
+            with self.lock:
+                self.stats["disk_errors"] += 1
+            return
+        with self.lock:
+            self.disk_bytes += len(data)
+            self.disk_files += 1
+            due = (self.disk_bytes > self.disk_max_bytes or self.disk_files > self.disk_max_files
+                   or time.time() - self.pruned_at > self.prune_interval_sec)
+        if due:
+            self.prune()
+
+    def prune(self) -> dict:
+        # просроченные и брошенные .tmp — всегда, потом самые старые до PRUNE_TO лимитов;
+        # несколько воркеров могут чистить одновременно — чужое удаление не ошибка
+        if not self.disk_dir or not self.prune_lock.acquire(blocking=False):
+            return {}
+        try:
+            now = time.time()
+            files, removed = [], 0
+            for sub in os.scandir(self.disk_dir):
+                if not sub.is_dir():
+                    continue
+                for f in os.scandir(sub.path):
+                    try:
+                        st = f.stat()
+                    except OSError:
+                        continue
+                    age = now - st.st_mtime
+                    stale_tmp = f.name.endswith(".tmp") and age > 3600
+                    expired = self.ttl_sec > 0 and age >= self.ttl_sec
+                    if stale_tmp or (expired and f.name.endswith(".json")):
+                        removed += _unlink(f.path)
+                    elif f.name.endswith(".json"):
+                        files.append((st.st_mtime, st.st_size, f.path))
+            total = sum(size for _, size, _ in files)
+            if total > self.disk_max_bytes or len(files) > self.disk_max_files:
+                files.sort()
+                max_bytes, max_files = self.disk_max_bytes * PRUNE_TO, self.disk_max_files * PRUNE_TO
+                drop = 0
+                while drop < len(files) and (total > max_bytes or len(files) - drop > max_files):
+                    _, size, path = files[drop]
+                    removed += _unlink(path)
+                    total -= size
+                    drop += 1
+                files = files[drop:]
+            with self.lock:
+                self.disk_bytes, self.disk_files = total, len(files)
+                self.pruned_at = now
+                self.stats["disk_pruned"] += removed
+            return {"removed": removed, "files": len(files), "bytes": total}
+        except OSError:
+            with self.lock:
+                self.stats["disk_errors"] += 1
+            return {}
+        finally:
+            self.prune_lock.release()
+
+    # ---------- api ----------
+    def get(self, key: str):
+        with self.lock:
+            hit = self.items.get(key)
+            if hit is not None:
+                if self._fresh(hit[0]):
+                    self.items.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return hit[1]
+                del self.items[key]
+                self.stats["expired"] += 1
+        if self.disk_dir:
+            rec = self._disk_get(key)
+            if rec is not None:
+                with self.lock:
+                    self._remember(key, float(rec["ts"]), rec["value"])
+                    self.stats["disk_hits"] += 1
+                return rec["value"]
+        with self.lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value):
+        # value должен быть JSON-сериализуемым (его же пишем на диск)
+        ts = time.time()
+        with self.lock:
+            self._remember(key, ts, value)
+            self.stats["puts"] += 1
+        if self.disk_dir:
+            self._disk_put(key, ts, value)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            s = dict(self.stats)
+            s["items"] = len(self.items)
+        lookups = s["hits"] + s["disk_hits"] + s["misses"]
+        s["hit_rate"] = round((s["hits"] + s["disk_hits"]) / lookups, 4) if lookups else 0.0
+        s["max_items"] = self.max_items
+        s["ttl_sec"] = self.ttl_sec
+        s["disk"] = str(self.disk_dir) if self.disk_dir else ""
+        if self.disk_dir:
+            s["disk_bytes"], s["disk_files"] = self.disk_bytes, self.disk_files
+            s["disk_max_bytes"], s["disk_max_files"] = self.disk_max_bytes, self.disk_max_files
+        return s
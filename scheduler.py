@@ -0,0 +1,263 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# =========================
+# MODEL CALL SCHEDULER (process-wide)
+# =========================
+# Все вызовы модели проходят через одну очередь процесса:
+#   - лимит одновременных запросов,
+#   - token bucket на запросы/мин и на (оценочные) токены/мин,
+#   - приоритет: вопрос интервью > мастер-отчёт > префетч; долго ждущие
+#     запросы постепенно поднимаются (aging), чтобы отчёты не голодали,
+#   - внутри приоритета — по кругу между сессиями (одна сессия не забивает очередь),
+#   - 429 от провайдера ставит всю очередь на паузу (Retry-After),
+#   - перегрузка: префетч сбрасывается первым, остальные ждут не дольше
+#     max_wait[kind] и получают SchedulerBusy вместо общего лавинного 429.
+
+PRIORITY = {"question": 0, "report": 1, "prefetch": 2}
+
+DEFAULT_MAX_WAIT = {"question": 30.0, "report": 120.0, "prefetch": 2.0}
+
+
+class SchedulerBusy(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: float = None):
+        self.rate = float(per_minute) / 60.0
+        self.capacity = float(burst) if burst else max(float(per_minute) / 6.0, 1.0)
+        self.level = self.capacity
+        self.ts = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def wait_time(self, n: float, now: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        # запрос больше ёмкости пропускаем при полном ведре (уйдёт в долг)
+        need = min(n, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, n: float):
+        if not self.unlimited:
+            self.level -= n
+
+    def adjust(self, delta: float):
+        # поправка после ответа: оценка → фактические токены
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + delta)
+
+
+class Ticket:
+    __slots__ = ("kind", "session_id", "tokens", "enqueued", "granted", "used", "released")
+
+    def __init__(self, kind: str, session_id: str, tokens: int):
+        self.kind = kind
+        self.session_id = session_id
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = None
+        self.used = None  # фактические токены, если известны
+        self.released = False
+
+
+class Scheduler:
+    def __init__(self, max_concurrency: int = 16, rpm: float = 0, tpm: float = 0,
+                 max_wait: dict = None, max_queue: int = 200, aging_sec: float = 20.0,
+                 lease_sec: float = 300.0):
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+        self.max_queue = int(max_queue)
+        self.aging_sec = float(aging_sec)
+        self.lease_sec = float(lease_sec)
+        self.cond = threading.Condition()
+        # приоритет → session_id → очередь тикетов (порядок сессий = круг)
+        self.queues = {p: OrderedDict() for p in sorted(set(PRIORITY.values()))}
+        self.running = set()
+        self.paused_until = 0.0
+        self.stats = {k: {"granted": 0, "rejected": 0, "timeouts": 0, "errors": 0} for k in PRIORITY}
+        self.waits = {k: deque(maxlen=1000) for k in PRIORITY}
+        self.peak_queue = 0
+        self.peak_running = 0
+        self.backoffs = 0
+        self.reclaimed = 0
+
+    # ---------- queue ----------
+    def _depth(self, kind: str = None) -> int:
+        if kind is None:
+            return sum(len(d) for q in self.queues.values() for d in q.values())
+        return sum(1 for q in self.queues.values() for d in q.values() for t in d if t.kind == kind)
+
+    def _head(self, now: float):
+        # голова каждого приоритета; ждущие дольше aging_sec поднимаются на уровень
+        best, best_key = None, None
+        for prio, q in self.queues.items():
+            if not q:
+                continue
+            t = q[next(iter(q))][0]
+            eff = prio - int((now - t.enqueued) // self.aging_sec) if self.aging_sec > 0 else prio
+            key = (eff, prio)
+            if best_key is None or key < best_key:
+                best, best_key = t, key
+        return best
+
+    def _remove(self, t: Ticket):
+        q = self.queues[PRIORITY[t.kind]]
+        d = q.get(t.session_id)
+        if d is None:
+            return
+        try:
+            d.remove(t)
+        except ValueError:
+            return
+        if not d:
+            del q[t.session_id]
+
+    def _pop(self, t: Ticket):
+        q = self.queues[PRIORITY[t.kind]]
+        d = q[t.session_id]
+        d.popleft()
+        if d:
+            q.move_to_end(t.session_id)  # следующая сессия по кругу
+        else:
+            del q[t.session_id]
+
+    def _reclaim(self, now: float):
+        # тикет, который так и не вернули (оборванный стрим), не держит слот вечно
+        for t in [t for t in self.running if now - t.granted > self.lease_sec]:
+            self.running.discard(t)
+            t.released = True
+            self.reclaimed += 1
+
+    def _ready_in(self, t: Ticket, now: float):
+        # 0 — можно выпускать; число — через сколько секунд проверить; None — ждать release
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._reclaim(now)
+        if len(self.running) >= self.max_concurrency:
+            return None
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(t.tokens, now))
+
+    # ---------- api ----------
+    def acquire(self, kind: str, session_id: str = "", tokens: int = 0, max_wait: float = None) -> Ticket:
+        # max_wait — ждать не дольше (остаток бюджета шага), но и не дольше max_wait[kind]
+        if kind not in PRIORITY:
+            kind = "question"
+        t = Ticket(kind, session_id or "", int(tokens or 0))
+        with self.cond:
+            depth = self._depth()
+            busy = depth > 0 or len(self.running) >= self.max_concurrency
+            if depth >= self.max_queue or (kind == "prefetch" and busy):
+                # префетч — спекуляция: под нагрузкой он не встаёт в очередь
+                self.stats[kind]["rejected"] += 1
+                raise SchedulerBusy(f"queue full ({depth})")
+            self.queues[PRIORITY[kind]].setdefault(t.session_id, deque()).append(t)
+            self.peak_queue = max(self.peak_queue, depth + 1)
+            limit = float(self.max_wait.get(kind, 30.0))
+            if max_wait is not None:
+                limit = min(limit, max(float(max_wait), 0.0))
+            deadline = t.enqueued + limit
+
+            while True:
+                now = time.monotonic()
+                wait = None
+                if self._head(now) is t:
+                    wait = self._ready_in(t, now)
+                    if wait == 0:
+                        self._pop(t)
+                        self.requests.take(1)
+                        self.tokens.take(t.tokens)
+                        t.granted = now
+                        self.running.add(t)
+                        self.peak_running = max(self.peak_running, len(self.running))
+                        self.stats[kind]["granted"] += 1
+                        self.waits[kind].append(now - t.enqueued)
+                        self.cond.notify_all()
+                        return t
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._remove(t)
+                    self.stats[kind]["timeouts"] += 1
+                    self.cond.notify_all()
+                    raise SchedulerBusy(f"{kind}: waited {now - t.enqueued:.1f}s")
+                self.cond.wait(min(wait, remaining) if wait is not None else min(remaining, 1.0))
+
+    def release(self, t: Ticket, error: Exception = None):
+        if t is None:
+            return
+        with self.cond:
+            if t.released:
+                return
+            t.released = True
+            self.running.discard(t)
+            if t.used is not None:
+                self.tokens.adjust(t.tokens - t.used)
+            if error is not None:
+                self.stats[t.kind]["errors"] += 1
+                if getattr(error, "status_code", None) == 429:
+                    self._backoff(_retry_after(error))
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, kind: str, session_id: str = "", tokens: int = 0, max_wait: float = None):
+        # release в любом исходе: StopException / RerunException Streamlit и
+        # KeyboardInterrupt — BaseException, слот не должен ждать аренды lease_sec
+        t = self.acquire(kind, session_id, tokens, max_wait)
+        error = None
+        try:
+            yield t
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(t, error)
+
+    def _backoff(self, sec: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + sec)
+        self.backoffs += 1
+
+    def snapshot(self) -> dict:
+        with self.cond:
+            now = time.monotonic()
+            out = {
+                "running": len(self.running),
+                "max_concurrency": self.max_concurrency,
+                "peak_running": self.peak_running,
+                "queued": {k: self._depth(k) for k in PRIORITY},
+                "peak_queue": self.peak_queue,
+                "paused_sec": round(max(self.paused_until - now, 0.0), 2),
+                "backoffs": self.backoffs,
+                "reclaimed": self.reclaimed,
+                "requests_bucket": None if self.requests.unlimited else round(self.requests.level, 1),
+                "tokens_bucket": None if self.tokens.unlimited else round(self.tokens.level),
+                "by_kind": {},
+            }
+            for k in PRIORITY:
+                w = sorted(self.waits[k])
+                out["by_kind"][k] = {
+                    **self.stats[k],
+                    "wait_p50_ms": round(w[len(w) // 2] * 1000, 1) if w else 0.0,
+                    "wait_p95_ms": round(w[min(len(w) - 1, int(len(w) * 0.95))] * 1000, 1) if w else 0.0,
+                    "wait_max_ms": round(w[-1] * 1000, 1) if w else 0.0,
+                }
+        return out
+
+
+def _retry_after(error: Exception, default: float = 5.0) -> float:
+    try:
+        v = float(error.response.headers.get("retry-after"))
+        return min(max(v, 0.5), 60.0)
+    except Exception:
+        return default
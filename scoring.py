@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+
+# =========================
+# SCORING (9 потенциалов × 5 осей)
+# =========================
+# Баллы сессии — одна матрица float64 формы (9, 5): строки — POTS,
+# столбцы — AXES (total + 4 колонки). Апдейт модели валидируется
+# (нечисловое / NaN / inf отбрасывается), дельты и итог обрезаются,
+# применение — одно сложение матриц. Снимок шага — copy() на 360 байт.
+# В payload/промпт по-прежнему уходят словари scores / col_scores.
+
+POTS = ["Сапфир","Гелиодор","Аметист","Изумруд","Гранат","Рубин","Янтарь","Шунгит","Цитрин"]
+COLS = ["perception","motivation","tool","result"]
+AXES = ["total"] + COLS
+
+POT_INDEX = {p: i for i, p in enumerate(POTS)}
+AXIS_INDEX = {a: j for j, a in enumerate(AXES)}
+
+DELTA_LIMIT = 1.0    # одна дельта от модели, по модулю
+SCORE_LIMIT = 10.0   # накопленный балл, по модулю
+
+
+def empty() -> np.ndarray:
+    return np.zeros((len(POTS), len(AXES)), dtype=np.float64)
+
+
+def as_number(v):
+    # число из ответа модели или None (строки-не-числа, NaN, inf)
+    try:
+        x = float(v)
+    except (TypeError, ValueError):
+        return None
+    return x if math.isfinite(x) else None
+
+
+def _fill(delta: np.ndarray, axis: str, d) -> int:
+    # {pot: value} → столбец axis; возвращает число отброшенных значений
+    if not isinstance(d, dict):
+        return 0
+    bad = 0
+    j = AXIS_INDEX[axis]
+    for k, v in d.items():
+        i = POT_INDEX.get(k)
+        x = as_number(v)
+        if i is None or x is None:
+            bad += 1
+            continue
+        delta[i, j] += x
+    return bad
+
+
+def delta_from_update(update: dict):
+    # analysis_update → (матрица дельт, число отброшенных значений)
+    delta = empty()
+    if not isinstance(update, dict):
+        return delta, 0
+    bad = _fill(delta, "total", update.get("scores_delta"))
+    cd = update.get("col_scores_delta")
+    if isinstance(cd, dict):
+        for col in COLS:
+            bad += _fill(delta, col, cd.get(col))
+    np.clip(delta, -DELTA_LIMIT, DELTA_LIMIT, out=delta)
+    return delta, bad
+
+
+def apply(matrix: np.ndarray, delta: np.ndarray) -> np.ndarray:
+    matrix += delta
+    np.clip(matrix, -SCORE_LIMIT, SCORE_LIMIT, out=matrix)
+    return matrix
+
+
+def topk(matrix: np.ndarray, axis: str = "total", k: int = 3):
+    # [(pot, score)] по убыванию; argpartition — без полной сортировки
+    col = matrix[:, AXIS_INDEX[axis]]
+    k = min(k, len(col))
+    if k <= 0:
+        return []
+    idx = np.argpartition(-col, k - 1)[:k]
+    idx = idx[np.argsort(-col[idx], kind="stable")]
+    return [(POTS[i], float(col[i])) for i in idx]
+
+
+def to_dicts(matrix: np.ndarray, ndigits: int = None):
+    # → (scores, col_scores) в прежнем формате payload
+    m = matrix if ndigits is None else np.round(matrix, ndigits)
+    rows = m.tolist()
+    scores = {p: rows[i][0] for i, p in enumerate(POTS)}
+    col_scores = {col: {p: rows[i][j] for i, p in enumerate(POTS)} for j, col in enumerate(AXES) if j}
+    return scores, col_scores
+
+
+def from_dicts(scores: dict = None, col_scores: dict = None) -> np.ndarray:
+    m = empty()
+    _fill(m, "total", scores or {})
+    for col in COLS:
+        _fill(m, col, (col_scores or {}).get(col) or {})
+    return m
+
+
+def from_payload(payload: dict) -> np.ndarray:
+    return from_dicts(payload.get("scores"), payload.get("col_scores"))
+
+
+def stack(matrices) -> np.ndarray:
+    # N сессий → массив (N, 9, 5) для агрегатов по всей базе
+    matrices = list(matrices)
+    if not matrices:
+        return np.zeros((0, len(POTS), len(AXES)), dtype=np.float64)
+    return np.stack(matrices)
+
+
+def summary(stacked: np.ndarray) -> dict:
+    # средние баллы и как часто потенциал был первым по каждой оси
+    n = int(stacked.shape[0])
+    if not n:
+        return {"sessions": 0}
+    mean = stacked.mean(axis=0)
+    top1 = np.zeros((len(POTS), len(AXES)), dtype=np.int64)
+    winners = stacked.argmax(axis=1)  # (N, 5)
+    for j in range(len(AXES)):
+        top1[:, j] = np.bincount(winners[:, j], minlength=len(POTS))
+    return {
+        "sessions": n,
+        "mean": {a: {p: round(float(mean[i, j]), 4) for i, p in enumerate(POTS)} for j, a in enumerate(AXES)},
+        "top1": {a: {p: int(top1[i, j]) for i, p in enumerate(POTS)} for j, a in enumerate(AXES)},
+    }
@@ -0,0 +1,210 @@
+import json
+import math
+import zlib
+import struct
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+import scoring
+
+# =========================
+# SESSION CODEC (компактный формат файла сессии)
+# =========================
+# <session_id>.neo = MAGIC | версия | id словаря | zlib(заголовок + payload + массивы).
+# - payload — компактный JSON (без отступов) без score-полей;
+# - scores/col_scores → матрица 9×5 float64 (строки — POTS, столбцы — AXES,
+#   имена записаны в заголовке, так что чтение не зависит от текущего POTS);
+# - scores_by_step → int32 ×10000 (они округлены до 4 знаков), разности между
+#   шагами — почти одни нули;
+# - zlib с общим словарём (zdict): ключи payload, имена камней, id шагов.
+# Поле упаковывается, только если распаковка даёт ровно то же значение,
+# иначе остаётся в JSON. Старые файлы <session_id>.json (ai-neo.positions.ai_only.v1)
+# читаются как раньше — loads() различает форматы по MAGIC.
+#
+#   python -m session_codec migrate              # *.json → *.neo
+#   python -m session_codec migrate --to json    # обратно
+
+MAGIC = b"NEOS"
+VERSION = 1
+SCALE = 10000
+SUFFIX = {"compact": ".neo", "json": ".json"}
+
+# словари не меняются: новый словарь — новый id (старые файлы читаются своим)
+_ZDICTS = {
+    1: "".join([
+        '"ai_master_report":"',
+        '"top6":[{"pot":"Сапфир","score":',
+        '"flow":{"skipped":["p1_scope_2","p1_pot_2","p2_scope_2","p2_pot_2","p3_scope_2","p3_pot_2"],'
+        '"extra_steps":["p1_refine_1","p2_refine_1","p3_refine_1"]},',
+        '"digest":{"upto":0,"positions":{"p1":{"answers":1,"evidence":["',
+        ' → ',
+        '"confidence":{"p1":0.',
+        '"positions_guess":{"p1":"Сапфир","p2":"Гелиодор","p3":"Аметист"},',
+        '"Изумруд","Гранат","Рубин","Янтарь","Шунгит","Цитрин"',
+        '"calls":[{"step_id":"p1_scope_1","source":"bank"},{"step_id":"p1_pot_1","source":"model",',
+        '"queue_ms":0.0,"ttfb_ms":','"total_ms":',
+        '"usage":{"input_tokens":','"cached_tokens":','"uncached_tokens":','"output_tokens":',
+        '"cost_usd":','"calls":1},"report_usage":{','"report_job":{"batch":"','"ts":',
+        '{"meta":{"schema":"ai-neo.positions.ai_only.v1","app_version":"positions-ai-1.0",',
+        '"timestamp":"2026-10-17T00:00:00.000000Z","session_id":"',
+        '","name":"","contact":"","request":"","q_count":12,"model":"gpt-4.1-mini","prompt_prefix":null,',
+        '"answers":[{"step_id":"p1_scope_1","question":"',
+        '","answer":"','","timestamp":"2026-10-',
+        '{"step_id":"p2_scope_1","question":"','{"step_id":"p3_pot_1","question":"',
+    ]).encode("utf-8"),
+}
+ZDICT_ID = 1
+
+
+# =========================
+# PACK / UNPACK
+# =========================
+def _matrix(scores, col_scores):
+    # dict'ы в прежнем формате → матрица, только если это ровно POTS × AXES из float
+    if not isinstance(scores, dict) or not isinstance(col_scores, dict):
+        return None
+    if list(scores) != scoring.POTS or list(col_scores) != scoring.COLS:
+        return None
+    if any(not isinstance(col_scores[c], dict) or list(col_scores[c]) != scoring.POTS for c in scoring.COLS):
+        return None
+    rows = [[scores[p]] + [col_scores[c][p] for c in scoring.COLS] for p in scoring.POTS]
+    if any(type(v) is not float for r in rows for v in r):
+        return None
+    return np.array(rows, dtype="<f8")
+
+
+def _steps(steps):
+    # снимки по шагам → разности int32 (×SCALE), если обратное преобразование точное
+    if not isinstance(steps, list) or not steps:
+        return None
+    try:
+        arr = np.array(steps, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if arr.shape[1:] != (len(scoring.POTS), len(scoring.AXES)):
+        return None
+    q = np.rint(arr * SCALE)
+    if not np.all(np.abs(q) < 2**31) or (q / SCALE).tolist() != steps:
+        return None
+    return np.diff(q.astype(np.int64), axis=0, prepend=0).astype("<i4")
+
+
+def encode(payload: dict) -> bytes:
+    body = dict(payload)
+    arrays, blobs = [], []
+    m = _matrix(body.get("scores"), body.get("col_scores"))
+    if m is not None:
+        del body["scores"], body["col_scores"]
+        arrays.append({"name": "scores", "dtype": "<f8", "shape": list(m.shape)})
+        blobs.append(m.tobytes())
+    d = _steps(body.get("scores_by_step"))
+    if d is not None:
+        del body["scores_by_step"]
+        arrays.append({"name": "scores_by_step", "dtype": "<i4", "shape": list(d.shape),
+                       "scale": SCALE, "delta": True})
+        blobs.append(d.tobytes())
+    header = {"order": list(payload), "arrays": arrays}
+    if arrays:
+        header["rows"], header["cols"] = scoring.POTS, scoring.AXES
+    h = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    j = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    c = zlib.compressobj(9, zdict=_ZDICTS[ZDICT_ID])
+    raw = struct.pack("<II", len(h), len(j)) + h + j + b"".join(blobs)
+    return MAGIC + bytes([VERSION, ZDICT_ID]) + c.compress(raw) + c.flush()
+
+
+def decode(data: bytes) -> dict:
+    if data[:4] != MAGIC:
+        raise ValueError("не компактный файл сессии")
+    version, dict_id = data[4], data[5]
+    if version != VERSION or dict_id not in _ZDICTS:
+        raise ValueError(f"неизвестная версия файла сессии: {version}/{dict_id}")
+    d = zlib.decompressobj(zdict=_ZDICTS[dict_id])
+    raw = d.decompress(data[6:]) + d.flush()
+    hl, jl = struct.unpack_from("<II", raw)
+    header = json.loads(raw[8:8 + hl])
+    body = json.loads(raw[8 + hl:8 + hl + jl])
+    off = 8 + hl + jl
+    rows, cols = header.get("rows"), header.get("cols")
+    for a in header["arrays"]:
+        dt = np.dtype(a["dtype"])
+        n = math.prod(a["shape"])
+        arr = np.frombuffer(raw, dtype=dt, count=n, offset=off).reshape(a["shape"])
+        off += n * dt.itemsize
+        if a["name"] == "scores":
+            m = arr.tolist()
+            body["scores"] = {p: m[i][0] for i, p in enumerate(rows)}
+            body["col_scores"] = {c: {p: m[i][j] for i, p in enumerate(rows)} for j, c in enumerate(cols) if j}
+        elif a["name"] == "scores_by_step":
+            q = np.cumsum(arr.astype(np.int64), axis=0) if a.get("delta") else arr
+            body["scores_by_step"] = (q / a.get("scale", 1)).tolist()
+    order = header.get("order") or list(body)
+    return {k: body[k] for k in order if k in body}
+
+
+def dumps(payload: dict, encoding: str = "compact") -> bytes:
+    if encoding == "compact":
+        return encode(payload)
+    return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def loads(data: bytes) -> dict:
+    # оба формата: компактный (MAGIC) и старый JSON
+    if data[:4] == MAGIC:
+        return decode(data)
+    return json.loads(data.decode("utf-8"))
+
+
+# =========================
+# MIGRATION
+# =========================
+def migrate(store, to: str = "compact", dry_run: bool = False) -> dict:
+    # файлы другого формата → формат store; перед записью проверяется точный круг
+    src = SUFFIX["json" if to == "compact" else "compact"]
+    out = {"converted": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    for p in sorted(store.data_dir.glob(f"*{src}")):
+        try:
+            data = p.read_bytes()
+            payload = loads(data)
+            new = dumps(payload, to)
+            if loads(new) != payload:
+                raise ValueError("круг кодирования не совпал")
+        except Exception:
+            out["failed"] += 1
+            continue
+        out["bytes_before"] += len(data)
+        out["bytes_after"] += len(new)
+        if not dry_run:
+            store.save(payload)  # запишет новый файл, старый удалит, обновит индекс
+        out["converted"] += 1
+    return out
+
+
+def main(argv=None):
+    from session_store import SessionStore
+
+    cfg_path = Path("config.json")
+    cfg = json.loads(cfg_path.read_text(encoding="utf-8")) if cfg_path.exists() else {}
+    scfg = cfg.get("storage", {})
+
+    ap = argparse.ArgumentParser(description="Перекодирование файлов сессий")
+    ap.add_argument("--data-dir", default=scfg.get("data_dir", "data/sessions"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    mg = sub.add_parser("migrate")
+    mg.add_argument("--to", choices=list(SUFFIX), default="compact")
+    mg.add_argument("--dry-run", action="store_true", help="только проверить и посчитать размеры")
+    args = ap.parse_args(argv)
+
+    store = SessionStore(Path(args.data_dir), encoding=args.to)
+    store.sync()
+    res = migrate(store, args.to, args.dry_run)
+    if res["bytes_before"]:
+        res["ratio"] = round(res["bytes_after"] / res["bytes_before"], 3)
+    res["index"] = store.sync()
+    print(json.dumps(res, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import re
+import json
+import gzip
+import time
+import importlib.util
+import argparse
+from pathlib import Path
+
+import scoring
+
+# =========================
+# SESSION EXPORT / IMPORT (пакетно)
+# =========================
+# Выгрузка сессий под фильтром (период, завершённость, наличие отчёта)
+# потоком: id берутся из индекса SQLite, payload читается с диска по одному
+# и сразу пишется в выходной файл — память не растёт с числом сессий.
+# Форматы:
+#   ndjson.gz — одна сессия (полный payload) на строку, gzip;
+#   parquet / arrow — плоские столбцы для аналитиков (позиции, уверенности,
+#     баллы 9×5, токены) + полный payload строкой; пишутся группами по `chunk`
+#     строк. Нужен pyarrow (в requirements не входит).
+# Импорт читает любой из форматов тем же потоком и сохраняет сессии через
+# SessionStore.save — файлы и индекс (вместе со сводкой аналитики) сразу
+# согласованы.
+#
+#   python -m session_export export --format parquet --from 2026-09-01 --to 2026-10-01 --completed
+#   python -m session_export import data/exports/sessions.ndjson.gz
+
+FORMATS = {
+    "ndjson.gz": ".ndjson.gz",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+MIME = {
+    "ndjson.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+CHUNK = 500
+# session_id становится именем файла: только такие id принимаются при импорте
+SID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def pyarrow_available() -> bool:
+    # только проверка, что пакет есть: сам pyarrow импортируют писатели/читатель
+    try:
+        return importlib.util.find_spec("pyarrow") is not None
+    except Exception:
+        return False
+
+
+def available_formats() -> list:
+    return [f for f in FORMATS if f == "ndjson.gz" or pyarrow_available()]
+
+
+def format_of(path) -> str:
+    name = str(path).lower()
+    for fmt, suffix in FORMATS.items():
+        if name.endswith(suffix):
+            return fmt
+    raise ValueError(f"неизвестный формат: {path} (ожидается {', '.join(FORMATS.values())})")
+
+
+def iter_payloads(store, session_ids):
+    # по одному с диска; пропавшие/битые файлы пропускаются
+    for sid in session_ids:
+        try:
+            payload = store.load(sid)
+        except Exception:
+            continue
+        if payload is not None:
+            yield payload
+
+
+# =========================
+# FLAT ROWS (parquet / arrow)
+# =========================
+def flat_row(payload: dict) -> dict:
+    meta = payload.get("meta", {}) or {}
+    guess = payload.get("positions_guess", {}) or {}
+    conf = payload.get("confidence", {}) or {}
+    usage = meta.get("usage", {}) or {}
+    row = {
+        "session_id": meta.get("session_id", ""),
+        "timestamp": meta.get("timestamp", "") or "",
+        "app_version": meta.get("app_version", "") or "",
+        "model": meta.get("model", "") or "",
+        "name": meta.get("name", "") or "",
+        "contact": meta.get("contact", "") or "",
+        "request": meta.get("request", "") or "",
+        "q_count": int(meta.get("q_count", 0) or 0),
+    }
+    for p in ("p1", "p2", "p3"):
+        row[p] = guess.get(p) or ""
+        row[f"{p}_conf"] = float(scoring.as_number(conf.get(p)) or 0.0)
+    row["scores"] = scoring.from_payload(payload).astype("float32").ravel().tolist()
+    row["input_tokens"] = int(usage.get("input_tokens", 0) or 0)
+    row["output_tokens"] = int(usage.get("output_tokens", 0) or 0)
+    row["cost_usd"] = float(usage.get("cost_usd", 0) or 0)
+    row["has_report"] = bool(payload.get("ai_master_report"))
+    row["payload"] = json.dumps(payload, ensure_ascii=False)
+    return row
+
+
+def arrow_schema():
+    import pyarrow as pa
+    s, i, f = pa.string(), pa.int32(), pa.float32()
+    fields = [("session_id", s), ("timestamp", s), ("app_version", s), ("model", s),
+              ("name", s), ("contact", s), ("request", s), ("q_count", i)]
+    for p in ("p1", "p2", "p3"):
+        fields += [(p, s), (f"{p}_conf", f)]
+    fields += [("scores", pa.list_(f)), ("input_tokens", pa.int64()), ("output_tokens", pa.int64()),
+               ("cost_usd", pa.float64()), ("has_report", pa.bool_()), ("payload", pa.large_string())]
+    meta = {"scores_shape": f"{len(scoring.POTS)}x{len(scoring.AXES)}",
+            "scores_rows": ",".join(scoring.POTS), "scores_cols": ",".join(scoring.AXES)}
+    return pa.schema(fields, metadata=meta)
+
+
+def chunks(payloads, n: int):
+    buf = []
+    for p in payloads:
+        buf.append(flat_row(p))
+        if len(buf) >= n:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+# =========================
+# EXPORT
+# =========================
+def export(store, out, fmt: str = "ndjson.gz", session_ids=None, chunk: int = CHUNK, **filters) -> dict:
+    # out — путь или бинарный файловый объект; filters — как у SessionStore.select_ids
+    if fmt not in FORMATS:
+        raise ValueError(f"неизвестный формат: {fmt}")
+    if fmt != "ndjson.gz" and not pyarrow_available():
+        raise RuntimeError("для parquet/arrow нужен pyarrow (pip install pyarrow)")
+    t0 = time.time()
+    ids = store.select_ids(**filters) if session_ids is None else list(session_ids)
+    own = not hasattr(out, "write")
+    f = open(out, "wb") if own else out
+    try:
+        n = _WRITERS[fmt](f, iter_payloads(store, ids), chunk)
+    finally:
+        if own:
+            f.close()
+    return {"format": fmt, "selected": len(ids), "exported": n, "sec": round(time.time() - t0, 2)}
+
+
+def _write_ndjson(f, payloads, chunk: int) -> int:
+    n = 0
+    with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6) as gz:
+        for p in payloads:
+            gz.write(json.dumps(p, ensure_ascii=False).encode("utf-8") + b"\n")
+            n += 1
+    return n
+
+
+def _write_parquet(f, payloads, chunk: int) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = arrow_schema()
+    n = 0
+    with pq.ParquetWriter(f, schema, compression="zstd") as w:
+        for rows in chunks(payloads, chunk):
+            w.write_table(pa.Table.from_pylist(rows, schema=schema))
+            n += len(rows)
+    return n
+
+
+def _write_arrow(f, payloads, chunk: int) -> int:
+    import pyarrow as pa
+    schema = arrow_schema()
+    n = 0
+    with pa.ipc.new_stream(f, schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as w:
+        for rows in chunks(payloads, chunk):
+            w.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+            n += len(rows)
+    return n
+
+
+_WRITERS = {"ndjson.gz": _write_ndjson, "parquet": _write_parquet, "arrow": _write_arrow}
+
+
+# =========================
+# IMPORT
+# =========================
+def _parse(text):
+    # битая запись → None: импорт посчитает её в invalid и пойдёт дальше
+    try:
+        return json.loads(text)
+    except (ValueError, TypeError):
+        return None
+
+
+def read_payloads(src, fmt: str = None):
+    # src — путь или бинарный файловый объект; payload'ы по одному,
+    # вместо нечитаемой записи — None
+    fmt = fmt or format_of(src)
+    own = not hasattr(src, "read")
+    f = open(src, "rb") if own else src
+    try:
+        if fmt == "ndjson.gz":
+            with gzip.GzipFile(fileobj=f, mode="rb") as gz:
+                for raw in gz:
+                    if raw.strip():
+                        yield _parse(raw)
+            return
+        if not pyarrow_available():
+            raise RuntimeError("для parquet/arrow нужен pyarrow (pip install pyarrow)")
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        batches = (pq.ParquetFile(f).iter_batches(columns=["payload"]) if fmt == "parquet"
+                   else pa.ipc.open_stream(f))
+        for batch in batches:
+            for s in batch.column(batch.schema.get_field_index("payload")).to_pylist():
+                yield _parse(s)
+    finally:
+        if own:
+            f.close()
+
+
+def valid_sid(sid) -> bool:
+    return isinstance(sid, str) and SID_RE.fullmatch(sid) is not None
+
+
+def import_sessions(store, src, fmt: str = None, overwrite: bool = False) -> dict:
+    # существующие сессии без overwrite не трогаются; битая запись (не JSON,
+    # нет meta, неподходящий session_id, ошибка сохранения) считается в invalid
+    # и не прерывает импорт — первая такая ошибка попадает в "error"
+    t0 = time.time()
+    out = {"imported": 0, "skipped": 0, "invalid": 0, "error": ""}
+    for n, payload in enumerate(read_payloads(src, fmt), 1):
+        meta = payload.get("meta") if isinstance(payload, dict) else None
+        sid = meta.get("session_id") if isinstance(meta, dict) else None
+        if not valid_sid(sid):
+            out["invalid"] += 1
+            out["error"] = out["error"] or f"запись {n}: {'нет JSON' if payload is None else 'session_id'}"
+            continue
+        if not overwrite and store.exists(sid):
+            out["skipped"] += 1
+            continue
+        try:
+            store.save(payload)
+        except Exception as e:
+            out["invalid"] += 1
+            out["error"] = out["error"] or f"запись {n}: {type(e).__name__}: {e}"[:200]
+            continue
+        out["imported"] += 1
+    out["sec"] = round(time.time() - t0, 2)
+    return out
+
+
+def export_name(fmt: str, **filters) -> str:
+    parts = ["sessions"]
+    if filters.get("date_from") or filters.get("date_to"):
+        parts.append(f"{filters.get('date_from') or 'start'}_{filters.get('date_to') or 'now'}")
+    parts.append(time.strftime("%Y%m%d-%H%M%S"))
+    return "-".join(parts) + FORMATS[fmt]
+
+
+def main(argv=None):
+    from session_store import SessionStore
+
+    cfg_path = Path("config.json")
+    cfg = json.loads(cfg_path.read_text(encoding="utf-8")) if cfg_path.exists() else {}
+    scfg = cfg.get("storage", {})
+
+    ap = argparse.ArgumentParser(description="Пакетная выгрузка/загрузка сессий")
+    ap.add_argument("--data-dir", default=scfg.get("data_dir", "data/sessions"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export")
+    ex.add_argument("--format", choices=list(FORMATS), default="ndjson.gz")
+    ex.add_argument("--out", default="", help="файл; по умолчанию — в storage.export_dir")
+    ex.add_argument("--from", dest="date_from", default="")
+    ex.add_argument("--to", dest="date_to", default="", help="не включительно")
+    ex.add_argument("--completed", action="store_true", help="только с определёнными p1–p3")
+    ex.add_argument("--has-report", choices=["yes", "no"], default=None)
+    ex.add_argument("--chunk", type=int, default=CHUNK)
+    im = sub.add_parser("import")
+    im.add_argument("src")
+    im.add_argument("--overwrite", action="store_true")
+    args = ap.parse_args(argv)
+
+    store = SessionStore(Path(args.data_dir), encoding=scfg.get("encoding", "compact"))
+    store.sync()
+    if args.cmd == "export":
+        filters = {"date_from": args.date_from, "date_to": args.date_to,
+                   "completed": True if args.completed else None,
+                   "has_report": None if args.has_report is None else args.has_report == "yes"}
+        out = Path(args.out) if args.out else Path(scfg.get("export_dir", "data/exports")) / export_name(args.format, **filters)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        res = export(store, out, args.format, chunk=args.chunk, **filters)
+        res["path"] = str(out)
+        res["bytes"] = out.stat().st_size
+    else:
+        res = import_sessions(store, args.src, overwrite=args.overwrite)
+    print(json.dumps(res, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import json
+from pathlib import Path
+
+# =========================
+# SESSION JOURNAL (append-only JSONL)
+# =========================
+# Во время интервью каждый отвеченный шаг дописывается одной строкой
+# в <journal_dir>/<session_id>.jsonl (O_APPEND + fsync) — запись O(delta),
+# а ответы переживают рестарт воркера. Итоговый payload собирается один раз
+# при завершении (compact), после чего журнал удаляется.
+#
+# Записи:
+#   {"type":"start", "session_id", "client":{name,contact,request}, "model", "app_version", "ts"}
+#   {"type":"step",  "step_index", "step_id", "question", "answer", "timestamp", "analysis_update"}
+# Отдельной записи о завершении нет: compact() сохраняет payload и только
+# потом удаляет журнал, так что его наличие и значит "интервью не сохранено".
+
+
+class SessionJournal:
+    def __init__(self, journal_dir: Path):
+        self.dir = Path(journal_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, session_id: str) -> Path:
+        return self.dir / f"{session_id}.jsonl"
+
+    def exists(self, session_id: str) -> bool:
+        return self.path(session_id).exists()
+
+    def append(self, session_id: str, record: dict):
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        fd = os.open(self.path(session_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # одна запись = один write(); при O_APPEND строки не перемешиваются
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def read(self, session_id: str):
+        p = self.path(session_id)
+        if not p.exists():
+            return []
+        out = []
+        with p.open("r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # недописанный хвост после падения
+                try:
+                    out.append(json.loads(line))
+                except Exception:
+                    continue
+        return out
+
+    def discard(self, session_id: str):
+        try:
+            self.path(session_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def compact(self, session_id: str, save_payload, build_payload):
+        # итоговый payload пишется один раз, журнал больше не нужен
+        payload = build_payload()
+        save_payload(payload)
+        self.discard(session_id)
+        return payload
@@ -0,0 +1,314 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import session_codec
+from analytics import SUMMARY_SQL, summary_row, upsert_summary
+
+# =========================
+# SESSION STORE (files + SQLite index)
+# =========================
+# Полный payload сессии лежит файлом <session_id>.neo (компактный формат,
+# session_codec.py) или <session_id>.json (прежний; читается всегда, пишется
+# при encoding="json"), а метаданные для мастер-панели — в индексе SQLite (WAL).
+# Список сессий читается только из индекса; файл парсится лишь при выборе сессии.
+
+SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    name       TEXT NOT NULL DEFAULT '',
+    contact    TEXT NOT NULL DEFAULT '',
+    request    TEXT NOT NULL DEFAULT '',
+    timestamp  TEXT NOT NULL DEFAULT '',
+    q_count    INTEGER NOT NULL DEFAULT 0,
+    has_report INTEGER NOT NULL DEFAULT 0,
+    file_mtime REAL NOT NULL DEFAULT 0,
+    file_size  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_sessions_ts ON sessions(timestamp DESC);
+"""
+
+# миграции индекса: user_version → список SQL; после миграции
+# файлы перечитываются при ближайшем sync (file_mtime сбрасывается)
+_MIGRATIONS = {
+    2: [
+        "ALTER TABLE sessions ADD COLUMN conf_avg REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE sessions ADD COLUMN search_text TEXT NOT NULL DEFAULT ''",
+        "CREATE INDEX IF NOT EXISTS ix_sessions_q ON sessions(q_count DESC, timestamp DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_sessions_conf ON sessions(conf_avg DESC, timestamp DESC)",
+        "UPDATE sessions SET file_mtime=0",
+    ],
+    # сводка для аналитики (analytics.py); заполняется ближайшим sync
+    3: SUMMARY_SQL + ["UPDATE sessions SET file_mtime=0"],
+}
+
+INDEX_COLUMNS = [
+    "session_id", "name", "contact", "request", "timestamp", "q_count", "has_report",
+    "conf_avg", "search_text",
+]
+LIST_COLUMNS = [c for c in INDEX_COLUMNS if c != "search_text"]
+
+SORTS = {
+    "timestamp": "timestamp",
+    "q_count": "q_count",
+    "confidence": "conf_avg",
+}
+
+
+def index_row(payload: dict) -> dict:
+    meta = payload.get("meta", {}) or {}
+    conf = payload.get("confidence", {}) or {}
+    vals = []
+    for p in ["p1","p2","p3"]:
+        try:
+            vals.append(float(conf.get(p) or 0))
+        except (TypeError, ValueError):
+            vals.append(0.0)
+    row = {
+        "session_id": meta.get("session_id", ""),
+        "name": meta.get("name", "") or "",
+        "contact": meta.get("contact", "") or "",
+        "request": meta.get("request", "") or "",
+        "timestamp": meta.get("timestamp", "") or "",
+        "q_count": int(meta.get("q_count", 0) or 0),
+        "has_report": 1 if payload.get("ai_master_report") else 0,
+        "conf_avg": sum(vals) / len(vals),
+    }
+    row["search_text"] = " | ".join([row["name"], row["contact"], row["request"]]).lower()
+    return row
+
+
+class SessionStore:
+    def __init__(self, data_dir: Path, db_path: Path = None, encoding: str = "compact"):
+        self.data_dir = Path(data_dir)
+        self.encoding = encoding if encoding in session_codec.SUFFIX else "compact"
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = Path(db_path) if db_path else self.data_dir / "index.sqlite3"
+        self._local = threading.local()
+        self._init_db()
+
+    # ---------- db ----------
+    def _conn(self) -> sqlite3.Connection:
+        # одно соединение на поток (Streamlit крутит сессии в разных потоках)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        with conn:
+            conn.executescript(_SCHEMA)
+            ver = conn.execute("PRAGMA user_version").fetchone()[0]
+            for v in sorted(_MIGRATIONS):
+                if v > ver:
+                    for sql in _MIGRATIONS[v]:
+                        conn.execute(sql)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        # полнотекст по подстроке (имя/контакт/запрос); без FTS5 — откат на LIKE
+        try:
+            with conn:
+                had = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name='sessions_fts'"
+                ).fetchone()
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts "
+                    "USING fts5(search_text, tokenize='trigram')"
+                )
+                if not had:
+                    conn.execute("UPDATE sessions SET file_mtime=0")
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+
+    def _upsert(self, conn, row: dict, mtime: float, size: int, summary: tuple = None):
+        cols = INDEX_COLUMNS + ["file_mtime", "file_size"]
+        vals = [row[c] for c in INDEX_COLUMNS] + [mtime, size]
+        conn.execute(
+            f"INSERT INTO sessions ({','.join(cols)}) VALUES ({','.join('?' * len(cols))}) "
+            f"ON CONFLICT(session_id) DO UPDATE SET "
+            + ",".join(f"{c}=excluded.{c}" for c in cols[1:]),
+            vals,
+        )
+        if self.fts:
+            # rowid в FTS совпадает с rowid строки sessions
+            rid = conn.execute("SELECT rowid FROM sessions WHERE session_id=?", (row["session_id"],)).fetchone()[0]
+            conn.execute("DELETE FROM sessions_fts WHERE rowid=?", (rid,))
+            conn.execute("INSERT INTO sessions_fts (rowid, search_text) VALUES (?, ?)", (rid, row["search_text"]))
+        if summary is not None:
+            upsert_summary(conn, summary)
+
+    # ---------- files ----------
+    def path(self, session_id: str) -> Path:
+        # существующий файл сессии (компактный — первым), иначе — куда писать
+        for suffix in (".neo", ".json"):
+            p = self.data_dir / f"{session_id}{suffix}"
+            if p.exists():
+                return p
+        return self.data_dir / f"{session_id}{session_codec.SUFFIX[self.encoding]}"
+
+    def exists(self, session_id: str) -> bool:
+        return any((self.data_dir / f"{session_id}{s}").exists() for s in session_codec.SUFFIX.values())
+
+    def save(self, payload: dict):
+        # через временный файл: читатель (мастер-панель, воркер отчётов) не увидит полфайла
+        sid = payload["meta"]["session_id"]
+        p = self.data_dir / f"{sid}{session_codec.SUFFIX[self.encoding]}"
+        tmp = p.with_name(f".{p.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(session_codec.dumps(payload, self.encoding))
+        os.replace(tmp, p)
+        # файл в другом формате (до миграции) больше не нужен
+        for suffix in session_codec.SUFFIX.values():
+            if suffix != p.suffix:
+                (self.data_dir / f"{sid}{suffix}").unlink(missing_ok=True)
+        st_ = p.stat()
+        conn = self._conn()
+        with conn:
+            self._upsert(conn, index_row(payload), st_.st_mtime, st_.st_size, summary_row(payload))
+
+    def load(self, session_id: str):
+        p = self.path(session_id)
+        if not p.exists():
+            return None
+        return session_codec.loads(p.read_bytes())
+
+    # ---------- index queries ----------
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def list(self, limit: int = -1, offset: int = 0):
+        rows, _ = self.query(limit=limit, offset=offset, with_total=False)
+        return rows
+
+    def query(self, text: str = "", date_from: str = "", date_to: str = "",
+              sort: str = "timestamp", desc: bool = True,
+              limit: int = 25, offset: int = 0, with_total: bool = True):
+        # страница сессий + общее число под фильтром; всё считается в SQLite по индексам
+        where, args = [], []
+        text = (text or "").strip().lower()
+        if text:
+            if self.fts and len(text) >= 3:
+                where.append("rowid IN (SELECT rowid FROM sessions_fts WHERE sessions_fts MATCH ?)")
+                args.append('"' + text.replace('"', '""') + '"')
+            else:
+                where.append("search_text LIKE ? ESCAPE '\\'")
+                args.append("%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if date_from:
+            where.append("timestamp >= ?")
+            args.append(date_from)
+        if date_to:
+            where.append("timestamp < ?")
+            args.append(date_to)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        col = SORTS.get(sort, "timestamp")
+        direction = "DESC" if desc else "ASC"
+        order = f"{col} {direction}" + (f", timestamp {direction}" if col != "timestamp" else "")
+
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT {','.join(LIST_COLUMNS)} FROM sessions {clause} ORDER BY {order} LIMIT ? OFFSET ?",
+            args + [limit, offset],
+        ).fetchall()
+        total = None
+        if with_total:
+            total = conn.execute(f"SELECT COUNT(*) FROM sessions {clause}", args).fetchone()[0]
+        return [dict(r) for r in rows], total
+
+    def without_report(self, limit: int = -1) -> list:
+        # session_id сессий без ai_master_report, старые первыми
+        rows = self._conn().execute(
+            "SELECT session_id FROM sessions WHERE has_report=0 ORDER BY timestamp LIMIT ?", (limit,)
+        ).fetchall()
+        return [r["session_id"] for r in rows]
+
+    def select_ids(self, date_from: str = "", date_to: str = "",
+                   completed: bool = None, has_report: bool = None) -> list:
+        # session_id под фильтром, по времени; completed — все три позиции определены
+        where, args = [], []
+        if date_from:
+            where.append("s.timestamp >= ?")
+            args.append(date_from)
+        if date_to:
+            where.append("s.timestamp < ?")
+            args.append(date_to)
+        if has_report is not None:
+            where.append("s.has_report = ?")
+            args.append(int(bool(has_report)))
+        if completed is not None:
+            full = "(m.p1 >= 0 AND m.p2 >= 0 AND m.p3 >= 0)"
+            where.append(full if completed else f"NOT COALESCE({full}, 0)")
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        rows = self._conn().execute(
+            "SELECT s.session_id FROM sessions s LEFT JOIN session_summary m ON m.session_id = s.session_id "
+            f"{clause} ORDER BY s.timestamp", args
+        ).fetchall()
+        return [r["session_id"] for r in rows]
+
+    def summary_rows(self, after_seq: int = 0) -> list:
+        # строки сводки, записанные после after_seq (для analytics.Analytics)
+        return self._conn().execute(
+            "SELECT session_id, seq, day, p1, p2, p3, c1, c2, c3, scores FROM session_summary "
+            "WHERE seq > ? ORDER BY seq", (after_seq,)
+        ).fetchall()
+
+    def summary_count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM session_summary").fetchone()[0]
+
+    def get_meta(self, session_id: str):
+        r = self._conn().execute(
+            f"SELECT {','.join(LIST_COLUMNS)} FROM sessions WHERE session_id=?", (session_id,)
+        ).fetchone()
+        return dict(r) if r else None
+
+    # ---------- sync ----------
+    def files(self) -> list:
+        # по одному файлу на сессию; если есть оба формата — компактный
+        out = {p.stem: p for p in self.data_dir.glob("*.json")}
+        out.update({p.stem: p for p in self.data_dir.glob("*.neo")})
+        return list(out.values())
+
+    def sync(self) -> dict:
+        # сверка индекса с каталогом: парсятся только новые/изменённые файлы
+        conn = self._conn()
+        known = {
+            r["session_id"]: (r["file_mtime"], r["file_size"])
+            for r in conn.execute("SELECT session_id, file_mtime, file_size FROM sessions")
+        }
+        seen, added, updated = set(), 0, 0
+        with conn:
+            for p in self.files():
+                sid = p.stem
+                try:
+                    st_ = p.stat()
+                except OSError:
+                    continue
+                seen.add(sid)
+                if known.get(sid) == (st_.st_mtime, st_.st_size):
+                    continue
+                try:
+                    payload = session_codec.loads(p.read_bytes())
+                except Exception:
+                    continue
+                row = index_row(payload)
+                row["session_id"] = sid  # имя файла — источник истины для индекса
+                self._upsert(conn, row, st_.st_mtime, st_.st_size, (sid,) + summary_row(payload)[1:])
+                if sid in known:
+                    updated += 1
+                else:
+                    added += 1
+            gone = [sid for sid in known if sid not in seen]
+            if self.fts:
+                conn.executemany(
+                    "DELETE FROM sessions_fts WHERE rowid IN (SELECT rowid FROM sessions WHERE session_id=?)",
+                    [(g,) for g in gone],
+                )
+            conn.executemany("DELETE FROM sessions WHERE session_id=?", [(g,) for g in gone])
+            conn.executemany("DELETE FROM session_summary WHERE session_id=?", [(g,) for g in gone])
+        return {"added": added, "updated": updated, "removed": len(gone)}
@@ -0,0 +1,80 @@
+import adaptive
+import scoring
+
+STEPS = [{"id": s} for s in ("p1_scope_1", "p1_pot_1", "p1_pot_2", "p2_pot_1", "p2_pot_2")]
+
+
+def state_after(answers, positions=None):
+    # answers: [(step_id, {pot: delta по total})] → state, как его ведёт интервью
+    m = scoring.empty()
+    steps = []
+    for _, d in answers:
+        scoring.apply(m, scoring.from_dicts(d))
+        steps.append(m.copy())
+    return {
+        "answers": [{"step_id": sid} for sid, _ in answers],
+        "score_steps": steps,
+        "score_matrix": m,
+        "positions": positions or {},
+        "step_index": [s["id"] for s in STEPS].index(answers[-1][0]),
+        "q_count": len(answers),
+    }
+
+
+def test_position_of_and_kind():
+    assert adaptive.position_of("p2_pot_1") == 2
+    assert adaptive.position_of("intro") == 0
+    assert adaptive.step_kind("p3_refine_1") == "refine_1"
+
+
+def test_position_scores_exclude_taken_and_other_positions():
+    st = state_after([("p1_pot_1", {"Рубин": 1.0}), ("p2_pot_1", {"Сапфир": 0.5, "Рубин": 0.5})],
+                     positions={"p1": "Рубин"})
+    vec = adaptive.position_scores(st, 2)
+    assert vec[scoring.POT_INDEX["Рубин"]] == float("-inf")
+    assert vec[scoring.POT_INDEX["Сапфир"]] == 0.5
+    # баллы первой позиции в разрыв второй не попадают
+    assert adaptive.margins(st) == {"p1": 1.0, "p2": 0.5}
+
+
+def test_clear_leader_skips_follow_up():
+    st = state_after([("p1_scope_1", {}), ("p1_pot_1", {"Рубин": 1.0, "Сапфир": 0.5}),
+                      ("p1_pot_1", {"Рубин": 1.0})])
+    st["step_index"] = 1
+    nxt = adaptive.advance(st, STEPS, {"skip_margin": 1.2})
+    assert nxt == 3
+    assert st["skipped"] == ["p1_pot_2"]
+
+
+def test_close_race_keeps_follow_up():
+    st = state_after([("p1_scope_1", {}), ("p1_pot_1", {"Рубин": 0.6, "Сапфир": 0.5})])
+    assert adaptive.advance(st, STEPS) == 2
+    assert st["skipped"] == []
+
+
+def test_disabled_goes_in_order():
+    st = state_after([("p1_pot_1", {"Рубин": 1.0}), ("p1_pot_1", {"Рубин": 1.0})])
+    assert adaptive.advance(st, STEPS, {"enabled": False}) == st["step_index"] + 1
+    assert "skipped" not in st
+
+
+def test_saved_question_refines_ambiguous_position():
+    st = state_after([("p1_pot_1", {"Рубин": 1.0}), ("p1_pot_1", {"Рубин": 1.0}),
+                      ("p2_pot_2", {"Сапфир": 0.3, "Цитрин": 0.2})])
+    st["skipped"] = ["p1_pot_2"]
+    nxt = adaptive.advance(st, STEPS)
+    assert nxt == len(STEPS)
+    (extra,) = st["extra_steps"]
+    assert extra["id"] == "p2_refine_1"
+    assert "Сапфир и Цитрин" in extra["goal"]
+    # сэкономлен один вопрос — второе уточнение не добавляется
+    st["step_index"] = nxt
+    assert adaptive.advance(st, STEPS) == nxt + 1
+    assert len(st["extra_steps"]) == 1
+
+
+def test_refine_respects_question_limit():
+    st = state_after([("p1_pot_1", {"Рубин": 0.1}), ("p2_pot_2", {"Сапфир": 0.1})])
+    st["skipped"] = ["p1_pot_2"]
+    adaptive.advance(st, STEPS, max_questions=2)
+    assert st["extra_steps"] == []
@@ -0,0 +1,35 @@
+import budget
+
+
+def tail(n: int, text: str = "обычный ответ клиента"):
+    return [{"step_id": f"s{i}", "question": "вопрос?", "answer": text} for i in range(n)]
+
+
+def fit(data: dict, limit: int):
+    cfg = budget.configure({"tokenizer": "heuristic", "report_max_input_tokens": limit})
+    return budget.fit_report(cfg, [{"role": "system", "content": "инструкция отчёта"}], data)
+
+
+def test_long_field_clipped_before_tail():
+    data = {"meta": {"request": "очень длинный запрос " * 2000}, "answers_digest": {}, "answers_tail": tail(10)}
+    data, b = fit(data, 1000)
+    assert b["trimmed"] == ["free_text"]
+    assert len(data["answers_tail"]) == 10
+    assert b["total"] <= b["limit"]
+    assert data["meta"]["request"].endswith("…")
+
+
+def test_tail_cut_only_until_fits():
+    data = {"meta": {}, "answers_digest": {}, "answers_tail": tail(200)}
+    data, b = fit(data, 1000)
+    assert b["trimmed"] == ["answers_tail"]
+    assert b["total"] <= b["limit"]
+    # после обрезки хвост занимает почти весь лимит, а не одну запись
+    assert len(data["answers_tail"]) > 10
+
+
+def test_under_limit_untouched():
+    data = {"meta": {"request": "коротко"}, "answers_digest": {}, "answers_tail": tail(3)}
+    data, b = fit(data, 6000)
+    assert b["trimmed"] == []
+    assert len(data["answers_tail"]) == 3
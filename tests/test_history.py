@@ -0,0 +1,51 @@
+import history
+
+
+def answers(n: int, step: str = "p1_pot_1", text: str = "короткий ответ"):
+    return [{"step_id": step, "question": f"вопрос {i}?", "answer": text} for i in range(n)]
+
+
+def test_short_history_stays_in_tail():
+    st = {"answers": answers(3)}
+    digest, tail = history.history_for_prompt(st)
+    assert digest == {} and len(tail) == 3
+    assert st["digest"]["upto"] == 0
+
+
+def test_tail_limited_by_count():
+    st = {"answers": answers(5, "p1_pot_1") + answers(5, "p2_pot_1")}
+    digest, tail = history.history_for_prompt(st, {"tail": 4, "evidence_per_position": 2})
+    assert len(tail) == 4
+    assert digest["p1"]["answers"] == 5 and digest["p2"]["answers"] == 1
+    assert len(digest["p1"]["evidence"]) == 2
+    assert digest["p1"]["evidence"][-1].startswith("вопрос 4?")
+
+
+def test_tail_limited_by_tokens_keeps_last_answer():
+    st = {"answers": answers(4, text="очень длинный ответ " * 200)}
+    _, tail = history.history_for_prompt(st, {"tail_budget_tokens": 50, "answer_chars": 4000})
+    assert len(tail) == 1
+    assert tail[0]["question"] == "вопрос 3?"
+
+
+def test_compact_is_incremental():
+    st = {"answers": answers(8)}
+    cfg = {"tail": 3}
+    history.compact(st, cfg)
+    assert st["digest"]["upto"] == 5
+    history.compact(st, cfg)
+    assert st["digest"]["positions"]["p1"]["answers"] == 5
+    st["answers"] += answers(2)
+    history.compact(st, cfg)
+    assert st["digest"]["upto"] == 7
+    # откат ответов (повтор шага) — дайджест собирается заново
+    st["answers"] = st["answers"][:2]
+    history.compact(st, cfg)
+    assert st["digest"]["upto"] == 0
+
+
+def test_clip_and_report_tail():
+    assert history.clip("a  b\nc", 10) == "a b c"
+    assert history.clip("x" * 20, 5) == "xxxx…"
+    digest, tail = history.history_for_report(answers(20), {"report_tail": 12})
+    assert len(tail) == 12 and digest["p1"]["answers"] == 8
@@ -0,0 +1,62 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from knowledge_index import build_index
+from prompting import PrefixGuard
+from scheduler import Scheduler
+from interview import STEPS, new_state, make_deps, stream_ai_next_question
+
+ROOT = Path(__file__).resolve().parent.parent
+ANSWER = {"question": "Что для тебя важно?", "options": ["Смыслы", "Эмоции"], "analysis_update": {}}
+
+
+class FakeResponses:
+    def __init__(self, deltas):
+        self.deltas = deltas
+
+    def create(self, **kw):
+        assert kw.get("stream")
+        events = [SimpleNamespace(type="response.output_text.delta", delta=d) for d in self.deltas]
+        usage = {"input_tokens": 10, "output_tokens": 5}
+        events.append(SimpleNamespace(type="response.completed", response=SimpleNamespace(usage=usage)))
+        return iter(events)
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    return build_index(ROOT / "knowledge/positions.md", tmp_path_factory.mktemp("kx") / "index.json")
+
+
+def run(index, deltas, scheduler=None):
+    deps = make_deps(index, PrefixGuard(None), 24, 0.78, 3500, 8, scheduler=scheduler)
+    client = SimpleNamespace(responses=FakeResponses(deltas))
+    step = STEPS[0]
+    return stream_ai_next_question(client, "m", step["id"], step["goal"], new_state(), deps)
+
+
+@pytest.mark.parametrize("split", [None, 5])
+def test_fields_after_question_reach_on_field(index, split):
+    # весь ответ одним куском: options закрывается в том же feed(), что и question
+    text = json.dumps(ANSWER, ensure_ascii=False)
+    deltas = [text] if split is None else [text[i:i + split] for i in range(0, len(text), split)]
+    chunks, finish, close = run(index, deltas)
+    try:
+        assert "".join(chunks()) == ANSWER["question"]
+        seen = {}
+        q, info = finish(lambda k, v: seen.setdefault(k, v))
+    finally:
+        close()
+    assert seen["options"] == ANSWER["options"]
+    assert "analysis_update" in seen
+    assert q["options"] == ANSWER["options"]
+
+
+def test_close_releases_ticket_when_abandoned(index):
+    s = Scheduler(max_concurrency=2)
+    chunks, finish, close = run(index, [json.dumps(ANSWER)], scheduler=s)
+    next(chunks())
+    close()
+    assert s.snapshot()["running"] == 0
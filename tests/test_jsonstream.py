@@ -0,0 +1,30 @@
+import json
+
+from jsonstream import ObjectStreamParser
+
+
+def feed_all(text: str, step: int):
+    p = ObjectStreamParser("question")
+    events = []
+    for i in range(0, len(text), step):
+        events += p.feed(text[i:i + step])
+    return p, events
+
+
+def test_stream_key_and_fields_any_chunking():
+    obj = {"type": "single", "question": "Что \"важно\"\nдля тебя? é 😀",
+           "options": ["а", "б, в"], "n": 3, "ok": True}
+    text = json.dumps(obj)  # ensure_ascii: \uXXXX и суррогатная пара
+    for step in (1, 2, 7, len(text)):
+        p, events = feed_all(text, step)
+        assert "".join(e[1] for e in events if e[0] == "delta") == obj["question"]
+        assert {e[1]: e[2] for e in events if e[0] == "field"} == obj
+        assert json.loads(p.text()) == obj
+
+
+def test_field_emitted_as_soon_as_closed():
+    p = ObjectStreamParser("question")
+    events = p.feed('{"options": ["x", "y"], "question": "дол')
+    assert ("field", "options", ["x", "y"]) in events
+    assert ("delta", "дол") in events
+    assert not any(e[0] == "field" and e[1] == "question" for e in events)
@@ -0,0 +1,41 @@
+import re
+
+from metrics import Metrics, rotate
+
+# строка text format: имя{метка="значение",...} число
+LINE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*(\{([a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\\n])*",?)*\})? \S+$')
+
+
+def test_prometheus_escapes_labels_and_names():
+    m = Metrics()
+    m.inc("budget.tokens", 5, kind='say "hi"\\now', part="a\nb")
+    m.observe("model.ttfb", 0.2, model="gpt-4.1")
+    text = m.to_prometheus()
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            assert LINE.match(line), line
+    assert 'kind="say \\"hi\\"\\\\now"' in text
+    assert 'part="a\\nb"' in text
+    assert "neo_budget_tokens_total" in text
+
+
+def test_snapshot_percentiles_and_counters():
+    m = Metrics()
+    for ms in range(1, 101):
+        m.observe("stage", ms / 1000, kind="q")
+    m.inc("calls", 2, kind="q")
+    snap = m.snapshot()
+    st = snap["stages"][0]
+    assert (st["count"], st["p50_ms"], st["max_ms"]) == (100, 51.0, 100.0)
+    assert snap["counters"] == [{"name": "calls", "kind": "q", "value": 2}]
+
+
+def test_rotate_keeps_backups(tmp_path):
+    p = tmp_path / "m.jsonl"
+    for i in range(4):
+        p.write_text(str(i))
+        rotate(p, 2)
+    assert not p.exists()
+    assert (tmp_path / "m.jsonl.1").read_text() == "3"
+    assert (tmp_path / "m.jsonl.2").read_text() == "2"
+    assert not (tmp_path / "m.jsonl.3").exists()
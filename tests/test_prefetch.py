@@ -0,0 +1,41 @@
+import time
+import threading
+
+from prefetch import Prefetcher
+
+
+def slow(sec, usage):
+    time.sleep(sec)
+    return {"question": "?"}, {"usage": usage}
+
+
+def test_take_ready_candidate():
+    pf = Prefetcher(max_workers=2)
+    pf.submit(("s", 1, "a"), slow, 0, {"input_tokens": 1})
+    time.sleep(0.05)
+    assert pf.take(("s", 1, "a"), timeout=0.5)[0] == {"question": "?"}
+    assert pf.snapshot()["hits"] == 1
+
+
+def test_slow_candidate_times_out_and_is_counted_unused():
+    seen, done = [], threading.Event()
+    pf = Prefetcher(max_workers=2, on_unused=lambda k, r: (seen.append(r[1]["usage"]), done.set()))
+    pf.submit(("s", 1, "a"), slow, 0.3, {"input_tokens": 5})
+    t0 = time.monotonic()
+    assert pf.take(("s", 1, "a"), timeout=0.05) is None
+    assert time.monotonic() - t0 < 0.2
+    assert done.wait(2)
+    assert seen == [{"input_tokens": 5}]
+    assert [r[1]["usage"] for r in pf.pop_unused("s")] == [{"input_tokens": 5}]
+    assert pf.pop_unused("s") == []
+    assert pf.snapshot()["late"] == 1
+
+
+def test_discarded_finished_candidates_are_unused():
+    pf = Prefetcher(max_workers=2)
+    pf.submit(("s", 1, "a"), slow, 0, {"input_tokens": 1})
+    pf.submit(("s", 1, "b"), slow, 0, {"input_tokens": 2})
+    time.sleep(0.05)
+    pf.discard("s")
+    assert sorted(r[1]["usage"]["input_tokens"] for r in pf.pop_unused("s")) == [1, 2]
+    assert pf.snapshot()["unused"] == 2
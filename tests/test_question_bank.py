@@ -0,0 +1,74 @@
+from pathlib import Path
+
+import pytest
+
+from question_bank import (
+    build_bank_dict, build_bank, check_bank, BankError, _clean, _nominative, pick_phrase,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+KNOWLEDGE = ROOT / "knowledge/positions.md"
+
+
+@pytest.fixture(scope="module")
+def bank():
+    return build_bank_dict(KNOWLEDGE.read_text(encoding="utf-8"))
+
+
+def test_built_bank_passes_check(bank):
+    assert check_bank(bank) == []
+
+
+def test_labels_distinct_per_step(bank):
+    for step_id, spec in bank["steps"].items():
+        if "phrase" in spec:
+            labels = [pick_phrase(k[spec["phrase"]], spec["alt"]) for k in bank["phrases"]]
+            assert len(set(labels)) == len(labels), step_id
+
+
+@pytest.mark.parametrize("text", [
+    "Восприятие через",             # предлог на конце
+    "Интерес к продукту, возможную",  # прилагательное без существительного
+    "Работу производства",          # винительный на "что про тебя?"
+    "Звук (вибрация",               # скобка без пары
+    "",
+])
+def test_check_catches_broken_labels(text):
+    data = {"pots": ["A"], "phrases": [[["Слуховое восприятие"], [text]]], "steps": {}}
+    assert check_bank(data)
+
+
+def test_scope_2_accusative_allowed():
+    data = {"pots": [], "phrases": [], "steps": {"p1_scope_2": {"o": [["Коммуникацию, интерес", [1]]]},
+                                                 "p1_scope_1": {"o": [["Физику, деньги", [6]]]}}}
+    problems = check_bank(data)
+    assert len(problems) == 1 and problems[0].startswith("p1_scope_1")
+
+
+def test_clean_and_nominative():
+    assert _clean("Анализирует работу (насколько копирование, происходит правильно), могут различить") == "Работу"
+    assert _clean("Звук, вибрация идеи - пояснение") == "Звук, вибрация идеи"
+    assert _nominative("работу производства") == "работа производства"
+    assert _nominative("Интерес к эмоциональному продукту, возможную популярность и охват") == \
+        "Интерес к эмоциональному продукту, возможная популярность и охват"
+    assert _nominative("Спрос, интерес к продукту, функциональному устройству").endswith("функциональному устройству")
+    assert _nominative("эффективности бизнеса") == "эффективность бизнеса"
+
+
+def test_build_bank_drops_broken_clause(tmp_path):
+    md = tmp_path / "positions.md"
+    md.write_text(KNOWLEDGE.read_text(encoding="utf-8").replace("Анализирует работу производства",
+                                                                  "Анализирует работу производства через"),
+                  encoding="utf-8")
+    # фраза с предлогом на конце не обрезается, а отбрасывается целиком
+    b = build_bank(md, tmp_path / "bank.json")
+    assert check_bank(b.data) == []
+    assert not any("через" in t for k in b.data["phrases"] for xs in k for t in xs if t.endswith("через"))
+
+
+def test_build_bank_raises_on_problems(tmp_path, monkeypatch):
+    import question_bank
+    monkeypatch.setattr(question_bank, "check_bank", lambda data: ["p1_pot_1: оборванная фраза"])
+    with pytest.raises(BankError):
+        build_bank(KNOWLEDGE, tmp_path / "bank.json")
+    assert not (tmp_path / "bank.json").exists()
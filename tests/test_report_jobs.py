@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+
+from session_store import SessionStore
+from report_jobs import ReportQueue
+
+
+def make_queue(tmp_path, generate, n=5, **kw):
+    store = SessionStore(tmp_path / "sessions")
+    for i in range(n):
+        store.save({"meta": {"session_id": f"s{i}", "timestamp": f"2026-10-0{i + 1}T00:00:00"}, "answers": []})
+    return store, ReportQueue(store, generate, **kw)
+
+
+def test_each_job_claimed_once(tmp_path):
+    calls, lock = [], threading.Lock()
+
+    def generate(payload, model, force):
+        with lock:
+            calls.append(payload["meta"]["session_id"])
+        return f"отчёт {payload['meta']['session_id']}", {}
+
+    store, q = make_queue(tmp_path, generate, n=8, workers=4)
+    q.enqueue([f"s{i}" for i in range(8)], "m")
+    q.wait(poll_sec=0.05)
+    assert sorted(calls) == [f"s{i}" for i in range(8)]
+    assert q.progress()["done"] == 8
+    assert store.load("s3")["ai_master_report"] == "отчёт s3"
+
+
+def test_claim_order_and_requeue(tmp_path):
+    store, q = make_queue(tmp_path, lambda *a: ("x", {}), n=3, workers=1)
+    q.kick = lambda: None  # воркеры не стартуют: захват вручную
+    q.enqueue(["s2", "s0", "s1"], "m")
+    q.enqueue(["s2"], "m")  # уже в очереди — не дублируется
+    assert [q._claim()["session_id"] for _ in range(3)] == ["s2", "s0", "s1"]
+    assert q._claim() is None
+    assert q.status("s2")["status"] == "running"
+    q.stale_sec = 0
+    assert q.requeue_stale() == 3
+
+
+def test_failed_after_max_attempts_and_existing_report_skipped(tmp_path):
+    def generate(payload, model, force):
+        raise RuntimeError("нет модели")
+
+    store, q = make_queue(tmp_path, generate, n=2, workers=1, max_attempts=2)
+    p = store.load("s1")
+    p["ai_master_report"] = "готов"
+    store.save(p)
+    q.enqueue(["s0", "s1"], "m")
+    q.wait(poll_sec=0.05)
+    assert q.status("s0")["status"] == "failed"
+    assert q.status("s0")["attempts"] == 2
+    assert q.status("s1")["status"] == "skipped"
+
+
+def test_worker_survives_claim_errors(tmp_path):
+    threads = set()
+
+    def generate(payload, model, force):
+        threads.add(threading.current_thread())
+        return "x", {}
+
+    store, q = make_queue(tmp_path, generate, n=2, workers=1)
+    real, fails = q._claim, [1]
+
+    def flaky():
+        threads.add(threading.current_thread())
+        if fails[0]:
+            fails[0] -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return real()
+
+    q._claim = flaky
+    q.enqueue(["s0", "s1"], "m")
+    q.wait(poll_sec=0.05)
+    assert q.progress()["done"] == 2
+    assert len(threads) == 1  # тот же воркер пережил ошибку захвата
+
+
+def test_stale_running_requeued_by_kick(tmp_path):
+    store, q = make_queue(tmp_path, lambda *a: ("x", {}), n=1, workers=1)
+    spawn = q.kick
+    q.kick = lambda: None
+    q.enqueue(["s0"], "m")
+    q._claim()  # воркер "упал" с заданием в running
+    q.kick = spawn
+    q.stale_sec = 0
+    q.stale_checked = 0.0
+    q.wait(poll_sec=0.05)
+    assert q.status("s0")["status"] == "done"
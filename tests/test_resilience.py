@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+from resilience import ResilientCaller, ModelUnavailable, repair_json, parse_question, InvalidAnswer
+from scheduler import Scheduler, SchedulerBusy
+
+
+class Transient(Exception):
+    status_code = 503
+
+
+class Rejected(Exception):
+    status_code = 401
+
+
+def caller(**cfg):
+    return ResilientCaller({"backoff_base_sec": 0.01, "hedge": False, **cfg})
+
+
+def test_transient_error_retried():
+    calls = []
+
+    def fn(timeout, hedged):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise Transient()
+        return "ok"
+
+    r = caller(max_attempts=3)
+    assert r.run(fn) == "ok"
+    assert r.stats["retries"] == 2
+    assert calls[1] < calls[0]  # таймаут — остаток бюджета
+
+
+def test_fatal_error_not_retried():
+    calls = []
+
+    def fn(timeout, hedged):
+        calls.append(1)
+        raise Rejected()
+
+    r = caller(max_attempts=3)
+    with pytest.raises(ModelUnavailable) as e:
+        r.run(fn)
+    assert isinstance(e.value.__cause__, Rejected)
+    assert len(calls) == 1
+
+
+def test_hedge_wins_when_primary_slow():
+    def fn(timeout, hedged):
+        if not hedged:
+            time.sleep(0.5)
+        return "hedge" if hedged else "primary"
+
+    r = caller(hedge=True, hedge_after_sec=0.05)
+    assert r.run(fn) == "hedge"
+    assert r.stats["hedge_wins"] == 1
+
+
+def test_busy_hedge_does_not_hide_primary_error():
+    calls = []
+
+    def fn(timeout, hedged):
+        calls.append(hedged)
+        if hedged:
+            raise SchedulerBusy("queue full")
+        time.sleep(0.2)
+        if calls.count(False) == 1:
+            raise Transient()
+        return "ok"
+
+    r = caller(hedge=True, hedge_after_sec=0.05, max_attempts=2)
+    assert r.run(fn) == "ok"
+    assert r.stats["retries"] == 1
+
+
+def test_hung_call_bounded_by_budget():
+    def fn(timeout, hedged):
+        time.sleep(2)
+        return "late"
+
+    r = caller(hedge=True, hedge_after_sec=0.05)
+    t0 = time.monotonic()
+    with pytest.raises(ModelUnavailable):
+        r.run(fn, budget_sec=0.4)
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_scheduler_wait_bounded_by_max_wait():
+    s = Scheduler(max_concurrency=1)
+    held = s.acquire("question", "a")
+    t0 = time.monotonic()
+    with pytest.raises(SchedulerBusy):
+        s.acquire("question", "b", max_wait=0.1)
+    assert time.monotonic() - t0 < 0.5
+    s.release(held)
+
+
+def test_breaker_opens_after_failures():
+    def fn(timeout, hedged):
+        raise Transient()
+
+    r = caller(max_attempts=1, breaker_failures=2)
+    for _ in range(2):
+        with pytest.raises(ModelUnavailable):
+            r.run(fn)
+    with pytest.raises(ModelUnavailable):
+        r.run(fn)
+    assert r.stats["fast_fail"] == 1
+
+
+def test_repair_json():
+    assert repair_json('```json\n{"question": "Да?", "options": ["a",],}\n```') == {"question": "Да?", "options": ["a"]}
+    # оборванный последний элемент отбрасывается, скобки закрываются
+    assert repair_json('{"question": "Оборван", "options": ["a", "b') == {"question": "Оборван", "options": ["a"]}
+    assert repair_json("не json") is None
+
+
+def test_parse_question_normalises():
+    q, repaired = parse_question('{"question": " Что? ", "type": "single", "options": []}')
+    assert (q["question"], q["type"], repaired) == ("Что?", "text", False)
+    with pytest.raises(InvalidAnswer):
+        parse_question('{"options": ["a"]}')
@@ -0,0 +1,45 @@
+import os
+import time
+
+from response_cache import ResponseCache, cache_key
+
+
+def test_key_depends_on_every_part():
+    base = cache_key("question", "m", "fp", "p1_pot_1", [{"role": "user", "content": "x"}])
+    assert base == cache_key("question", "m", "fp", "p1_pot_1", [{"role": "user", "content": "x"}])
+    assert base != cache_key("question", "m2", "fp", "p1_pot_1", [{"role": "user", "content": "x"}])
+    assert base != cache_key("question", "m", "fp", "p1_pot_1", [{"role": "user", "content": "y"}])
+
+
+def test_lru_and_ttl():
+    c = ResponseCache(max_items=2, ttl_sec=0.1)
+    c.put("a", 1)
+    c.put("b", 2)
+    c.get("a")
+    c.put("c", 3)  # вытесняет b — к a обращались позже
+    assert (c.get("a"), c.get("b"), c.get("c")) == (1, None, 3)
+    time.sleep(0.15)
+    assert c.get("a") is None
+    assert c.stats["expired"] >= 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResponseCache(disk_dir=tmp_path).put("k" * 64, {"q": "вопрос"})
+    c = ResponseCache(disk_dir=tmp_path)
+    assert c.get("k" * 64) == {"q": "вопрос"}
+    assert c.stats["disk_hits"] == 1
+
+
+def test_disk_expired_and_over_limit_pruned(tmp_path):
+    c = ResponseCache(ttl_sec=60, disk_dir=tmp_path, disk_max_files=5)
+    keys = [f"{i:02d}" + "x" * 62 for i in range(8)]
+    for k in keys:
+        c.put(k, "v" * 100)
+    c.prune()
+    assert c.snapshot()["disk_files"] <= 5
+    old = c._path(keys[-1])
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    c.prune()
+    assert not old.exists()
+    c.clear()
+    assert c.get(keys[-1]) is None
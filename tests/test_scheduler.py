@@ -0,0 +1,83 @@
+import time
+import threading
+
+import pytest
+
+from scheduler import Scheduler, SchedulerBusy
+
+
+def wait_depth(s: Scheduler, n: int):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with s.cond:
+            if s._depth() == n:
+                return
+        time.sleep(0.005)
+    raise AssertionError(f"очередь не дошла до {n}")
+
+
+def run_queued(s: Scheduler, jobs):
+    # jobs — [(kind, session_id, метка)]; встают в очередь строго по порядку,
+    # пока слот занят; возвращает порядок выдачи
+    order, threads = [], []
+    hold = s.acquire("question", "hold")
+
+    def go(kind, sid, label):
+        t = s.acquire(kind, sid)
+        order.append(label)
+        s.release(t)
+
+    for n, job in enumerate(jobs, 1):
+        th = threading.Thread(target=go, args=job)
+        th.start()
+        threads.append(th)
+        wait_depth(s, n)
+    s.release(hold)
+    for th in threads:
+        th.join(5)
+    return order
+
+
+def test_sessions_served_round_robin():
+    s = Scheduler(max_concurrency=1, aging_sec=0)
+    order = run_queued(s, [("question", "A", "a1"), ("question", "A", "a2"), ("question", "A", "a3"),
+                           ("question", "B", "b1")])
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_question_before_report():
+    s = Scheduler(max_concurrency=1, aging_sec=0)
+    order = run_queued(s, [("report", "A", "r"), ("question", "B", "q")])
+    assert order == ["q", "r"]
+
+
+def test_prefetch_rejected_when_busy():
+    s = Scheduler(max_concurrency=1)
+    t = s.acquire("question", "A")
+    with pytest.raises(SchedulerBusy):
+        s.acquire("prefetch", "B")
+    s.release(t)
+    assert s.snapshot()["running"] == 0
+
+
+class Rerun(BaseException):
+    # как RerunException / StopException Streamlit
+    pass
+
+
+def test_slot_released_on_base_exception():
+    s = Scheduler(max_concurrency=1)
+    with pytest.raises(Rerun):
+        with s.slot("question", "A"):
+            raise Rerun()
+    assert s.snapshot()["running"] == 0
+    assert s.stats["question"]["errors"] == 0
+
+
+def test_slot_error_counted():
+    s = Scheduler(max_concurrency=1)
+    with pytest.raises(ValueError):
+        with s.slot("question", "A"):
+            raise ValueError()
+    assert s.snapshot()["running"] == 0
+    assert s.stats["question"]["errors"] == 1
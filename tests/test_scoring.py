@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+
+import scoring
+
+
+def test_delta_drops_bad_values_and_clips():
+    update = {
+        "scores_delta": {"Сапфир": 0.5, "Рубин": "abc", "Янтарь": math.nan, "Цитрин": 7, "Нет": 1},
+        "col_scores_delta": {"tool": {"Гранат": "0.25", "Шунгит": math.inf}, "bogus": {"Сапфир": 1}},
+    }
+    delta, bad = scoring.delta_from_update(update)
+    assert bad == 4
+    i = scoring.POT_INDEX
+    assert delta[i["Сапфир"], 0] == 0.5
+    assert delta[i["Цитрин"], 0] == scoring.DELTA_LIMIT
+    assert delta[i["Гранат"], scoring.AXIS_INDEX["tool"]] == 0.25
+    assert delta[i["Рубин"], 0] == 0.0
+
+
+def test_delta_from_non_dict():
+    delta, bad = scoring.delta_from_update("мусор")
+    assert bad == 0 and not delta.any()
+
+
+def test_apply_clips_total():
+    m = scoring.empty()
+    one = scoring.empty()
+    one[0, 0] = 1.0
+    for _ in range(15):
+        scoring.apply(m, one)
+    assert m[0, 0] == scoring.SCORE_LIMIT
+    scoring.apply(m, -30 * one)
+    assert m[0, 0] == -scoring.SCORE_LIMIT
+
+
+def test_topk_descending():
+    m = scoring.from_dicts({"Рубин": 3, "Сапфир": 1, "Цитрин": 2})
+    assert scoring.topk(m, k=2) == [("Рубин", 3.0), ("Цитрин", 2.0)]
+    assert scoring.topk(m, k=0) == []
+    assert len(scoring.topk(m, k=20)) == len(scoring.POTS)
+
+
+def test_dicts_round_trip():
+    m = scoring.empty()
+    m[:] = np.arange(m.size, dtype=np.float64).reshape(m.shape) / 7
+    scores, col_scores = scoring.to_dicts(m)
+    assert set(col_scores) == set(scoring.COLS)
+    back = scoring.from_payload({"scores": scores, "col_scores": col_scores})
+    assert np.array_equal(back, m)
+    rounded, _ = scoring.to_dicts(m, 2)
+    assert rounded["Гелиодор"] == round(m[1, 0], 2)
+
+
+def test_summary_counts_leaders():
+    a = scoring.from_dicts({"Рубин": 2})
+    b = scoring.from_dicts({"Сапфир": 4})
+    s = scoring.summary(scoring.stack([a, b, b]))
+    assert s["sessions"] == 3
+    assert s["top1"]["total"]["Сапфир"] == 2
+    assert s["top1"]["total"]["Рубин"] == 1
+    assert scoring.summary(scoring.stack([])) == {"sessions": 0}
@@ -0,0 +1,38 @@
+import scoring
+import session_codec
+
+
+def payload():
+    scores = {p: float(i) * 0.5 for i, p in enumerate(scoring.POTS)}
+    cols = {c: {p: float(i + j) / 3 for i, p in enumerate(scoring.POTS)} for j, c in enumerate(scoring.COLS)}
+    steps = [[[round((i + j + k) * 0.1, 4) for j in range(len(scoring.AXES))] for i in range(len(scoring.POTS))]
+             for k in range(4)]
+    return {
+        "meta": {"session_id": "abc", "name": "Имя"},
+        "answers": [{"step_id": "p1_sphere", "answer": "Смыслы"}],
+        "scores": scores,
+        "col_scores": cols,
+        "scores_by_step": steps,
+        "result": {"p1": "Сапфир"},
+    }
+
+
+def test_compact_round_trip_is_exact():
+    p = payload()
+    data = session_codec.dumps(p, "compact")
+    assert data[:4] == session_codec.MAGIC
+    out = session_codec.loads(data)
+    assert out == p
+    assert list(out) == list(p)
+
+
+def test_unpackable_fields_stay_in_json():
+    p = payload()
+    p["scores"]["Сапфир"] = 1  # int — матрица не упаковывается
+    p["scores_by_step"] = [[1.23456789]]
+    assert session_codec.loads(session_codec.dumps(p)) == p
+
+
+def test_json_encoding_still_readable():
+    p = payload()
+    assert session_codec.loads(session_codec.dumps(p, "json")) == p
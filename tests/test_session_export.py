@@ -0,0 +1,70 @@
+import io
+import gzip
+import json
+
+import pytest
+
+import session_export as se
+from session_store import SessionStore
+
+
+def session(sid, day=1):
+    return {"meta": {"session_id": sid, "timestamp": f"2026-10-{day:02d}T10:00:00", "name": "Имя"},
+            "answers": [{"step_id": "p1_scope_1", "answer": "Смыслы"}],
+            "positions_guess": {"p1": "Сапфир", "p2": None, "p3": None}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = SessionStore(tmp_path / "src")
+    for i in range(3):
+        s.save(session(f"s{i}", i + 1))
+    return s
+
+
+def ndjson(lines) -> io.BytesIO:
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as g:
+        for line in lines:
+            g.write(line if isinstance(line, bytes) else (json.dumps(line, ensure_ascii=False) + "\n").encode())
+    buf.seek(0)
+    return buf
+
+
+@pytest.mark.parametrize("fmt", se.available_formats())
+def test_export_import_round_trip(store, tmp_path, fmt):
+    out = tmp_path / f"x{se.FORMATS[fmt]}"
+    assert se.export(store, out, fmt)["exported"] == 3
+    dst = SessionStore(tmp_path / "dst")
+    res = se.import_sessions(dst, out)
+    assert (res["imported"], res["invalid"]) == (3, 0)
+    assert dst.load("s1") == store.load("s1")
+    assert se.import_sessions(dst, out)["skipped"] == 3
+
+
+def test_import_counts_bad_records_and_goes_on(tmp_path):
+    src = ndjson([
+        session("ok1"),
+        b"{broken\n",
+        b"\xff\xfe not utf-8\n",
+        {"meta": {"session_id": 123}},
+        {"meta": {"session_id": "../escape"}},
+        {"meta": "not a dict"},
+        [1, 2],
+        session("ok2"),
+    ])
+    dst = SessionStore(tmp_path / "dst")
+    res = se.import_sessions(dst, src, "ndjson.gz")
+    assert (res["imported"], res["invalid"]) == (2, 6)
+    assert res["error"].startswith("запись 2")
+    assert not (tmp_path / "escape.neo").exists()
+
+
+def test_valid_sid():
+    assert se.valid_sid("0aab1426-f195-49fc-9f3c-dd7b7987ec6d")
+    for bad in ("", "a/b", "..", "x" * 65, 5, None, "a b"):
+        assert not se.valid_sid(bad)
+
+
+def test_pyarrow_probe_matches_formats():
+    assert ("parquet" in se.available_formats()) == se.pyarrow_available()
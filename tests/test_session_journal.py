@@ -0,0 +1,113 @@
+import os
+import json
+import uuid
+from pathlib import Path
+
+import pytest
+
+from session_journal import SessionJournal
+from session_store import SessionStore
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+def test_read_skips_torn_tail(tmp_path):
+    j = SessionJournal(tmp_path)
+    j.append("s", {"type": "start"})
+    j.append("s", {"type": "step", "answer": "ответ"})
+    with j.path("s").open("a", encoding="utf-8") as f:
+        f.write('{"type": "step", "ans')  # воркер упал посреди записи
+    assert [r["type"] for r in j.read("s")] == ["start", "step"]
+    assert j.read("нет") == []
+
+
+def test_compact_saves_then_discards(tmp_path):
+    j = SessionJournal(tmp_path)
+    j.append("s", {"type": "start"})
+    saved = []
+    out = j.compact("s", saved.append, lambda: {"meta": {"session_id": "s"}})
+    assert saved == [out] and not j.exists("s")
+
+
+def test_compact_keeps_journal_if_save_fails(tmp_path):
+    j = SessionJournal(tmp_path)
+    j.append("s", {"type": "start"})
+
+    def fail(payload):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        j.compact("s", fail, dict)
+    assert j.exists("s")
+
+
+# =========================
+# App.restore_session (?sid= после реконнекта)
+# =========================
+@pytest.fixture(scope="module")
+def app_dir(tmp_path_factory):
+    # App.py читает config.json из cwd: свой конфиг с каталогами во временной папке
+    pytest.importorskip("streamlit.testing.v1")
+    d = tmp_path_factory.mktemp("app")
+    cfg = json.loads((REPO / "config.json").read_text(encoding="utf-8"))
+    cfg["storage"].update({"data_dir": str(d / "sessions"), "journal_dir": str(d / "journal"),
+                           "export_dir": str(d / "exports")})
+    (d / "config.json").write_text(json.dumps(cfg, ensure_ascii=False), encoding="utf-8")
+    (d / "knowledge").symlink_to(REPO / "knowledge")
+    cwd = os.getcwd()
+    os.chdir(d)
+    yield d
+    os.chdir(cwd)
+
+
+def open_app(sid: str):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(str(REPO / "App.py"), default_timeout=60)
+    at.query_params["sid"] = sid
+    at.run()
+    assert not at.exception
+    return at.session_state
+
+
+def test_restore_from_journal(app_dir):
+    sid = str(uuid.uuid4())
+    j = SessionJournal(app_dir / "journal")
+    j.append(sid, {"type": "start", "session_id": sid, "model": "gpt-4.1-mini",
+                   "client": {"name": "Анна", "contact": "@anna", "request": "смена работы"}})
+    j.append(sid, {"type": "question", "step_index": 0, "q": {"question": "Q1?"}, "usage": {"input_tokens": 10}})
+    j.append(sid, {"type": "step", "step_index": 0, "step_id": "p1_scope_1", "question": "Q1?",
+                   "answer": "A1", "timestamp": "t1", "analysis_update": {"scores_delta": {"Рубин": 0.5}},
+                   "next_step_index": 2, "skipped": ["p1_scope_2"]})
+    q2 = {"question": "Q2?", "type": "text", "options": []}
+    j.append(sid, {"type": "question", "step_index": 2, "q": q2, "usage": {"input_tokens": 5}})
+
+    ss = open_app(sid)
+    assert ss["session_id"] == sid and ss["client_name"] == "Анна"
+    assert ss["answers"] == [{"step_id": "p1_scope_1", "question": "Q1?", "answer": "A1", "timestamp": "t1"}]
+    assert (ss["step_index"], ss["q_count"], ss["skipped"]) == (2, 1, ["p1_scope_2"])
+    # последний показанный вопрос не генерируется заново
+    assert ss["current_q"] == q2
+    assert ss["usage"]["input_tokens"] == 15
+    assert len(ss["score_steps"]) == 1
+    assert ss["score_matrix"].sum() > 0
+    assert not ss["done"]
+
+
+def test_restore_finished_session(app_dir):
+    sid = str(uuid.uuid4())
+    SessionStore(app_dir / "sessions").save({
+        "meta": {"session_id": sid, "name": "Борис", "q_count": 2, "usage": {"input_tokens": 7}},
+        "answers": [{"step_id": "p1_scope_1", "question": "Q?", "answer": "A"}] * 2,
+        "positions_guess": {"p1": "Сапфир"},
+        "scores": {"Сапфир": 1.5},
+    })
+    ss = open_app(sid)
+    assert ss["done"] and ss["final_payload"]["meta"]["name"] == "Борис"
+    assert (ss["step_index"], ss["q_count"]) == (2, 2)
+    assert ss["positions"] == {"p1": "Сапфир"}
+    assert ss["score_matrix"][0, 0] == 1.5
+
+
+def test_unknown_sid_starts_fresh(app_dir):
+    ss = open_app("не-uuid")
+    assert ss["session_id"] != "не-uuid" and ss["answers"] == []
@@ -0,0 +1,87 @@
+import sqlite3
+
+import session_store
+from session_store import SessionStore
+
+
+def payload(sid: str, name: str, request: str = "", ts: str = "2025-01-01T10:00:00", q: int = 5,
+            positions: dict = None, report: str = ""):
+    return {
+        "meta": {"session_id": sid, "name": name, "contact": f"@{sid}", "request": request,
+                 "timestamp": ts, "q_count": q},
+        "positions_guess": positions or {},
+        "confidence": {"p1": 0.5},
+        "ai_master_report": report,
+    }
+
+
+def filled(tmp_path):
+    store = SessionStore(tmp_path)
+    store.save(payload("a1", "Анна Иванова", "смена профессии", "2025-01-01T10:00:00", 12,
+                       {"p1": "Рубин", "p2": "Сапфир", "p3": "Цитрин"}, "отчёт"))
+    store.save(payload("b2", "Борис", "выгорание на работе", "2025-01-03T10:00:00", 3))
+    store.save(payload("c3", "Вера 100%_план", "", "2025-01-05T10:00:00", 8))
+    return store
+
+
+def ids(rows):
+    return [r["session_id"] for r in rows]
+
+
+def test_text_search(tmp_path):
+    store = filled(tmp_path)
+    assert ids(store.query("иванов")[0]) == ["a1"]
+    assert ids(store.query("РАБОТ")[0]) == ["b2"]
+    # короткий запрос и спецсимволы LIKE — без FTS, буквально
+    assert ids(store.query("бо")[0]) == ["b2"]
+    assert ids(store.query("100%_")[0]) == ["c3"]
+    assert store.query("нет такого") == ([], 0)
+
+
+def test_filter_sort_page(tmp_path):
+    store = filled(tmp_path)
+    rows, total = store.query(date_from="2025-01-02", limit=1)
+    assert total == 2 and ids(rows) == ["c3"]
+    rows, _ = store.query(sort="q_count", desc=False)
+    assert ids(rows) == ["b2", "c3", "a1"]
+    rows, total = store.query(limit=2, offset=2)
+    assert ids(rows) == ["a1"] and total == 3
+    assert store.select_ids(completed=True) == ["a1"]
+    assert store.select_ids(has_report=False) == ["b2", "c3"]
+
+
+def test_sync_picks_up_changes(tmp_path):
+    store = filled(tmp_path)
+    store.path("b2").unlink()
+    other = SessionStore(tmp_path / "copy")
+    other.save(payload("d4", "Дарья"))
+    (tmp_path / "copy" / "d4.neo").rename(tmp_path / "d4.neo")
+    assert store.sync() == {"added": 1, "updated": 0, "removed": 1}
+    assert ids(store.query("дарья")[0]) == ["d4"]
+    assert store.query("борис")[1] == 0
+    assert store.summary_count() == 3
+
+
+def test_migrates_v1_index(tmp_path):
+    db = tmp_path / "index.sqlite3"
+    conn = sqlite3.connect(db)
+    conn.executescript(session_store._SCHEMA)
+    conn.execute("INSERT INTO sessions (session_id, name, file_mtime) VALUES ('a1', 'old', 1)")
+    conn.execute("PRAGMA user_version=1")
+    conn.commit()
+    conn.close()
+    (tmp_path / "a1.json").write_text(
+        '{"meta": {"session_id": "a1", "name": "Анна", "timestamp": "2025-01-01"}, "confidence": {"p1": 0.9}}',
+        encoding="utf-8",
+    )
+
+    store = SessionStore(tmp_path)
+    conn = store._conn()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == session_store.SCHEMA_VERSION
+    cols = {r["name"] for r in conn.execute("PRAGMA table_info(sessions)")}
+    assert {"conf_avg", "search_text"} <= cols
+    # миграция сбросила file_mtime — sync перечитывает файл и заполняет новые поля
+    assert store.sync()["updated"] == 1
+    assert ids(store.query("анна")[0]) == ["a1"]
+    assert store.summary_count() == 1
+    assert round(store.get_meta("a1")["conf_avg"], 2) == 0.3
@@ -0,0 +1,85 @@
+import re
+import math
+import logging
+from functools import lru_cache
+
+# =========================
+# TOKENIZER (локальный подсчёт токенов)
+# =========================
+# По умолчанию — офлайн-оценка под словарь o200k (gpt-4o / gpt-4.1): текст
+# режется тем же принципом, что и у токенизаторов GPT (слово с ведущим
+# пробелом, числа по 3 цифры, пунктуация, пробелы), и каждый кусок стоит
+# столько токенов, сколько в среднем стоит такой кусок: короткое латинское
+# слово — 1, кириллица — ~4 символа на токен. Если установлен tiktoken и
+# выбран use("tiktoken") — точный счёт (словарь tiktoken должен быть в кэше,
+# иначе откат на оценку).
+
+log = logging.getLogger("neo.tokenizer")
+
+_PIECE_RE = re.compile(
+    r" ?[A-Za-z]+"
+    r"| ?[А-Яа-яЁё]+"
+    r"| ?\d{1,3}"
+    r"| ?[^\sA-Za-zА-Яа-яЁё\d]+"
+    r"|\s+"
+)
+_LATIN_WORD = 8       # латинское слово до стольких букв — один токен
+_LATIN_CHARS = 6      # длиннее — столько символов на токен
+_CYRILLIC_CHARS = 4   # кириллица: символов на токен
+
+_encoder = None
+_name = "heuristic"
+
+
+def use(name: str = "heuristic") -> str:
+    # "heuristic" | "tiktoken"; возвращает то, что реально включилось
+    # (повторный вызов с тем же именем ничего не сбрасывает — App зовёт на каждом rerun)
+    global _encoder, _name
+    if name == _name:
+        return _name
+    encoder, new = None, "heuristic"
+    if name == "tiktoken":
+        try:
+            import tiktoken
+            encoder = tiktoken.get_encoding("o200k_base")
+            new = "tiktoken"
+        except Exception as e:
+            log.warning("tiktoken недоступен (%s) — оценка токенов без него", e)
+    if new != _name:
+        _encoder, _name = encoder, new
+        count_tokens.cache_clear()
+    return _name
+
+
+def name() -> str:
+    return _name
+
+
+def _piece_cost(p: str) -> int:
+    s = p.lstrip(" ") or p
+    c = s[0]
+    if c.isspace():
+        return 1
+    if "a" <= c.lower() <= "z":
+        return 1 if len(s) <= _LATIN_WORD else math.ceil(len(s) / _LATIN_CHARS)
+    if c.isdigit():
+        return 1
+    if c.isalpha():
+        return math.ceil(len(s) / _CYRILLIC_CHARS)
+    if s.isascii():
+        return math.ceil(len(s) / 2)
+    return len(s)  # стрелки, тире, эмодзи — по токену и больше
+
+
+def estimate(text: str) -> int:
+    return sum(_piece_cost(m.group()) for m in _PIECE_RE.finditer(text))
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    # одинаковые строки (ядро базы, фрагменты, инструкции) считаются один раз
+    if not text:
+        return 0
+    if _encoder is not None:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return estimate(text)